@@ -1,39 +1,169 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form, BackgroundTasks
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Request
 from fastapi.responses import FileResponse, JSONResponse
 from fastapi.websockets import WebSocket, WebSocketDisconnect
 from typing import List, Optional
 import os
+import asyncio
 import uuid
-import json
+import time
 import logging
-from pathlib import Path
+import threading
 
 from app.models.schemas import (
-    TrackingRequest, TrackingResponse, TrackingTask, TaskStatus, 
-    UploadResponse, PromptType
+    TrackingResponse, TrackingTask, TaskStatus, 
+    UploadResponse, UploadSession, UploadSessionRequest, PromptType, ImageDetectionResponse
 )
-from app.services.tracking_service import TrackingService
 from app.services.file_handler import FileHandler
+from app.services.task_store import TaskStore
+from app.services.result_cache import ResultCache
+from app.services.job_runner import JobRunner, JobRejectedError
+from app.services.micro_batcher import MicroBatcher
 
 router = APIRouter(prefix="/api", tags=["tracking"])
 
-# Initialize services
-tracking_service = TrackingService()
+# Initialize services. The model stack (torch, SAM2, Grounding DINO) is only imported
+# by get_tracking_service, so in celery mode this process never loads it
 file_handler = FileHandler()
+task_store = TaskStore()
+result_cache = ResultCache(task_store.redis_client)
+job_runner = JobRunner()
 
-@router.post("/upload", response_model=UploadResponse)
-async def upload_video(file: UploadFile = File(...)):
+_tracking_service = None
+_tracking_service_lock = threading.Lock()
+
+def get_tracking_service():
+    """Get the local TrackingService, importing the model stack on first use"""
+    global _tracking_service
+    with _tracking_service_lock:
+        if _tracking_service is None:
+            from app.services.tracking_service import TrackingService
+            _tracking_service = TrackingService(load_models=False)
+        return _tracking_service
+
+def preload_models() -> threading.Thread:
+    """Load models in a daemon thread so the API can serve requests meanwhile"""
+    thread = threading.Thread(
+        target=lambda: get_tracking_service().ensure_models_loaded(),
+        name="model-loader",
+        daemon=True
+    )
+    thread.start()
+    return thread
+
+def model_status() -> str:
+    """Model loading state of this process"""
+    if _tracking_service is None:
+        return "not_loaded"
+    return _tracking_service.model_status
+
+def models_ready() -> bool:
     """
-    Upload a video file for processing
+    Whether this process should receive tracking jobs
+    
+    With PRELOAD_MODELS the models must be loaded and warm. Without it they only
+    load on the first job, so waiting for them would keep the process unready forever.
+    """
+    if file_handler.config.EXECUTION_MODE == "celery" or not file_handler.config.PRELOAD_MODELS:
+        return True
+    return model_status() == "ready"
+
+def run_tracking_job(**job_kwargs):
+    """Run a tracking job in this process (on a JobRunner thread)"""
+    get_tracking_service().start_tracking(**job_kwargs)
+
+def find_cached_task(cache_key: str) -> Optional[TrackingTask]:
+    """
+    Get the task already running or done for identical inputs
+    
+    Failed tasks, in-flight ones without a status update for RESULT_CACHE_STALE_SECONDS
+    and completed ones whose result video is gone are dropped from the cache. A
+    completed result outliving its status record gets the record back.
+    """
+    task_id = result_cache.get(cache_key)
+    if task_id is None:
+        return None
+    
+    task = task_store.get_task_status(task_id)
+    result_exists = os.path.exists(file_handler.get_output_video_path(task_id))
+    if task is None and result_exists:
+        task_store.update_task_status(
+            task_id, TaskStatus.COMPLETED, progress=100,
+            message="Video processing completed successfully!",
+            result_video_url=f"/api/download/{task_id}"
+        )
+        task = task_store.get_task_status(task_id)
+    
+    stale = (
+        task is not None and task.status in (TaskStatus.PENDING, TaskStatus.PROCESSING)
+        and time.time() - (task.updated_at or 0) > file_handler.config.RESULT_CACHE_STALE_SECONDS
+    )
+    if task is None or stale or task.status == TaskStatus.FAILED or (task.status == TaskStatus.COMPLETED and not result_exists):
+        result_cache.invalidate(cache_key)
+        return None
+    return task
+
+def run_detection_batch(requests: List[dict]) -> list:
+    """Run one micro-batch of /detect requests through the local models"""
+    return get_tracking_service().detect_images(requests)
+
+detection_batcher = MicroBatcher(
+    run_detection_batch,
+    max_batch_size=file_handler.config.DETECT_MAX_BATCH_SIZE,
+    max_wait=file_handler.config.DETECT_MAX_WAIT_MS / 1000,
+    max_queue=file_handler.config.DETECT_MAX_QUEUE,
+    name="detect-batch"
+)
+
+def fail_cancelled_job(task_id: str):
+    """Mark a job dropped from the local queue (e.g. at shutdown) as failed"""
+    task_store.update_task_status(
+        task_id, TaskStatus.FAILED, error="Server shutting down; the job was cancelled before it started"
+    )
+
+def submit_tracking_job(**job_kwargs):
+    """Hand a tracking job to the local job runner or the Celery workers"""
+    if file_handler.config.EXECUTION_MODE == "celery":
+        from app.worker import process_video
+        process_video.delay(**job_kwargs)
+    else:
+        task_id = job_kwargs["task_id"]
+        job_runner.submit(run_tracking_job, on_cancelled=lambda: fail_cancelled_job(task_id), **job_kwargs)
+
+UPLOAD_REQUEST_BODY = {
+    "content": {
+        "multipart/form-data": {
+            "schema": {
+                "type": "object",
+                "properties": {"file": {"type": "string", "format": "binary"}},
+                "required": ["file"]
+            }
+        }
+    },
+    "required": True
+}
+
+@router.post("/upload", response_model=UploadResponse, openapi_extra={"requestBody": UPLOAD_REQUEST_BODY})
+async def upload_video(request: Request):
+    """
+    Upload a video file for processing (multipart form field "file")
+    
+    The form is parsed inside the handler rather than declared as a parameter, so
+    an oversized Content-Length is rejected before the body is received.
     """
     try:
-        file_id, file_path = await file_handler.save_upload_file(file)
+        file_handler.check_upload_length(request.headers.get("content-length"))
+        async with request.form() as form:
+            file = form.get("file")
+            if file is None or isinstance(file, str):
+                raise HTTPException(status_code=400, detail="file is required")
+            file_id, file_path, sha256 = await file_handler.save_upload_file(file)
         
         return UploadResponse(
             success=True,
             message="File uploaded successfully",
             file_id=file_id,
-            filename=file.filename
+            filename=file.filename,
+            sha256=sha256
         )
     
     except HTTPException as e:
@@ -42,45 +172,129 @@ async def upload_video(file: UploadFile = File(...)):
         logging.error(f"Upload error: {e}")
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
+@router.post("/uploads", response_model=UploadSession)
+async def create_upload_session(request: UploadSessionRequest):
+    """
+    Start a resumable upload; send the chunks with PUT /uploads/{upload_id}/chunks/{index}
+    """
+    return file_handler.create_upload_session(request.filename, request.total_size, request.chunk_size)
+
+@router.get("/uploads/{upload_id}", response_model=UploadSession)
+async def get_upload_session(upload_id: str):
+    """
+    Get the chunks received so far, e.g. to resume an interrupted upload
+    """
+    return file_handler.get_upload_session(upload_id)
+
+@router.put("/uploads/{upload_id}/chunks/{index}", response_model=UploadSession)
+async def upload_chunk(upload_id: str, index: int, request: Request):
+    """
+    Store one chunk; the raw request body is the chunk's bytes
+    """
+    return await file_handler.save_upload_chunk(upload_id, index, request.stream())
+
+@router.post("/uploads/{upload_id}/complete", response_model=UploadResponse)
+async def complete_upload(upload_id: str):
+    """
+    Assemble all chunks into a video that /track accepts by file_id
+    """
+    try:
+        session = file_handler.get_upload_session(upload_id)
+        file_id, file_path, sha256 = await file_handler.complete_upload_session(upload_id)
+        
+        return UploadResponse(
+            success=True,
+            message="File uploaded successfully",
+            file_id=file_id,
+            filename=session["filename"],
+            sha256=sha256
+        )
+    
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logging.error(f"Upload error: {e}")
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+
+@router.delete("/uploads/{upload_id}")
+async def abort_upload(upload_id: str):
+    """
+    Discard an upload session and its chunks
+    """
+    file_handler.abort_upload_session(upload_id)
+    return {"message": f"Upload {upload_id} aborted"}
+
 @router.post("/track", response_model=TrackingResponse)
 async def start_tracking(
-    background_tasks: BackgroundTasks,
     file_id: str = Form(...),
-    text_prompt: str = Form(...),
+    text_prompt: Optional[str] = Form(None),
+    text_prompts: Optional[List[str]] = Form(None),
     prompt_type: PromptType = Form(PromptType.BOX),
     box_threshold: Optional[float] = Form(0.35),
     text_threshold: Optional[float] = Form(0.25)
 ):
     """
     Start video tracking task
+    
+    Send text_prompts (repeated form field) instead of text_prompt to track several
+    independent queries in one pass; each gets its own result video besides the
+    combined one. A single entry in text_prompts is a plain text_prompt job and
+    produces only the combined video.
     """
     try:
-        # Generate task ID
-        task_id = str(uuid.uuid4())
+        prompts = [prompt for prompt in (text_prompts or []) if prompt.strip()]
+        if not prompts and not (text_prompt and text_prompt.strip()):
+            raise HTTPException(status_code=400, detail="text_prompt or text_prompts is required")
+        if len(prompts) == 1:
+            text_prompt, prompts = prompts[0], []
         
         # Get video file path
-        video_files = list(Path(file_handler.config.UPLOAD_FOLDER).glob(f"{file_id}.*"))
-        if not video_files:
+        video_path = file_handler.find_upload(file_id)
+        if video_path is None:
             raise HTTPException(status_code=404, detail="Video file not found")
         
-        video_path = str(video_files[0])
+        # Identical requests share one task
+        cache_key = None
+        if file_handler.config.RESULT_CACHE_ENABLED:
+            cache_key = result_cache.make_key(
+                file_id, prompts or text_prompt, box_threshold, text_threshold,
+                file_handler.config.PROMPT_TYPE_FOR_VIDEO
+            )
+            cached_task = find_cached_task(cache_key)
+            if cached_task is not None:
+                logging.info(f"Result cache hit for task {cached_task.task_id}")
+                return TrackingResponse(
+                    task_id=cached_task.task_id,
+                    status=cached_task.status,
+                    video_url=cached_task.result_video_url
+                )
         
-        # Start tracking task in background
-        background_tasks.add_task(
-            tracking_service.start_tracking,
-            task_id=task_id,
-            video_path=video_path,
-            text_prompt=text_prompt,
-            box_threshold=box_threshold,
-            text_threshold=text_threshold
-        )
+        # Generate task ID
+        task_id = str(uuid.uuid4())
         
-        # Initialize task status
-        tracking_service.update_task_status(
+        # Initialize task status before a worker can pick the job up
+        task_store.update_task_status(
             task_id, TaskStatus.PENDING, progress=0, 
             message="Task queued for processing"
         )
         
+        # Run the pipeline off the event loop
+        try:
+            submit_tracking_job(
+                task_id=task_id,
+                video_path=video_path,
+                text_prompt=text_prompt,
+                box_threshold=box_threshold,
+                text_threshold=text_threshold,
+                text_prompts=prompts or None
+            )
+        except JobRejectedError as e:
+            task_store.update_task_status(task_id, TaskStatus.FAILED, error=str(e))
+            raise HTTPException(status_code=503, detail=str(e))
+        
+        if cache_key is not None:
+            result_cache.put(cache_key, task_id)
+        
         return TrackingResponse(
             task_id=task_id,
             status=TaskStatus.PENDING
@@ -92,37 +306,83 @@ async def start_tracking(
         logging.error(f"Tracking error: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to start tracking: {str(e)}")
 
+@router.post("/detect", response_model=ImageDetectionResponse)
+async def detect_image(
+    file: UploadFile = File(...),
+    text_prompt: str = Form(...),
+    box_threshold: float = Form(0.35),
+    text_threshold: float = Form(0.25),
+    include_masks: bool = Form(False)
+):
+    """
+    Detect and segment objects in a single image
+    
+    Concurrent requests are grouped into micro-batches that run through Grounding
+    DINO and SAM2 together; the response returns when this image's batch is done.
+    """
+    if file_handler.config.EXECUTION_MODE != "local":
+        raise HTTPException(status_code=503, detail="Image detection is only served in local execution mode")
+    if not text_prompt.strip():
+        raise HTTPException(status_code=400, detail="text_prompt is required")
+    
+    image = await file.read(file_handler.config.MAX_IMAGE_SIZE + 1)
+    if len(image) > file_handler.config.MAX_IMAGE_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Image too large. Maximum size: {file_handler.config.MAX_IMAGE_SIZE / (1024*1024):.1f}MB"
+        )
+    
+    try:
+        return await detection_batcher.submit({
+            "image": image,
+            "text_prompt": text_prompt,
+            "box_threshold": box_threshold,
+            "text_threshold": text_threshold,
+            "include_masks": include_masks
+        })
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Detection queue is full")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logging.error(f"Detection error: {e}")
+        raise HTTPException(status_code=500, detail=f"Detection failed: {str(e)}")
+
 @router.get("/status/{task_id}", response_model=TrackingTask)
 async def get_task_status(task_id: str):
     """
     Get the status of a tracking task
     """
-    task = tracking_service.get_task_status(task_id)
+    task = task_store.get_task_status(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
     return task
 
 @router.get("/download/{task_id}")
-async def download_result(task_id: str):
+async def download_result(task_id: str, prompt: Optional[int] = None):
     """
     Download the processed video result
+    
+    For multi-prompt tasks, prompt selects the video of one prompt (by position);
+    without it the video shows the objects of all prompts.
     """
-    task = tracking_service.get_task_status(task_id)
+    task = task_store.get_task_status(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
     if task.status != TaskStatus.COMPLETED:
         raise HTTPException(status_code=400, detail="Task not completed")
     
-    video_path = file_handler.get_output_video_path(task_id)
+    video_path = file_handler.get_output_video_path(task_id, prompt)
     if not os.path.exists(video_path):
         raise HTTPException(status_code=404, detail="Result video not found")
     
+    suffix = "" if prompt is None else f"_{prompt}"
     return FileResponse(
         video_path,
         media_type="video/mp4",
-        filename=f"tracked_video_{task_id}.mp4"
+        filename=f"tracked_video_{task_id}{suffix}.mp4"
     )
 
 @router.websocket("/ws/{task_id}")
@@ -134,7 +394,7 @@ async def websocket_endpoint(websocket: WebSocket, task_id: str):
     
     try:
         while True:
-            task = tracking_service.get_task_status(task_id)
+            task = task_store.get_task_status(task_id)
             if task:
                 await websocket.send_text(task.json())
                 
@@ -158,15 +418,44 @@ async def health_check():
     """
     Health check endpoint
     """
-    return {"status": "healthy", "models_loaded": tracking_service.models_loaded}
+    return {
+        "status": "healthy",
+        "ready": models_ready(),
+        "execution_mode": file_handler.config.EXECUTION_MODE,
+        "models_loaded": model_status() == "ready",
+        "model_status": model_status(),
+        "jobs": job_runner.stats(),
+        "detect": detection_batcher.stats()
+    }
+
+@router.get("/health/live")
+async def liveness_check():
+    """
+    Liveness probe: the API process is up and serving requests
+    """
+    return {"status": "alive"}
+
+@router.get("/health/ready")
+async def readiness_check():
+    """
+    Readiness probe: 503 until the models are loaded and warmed up (with PRELOAD_MODELS)
+    """
+    if not models_ready():
+        return JSONResponse(
+            status_code=503,
+            content={"status": "not_ready", "model_status": model_status()}
+        )
+    return {"status": "ready", "model_status": model_status()}
 
 @router.delete("/cleanup/{task_id}")
-async def cleanup_task(task_id: str):
+async def cleanup_task(task_id: str, file_id: Optional[str] = None):
     """
     Clean up temporary files for a task
+    
+    Pass the task's file_id to also drop the decoded frames cached for that upload.
     """
     try:
-        file_handler.cleanup_temp_files(task_id)
+        file_handler.cleanup_temp_files(task_id, file_id)
         return {"message": f"Cleanup completed for task {task_id}"}
     except Exception as e:
         logging.error(f"Cleanup error for task {task_id}: {e}")
@@ -1,7 +1,22 @@
 import os
-import torch
 from pathlib import Path
 
+class _DefaultDevice:
+    """
+    Resolves Config.DEVICE on first access
+
+    Importing torch only to pick a device would pull the whole model stack into
+    processes that never run a model (e.g. an API that hands jobs to Celery).
+    """
+
+    def __get__(self, instance, owner):
+        device = os.getenv("DEVICE")
+        if not device:
+            import torch
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        owner.DEVICE = device
+        return device
+
 class Config:
     # API Configuration
     API_HOST = os.getenv("API_HOST", "0.0.0.0")
@@ -33,7 +48,7 @@ class Config:
     BOX_THRESHOLD = float(os.getenv("BOX_THRESHOLD", 0.35))
     TEXT_THRESHOLD = float(os.getenv("TEXT_THRESHOLD", 0.25))
     # Allow CUDA if available, but our patches will handle _C fallbacks
-    DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+    DEVICE = _DefaultDevice()  # "cuda" if available, else "cpu"; override with the DEVICE env var
     SAM2_CHECKPOINT = os.getenv("SAM2_CHECKPOINT", "./checkpoints/sam2.1_hiera_large.pt")
     MODEL_CFG = os.getenv("MODEL_CFG", "configs/sam2.1/sam2.1_hiera_l.yaml")
     
@@ -43,21 +58,115 @@ class Config:
     TEMP_FRAMES_DIR = os.getenv("TEMP_FRAMES_DIR", "./temp_frames")
     TRACKING_RESULTS_DIR = os.getenv("TRACKING_RESULTS_DIR", "./tracking_results")
     MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE", 100 * 1024 * 1024))  # 100MB
+    UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))  # Bytes read per step while streaming uploads to disk
+    # Resumable uploads (/api/uploads): session state and received chunks, shared by API replicas
+    UPLOAD_SESSIONS_DIR = os.getenv("UPLOAD_SESSIONS_DIR", "./upload_sessions")
+    UPLOAD_SESSION_CHUNK_SIZE = int(os.getenv("UPLOAD_SESSION_CHUNK_SIZE", 8 * 1024 * 1024))  # Default chunk size
+    MAX_UPLOAD_CHUNK_SIZE = int(os.getenv("MAX_UPLOAD_CHUNK_SIZE", 64 * 1024 * 1024))  # Largest chunk a client may choose
     ALLOWED_EXTENSIONS = {"mp4", "avi", "mov", "mkv", "webm"}
     
     # Video Processing Configuration
     PROMPT_TYPE_FOR_VIDEO = os.getenv("PROMPT_TYPE_FOR_VIDEO", "box")  # ["point", "box", "mask"]
+    # Where decoded frames live for SAM2, detection and annotation: "mmap" keeps one raw
+    # memory-mapped array, "memory" keeps frames in RAM, "jpeg" dumps every frame as JPEG.
+    # mmap and jpeg frames are cached in TEMP_FRAMES_DIR/videos/<file_id> and shared by all
+    # tasks on the same upload. Raw mmap frames take ~6MB per 1080p frame, so mmap is opt-in
+    # and videos whose raw frames exceed FRAME_CACHE_MAX_BYTES are kept in memory instead
+    FRAME_SOURCE = os.getenv("FRAME_SOURCE", "memory")  # ["memory", "mmap", "jpeg"]
+    # Frame caches are evicted least recently used first beyond FRAME_CACHE_MAX_BYTES (0 keeps
+    # everything); caches used within FRAME_CACHE_GRACE_SECONDS are never evicted, since a
+    # running task may still read them
+    FRAME_CACHE_MAX_BYTES = int(os.getenv("FRAME_CACHE_MAX_BYTES", 20 * 1024 ** 3))
+    FRAME_CACHE_GRACE_SECONDS = int(os.getenv("FRAME_CACHE_GRACE_SECONDS", 3600))
+    # Debug: also dump every annotated frame as JPEG to TRACKING_RESULTS_DIR
+    SAVE_ANNOTATED_FRAMES = os.getenv("SAVE_ANNOTATED_FRAMES", "False").lower() == "true"
+    # Parallel annotation of output frames (1 renders in the pipeline thread)
+    RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", os.cpu_count() or 1))
+    RENDER_BACKEND = os.getenv("RENDER_BACKEND", "thread")  # ["thread", "process"]
+    # Render/encode concurrently with SAM2 propagation; the queue depth bounds buffered frames
+    PIPELINED_RENDER = os.getenv("PIPELINED_RENDER", "True").lower() == "true"
+    PIPELINE_QUEUE_DEPTH = int(os.getenv("PIPELINE_QUEUE_DEPTH", 16))
+    # Keep run-length encoded track masks on disk (TRACKING_RESULTS_DIR) instead of RAM
+    MASK_STORE_SPILL = os.getenv("MASK_STORE_SPILL", "False").lower() == "true"
+    # Reuse SAM2 image-encoder features of frames already seen by an earlier job on the same
+    # video: "memory" keeps them in RAM, "disk" in FEATURE_CACHE_DIR (survives restarts,
+    # shared by workers); least recently used frames are evicted beyond FEATURE_CACHE_MAX_BYTES
+    FEATURE_CACHE = os.getenv("FEATURE_CACHE", "off")  # ["off", "memory", "disk"]
+    FEATURE_CACHE_MAX_BYTES = int(os.getenv("FEATURE_CACHE_MAX_BYTES", 4 * 1024 ** 3))
+    FEATURE_CACHE_DIR = os.getenv("FEATURE_CACHE_DIR", "./feature_cache")
+    # Grounding DINO text-encoder outputs per caption, reused across jobs (0 disables)
+    TEXT_FEATURE_CACHE_MAX_BYTES = int(os.getenv("TEXT_FEATURE_CACHE_MAX_BYTES", 64 * 1024 ** 2))
+    # SAM2 image embeddings per image content for single-image segmentation. Entries stay on the
+    # GPU and /api/detect traffic is mostly unique images, so it is off by default (0 disables);
+    # enable it when the same images are segmented repeatedly
+    IMAGE_EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("IMAGE_EMBEDDING_CACHE_MAX_BYTES", 0))
+    
+    # Keyframe Detection Configuration
+    # Besides the first frame, detect on every KEYFRAME_INTERVAL-th frame (0 disables) and,
+    # with KEYFRAME_SCENE_THRESHOLD > 0, on the first frame of every scene (mean absolute
+    # difference of coarse grayscale thumbnails, 0-255). Keyframe detections run through
+    # Grounding DINO KEYFRAME_BATCH_SIZE at a time; those overlapping no tracked object by
+    # KEYFRAME_IOU_THRESHOLD or more start new tracks
+    KEYFRAME_INTERVAL = int(os.getenv("KEYFRAME_INTERVAL", 0))
+    KEYFRAME_SCENE_THRESHOLD = float(os.getenv("KEYFRAME_SCENE_THRESHOLD", 0))
+    KEYFRAME_BATCH_SIZE = int(os.getenv("KEYFRAME_BATCH_SIZE", 8))
+    KEYFRAME_IOU_THRESHOLD = float(os.getenv("KEYFRAME_IOU_THRESHOLD", 0.5))
+    
+    # Image Detection Configuration (/api/detect, local execution mode)
+    # Concurrent requests are run as one batch of up to DETECT_MAX_BATCH_SIZE images; a
+    # request waits at most DETECT_MAX_WAIT_MS for others to join
+    DETECT_MAX_BATCH_SIZE = int(os.getenv("DETECT_MAX_BATCH_SIZE", 8))
+    DETECT_MAX_WAIT_MS = float(os.getenv("DETECT_MAX_WAIT_MS", 10))
+    DETECT_MAX_QUEUE = int(os.getenv("DETECT_MAX_QUEUE", 256))  # Waiting images before /api/detect returns 503
+    MAX_IMAGE_SIZE = int(os.getenv("MAX_IMAGE_SIZE", 20 * 1024 * 1024))  # 20MB
+    
+    # Model Loading Configuration
+    # Load models in the background as soon as the API starts and report ready once they are warm;
+    # otherwise the first job loads them and the readiness probe does not wait for them
+    PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "True").lower() == "true"
+    # Run one small inference after loading so the first job does not pay for lazy initialization
+    MODEL_WARMUP = os.getenv("MODEL_WARMUP", "True").lower() == "true"
+    
+    # Job Execution Configuration
+    # "local" runs jobs in this process, "celery" enqueues them for app.worker processes
+    EXECUTION_MODE = os.getenv("EXECUTION_MODE", "local")  # ["local", "celery"]
+    MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", 1))  # Pipelines running at once
+    MAX_QUEUED_JOBS = int(os.getenv("MAX_QUEUED_JOBS", 16))  # Jobs waiting (FIFO) before /api/track returns 503
+    # Serialize model forward passes of concurrent jobs (decode, render and encode still overlap);
+    # disable to let jobs share the models freely, e.g. on CPU with per-job thread budgets
+    MODEL_CALL_LOCK = os.getenv("MODEL_CALL_LOCK", "True").lower() == "true"
+    # Intra-op CPU threads per job, by default the cores split evenly between concurrent jobs
+    JOB_THREADS = int(os.getenv("JOB_THREADS", max(1, (os.cpu_count() or 1) // max(1, MAX_CONCURRENT_JOBS))))
     
     # Redis Configuration
     REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
     REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
     REDIS_DB = int(os.getenv("REDIS_DB", 0))
     
+    TASK_STATUS_TTL = int(os.getenv("TASK_STATUS_TTL", 3600))  # Seconds a task status record is kept
+    
+    # Result Cache Configuration
+    # Identical /api/track requests (same video, prompt, thresholds, prompt type and models)
+    # return the task that already produced the result instead of running again
+    RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "True").lower() == "true"
+    RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", 24 * 3600))  # Seconds since last hit
+    RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", 1000))  # LRU beyond this
+    # A pending or processing task without a status update for this long is presumed dead
+    # (e.g. its worker crashed) and no longer handed out to identical requests
+    RESULT_CACHE_STALE_SECONDS = int(os.getenv("RESULT_CACHE_STALE_SECONDS", 1800))
+    # Explicit model version for cache keys; by default derived from the checkpoint files
+    MODEL_VERSION = os.getenv("MODEL_VERSION", "")
+    
+    # Celery Configuration (EXECUTION_MODE=celery)
+    CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", f"redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}")
+    CELERY_QUEUE = os.getenv("CELERY_QUEUE", "tracking")
+    CELERY_TASK_ALWAYS_EAGER = os.getenv("CELERY_TASK_ALWAYS_EAGER", "False").lower() == "true"  # Run inline, for tests
+    
     # CORS Configuration
     CORS_ORIGINS = os.getenv("CORS_ORIGINS", "http://localhost:3000").split(",")
     
     @classmethod
     def create_directories(cls):
         """Create necessary directories if they don't exist"""
-        for directory in [cls.UPLOAD_FOLDER, cls.OUTPUT_FOLDER, cls.TEMP_FRAMES_DIR, cls.TRACKING_RESULTS_DIR]:
+        for directory in [cls.UPLOAD_FOLDER, cls.UPLOAD_SESSIONS_DIR, cls.OUTPUT_FOLDER, cls.TEMP_FRAMES_DIR, cls.TRACKING_RESULTS_DIR]:
             Path(directory).mkdir(parents=True, exist_ok=True)
\ No newline at end of file
@@ -7,7 +7,7 @@ import os
 from pathlib import Path
 
 from app.config import Config
-from app.api.tracking import router as tracking_router
+from app.api.tracking import router as tracking_router, job_runner, detection_batcher, preload_models
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -47,6 +47,18 @@ if frontend_path.exists():
 # Include API routers
 app.include_router(tracking_router)
 
+@app.on_event("startup")
+async def startup():
+    """Start loading models without blocking the server from binding its port"""
+    if config.EXECUTION_MODE == "local" and config.PRELOAD_MODELS:
+        preload_models()
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Stop accepting tracking jobs and drop queued ones; running jobs finish"""
+    job_runner.shutdown(wait=False)
+    detection_batcher.shutdown()
+
 @app.get("/")
 async def root():
     """Root endpoint with API information"""
@@ -57,7 +69,9 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "upload": "/api/upload",
+            "resumable_upload": "/api/uploads",
             "track": "/api/track",
+            "detect": "/api/detect",
             "status": "/api/status/{task_id}",
             "download": "/api/download/{task_id}",
             "docs": "/api/docs"
@@ -74,7 +88,8 @@ async def get_api_info():
     """Get API information and system status"""
     return {
         "api_version": "1.0.0",
-        "device": config.DEVICE,
+        # Resolving the device imports torch; in celery mode the API never does
+        "device": config.DEVICE if config.EXECUTION_MODE == "local" else None,
         "max_file_size_mb": config.MAX_FILE_SIZE / (1024 * 1024),
         "supported_formats": list(config.ALLOWED_EXTENSIONS),
         "model_config": {
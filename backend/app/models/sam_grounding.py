@@ -6,11 +6,16 @@ and integration classes for Grounding DINO and SAM-2 models.
 """
 
 import torch
+import threading
 import numpy as np
-from typing import List, Optional, Dict, Tuple
+from typing import List, Optional, Dict, Tuple, Union
 from pydantic import BaseModel, Field
 import logging
 
+from app.config import Config
+from app.utils.feature_cache import SAM2ImageEmbeddingCache
+from app.utils.text_feature_cache import GroundingTextCache
+
 logger = logging.getLogger(__name__)
 
 # Pydantic Models for API
@@ -32,7 +37,7 @@ class DetectionResult(BaseModel):
 class VideoProcessingRequest(BaseModel):
     video_path: str = Field(..., description="Path to input video file")
     text_prompt: str = Field(..., description="Text description of objects to detect")
-    prompt_type: str = Field("box", regex="^(point|box|mask)$", description="Type of prompt for SAM-2")
+    prompt_type: str = Field("box", pattern="^(point|box|mask)$", description="Type of prompt for SAM-2")
     box_threshold: float = Field(0.35, ge=0, le=1, description="Detection confidence threshold")
     text_threshold: float = Field(0.25, ge=0, le=1, description="Text matching threshold")
 
@@ -49,11 +54,29 @@ class SAMGroundingModel:
     for text-prompted object detection and segmentation.
     """
     
-    def __init__(self, grounding_model, sam_model, device: str = "cuda"):
+    def __init__(self, grounding_model, sam_model, device: str = "cuda",
+                 text_feature_cache_bytes: Optional[int] = None,
+                 image_embedding_cache_bytes: Optional[int] = None):
         self.grounding_model = grounding_model
         self.sam_model = sam_model
         self.device = device
         
+        # Built on first use and kept; the lock covers its per-image state
+        self.image_predictor = None
+        self._predictor_lock = threading.Lock()
+        if image_embedding_cache_bytes is None:
+            image_embedding_cache_bytes = Config.IMAGE_EMBEDDING_CACHE_MAX_BYTES
+        self.image_embedding_cache = None
+        if image_embedding_cache_bytes > 0:
+            self.image_embedding_cache = SAM2ImageEmbeddingCache(image_embedding_cache_bytes)
+        
+        # Prompts repeat across calls, so Grounding DINO's text branch is cached
+        if text_feature_cache_bytes is None:
+            text_feature_cache_bytes = Config.TEXT_FEATURE_CACHE_MAX_BYTES
+        self.text_feature_cache = None
+        if text_feature_cache_bytes > 0 and hasattr(grounding_model, "bert"):
+            self.text_feature_cache = GroundingTextCache.attach(grounding_model, text_feature_cache_bytes)
+        
     def detect_and_segment(self, 
                           image: np.ndarray,
                           text_prompt: str,
@@ -72,54 +95,7 @@ class SAMGroundingModel:
             Dictionary containing detection results with boxes, masks, and labels
         """
         try:
-            # Import here to avoid circular imports
-            from grounding_dino.groundingdino.util.inference import predict
-            from torchvision.ops import box_convert
-            
-            # Get detections from Grounding DINO
-            boxes, confidences, labels = predict(
-                model=self.grounding_model,
-                image=image,
-                caption=text_prompt,
-                box_threshold=box_threshold,
-                text_threshold=text_threshold,
-            )
-            
-            if len(boxes) == 0:
-                return {
-                    "boxes": [],
-                    "masks": [],
-                    "labels": [],
-                    "confidences": []
-                }
-            
-            # Convert boxes to correct format
-            h, w = image.shape[:2]
-            boxes = boxes * torch.Tensor([w, h, w, h])
-            input_boxes = box_convert(boxes=boxes, in_fmt="cxcywh", out_fmt="xyxy").numpy()
-            
-            # Get masks from SAM-2
-            from sam2.sam2_image_predictor import SAM2ImagePredictor
-            image_predictor = SAM2ImagePredictor(self.sam_model)
-            image_predictor.set_image(image)
-            
-            masks, scores, logits = image_predictor.predict(
-                point_coords=None,
-                point_labels=None,
-                box=input_boxes,
-                multimask_output=False,
-            )
-            
-            if masks.ndim == 4:
-                masks = masks.squeeze(1)
-            
-            return {
-                "boxes": input_boxes,
-                "masks": masks,
-                "labels": labels,
-                "confidences": confidences.numpy()
-            }
-            
+            return self.detect_and_segment_batch([image], [text_prompt], box_threshold, text_threshold)[0]
         except Exception as e:
             logger.error(f"Error in detect_and_segment: {e}")
             return {
@@ -129,6 +105,114 @@ class SAMGroundingModel:
                 "confidences": []
             }
     
+    def detect_and_segment_batch(self,
+                                 images: List[np.ndarray],
+                                 text_prompts: List[str],
+                                 box_threshold: Union[float, List[float]] = 0.35,
+                                 text_threshold: Union[float, List[float]] = 0.25) -> List[Dict]:
+        """
+        Detect and segment several images with one batched forward pass per model
+        
+        Grounding DINO runs once over the padded batch of images (each with its own
+        caption), and the SAM2 image encoder once over the images that have
+        detections and no cached embedding.
+        
+        Args:
+            images: RGB uint8 image arrays, possibly of different sizes
+            text_prompts: Text prompt of each image
+            box_threshold: Detection confidence threshold, for all images or per image
+            text_threshold: Text matching threshold, for all images or per image
+            
+        Returns:
+            One detect_and_segment result dictionary per image
+        """
+        count = len(images)
+        box_thresholds = box_threshold if isinstance(box_threshold, (list, tuple)) else [box_threshold] * count
+        text_thresholds = text_threshold if isinstance(text_threshold, (list, tuple)) else [text_threshold] * count
+        
+        detections = self.detect_batch(images, text_prompts, box_thresholds, text_thresholds)
+        results = [
+            {"boxes": boxes, "masks": [], "labels": labels, "confidences": confidences}
+            for boxes, confidences, labels in detections
+        ]
+        
+        # Get masks from SAM-2, reusing embeddings of images seen before
+        segment = [i for i, (boxes, _, _) in enumerate(detections) if len(boxes)]
+        if not segment:
+            return results
+        with self._predictor_lock:
+            image_predictor = self._get_image_predictor()
+            if self.image_embedding_cache is not None:
+                self.image_embedding_cache.set_image_batch(image_predictor, [images[i] for i in segment])
+            else:
+                image_predictor.set_image_batch([images[i] for i in segment])
+            masks_batch, scores_batch, logits_batch = image_predictor.predict_batch(
+                box_batch=[detections[i][0] for i in segment],
+                multimask_output=False,
+            )
+        
+        for i, masks in zip(segment, masks_batch):
+            if masks.ndim == 4:
+                masks = masks.squeeze(1)
+            results[i]["masks"] = masks
+        return results
+    
+    def detect_batch(self, images: List[np.ndarray], text_prompts: List[str],
+                     box_thresholds: List[float], text_thresholds: List[float]) -> List[Tuple]:
+        """
+        Grounding DINO over a batch of images, post-processed per image as in predict()
+        
+        Returns:
+            (xyxy pixel boxes, confidences, labels) per image
+        """
+        # Import here to avoid circular imports
+        from PIL import Image
+        from torchvision.ops import box_convert
+        import grounding_dino.groundingdino.datasets.transforms as T
+        from grounding_dino.groundingdino.util.inference import preprocess_caption
+        from grounding_dino.groundingdino.util.utils import get_phrases_from_posmap
+        
+        transform = T.Compose([
+            T.RandomResize([800], max_size=1333),
+            T.ToTensor(),
+            T.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]),
+        ])
+        tensors = [transform(Image.fromarray(image), None)[0].to(self.device) for image in images]
+        captions = [preprocess_caption(caption=text_prompt) for text_prompt in text_prompts]
+        
+        # A list of differently sized images is padded into one masked batch
+        with torch.no_grad():
+            outputs = self.grounding_model(tensors, captions=captions)
+        logits_batch = outputs["pred_logits"].cpu().sigmoid()
+        boxes_batch = outputs["pred_boxes"].cpu()
+        
+        tokenizer = self.grounding_model.tokenizer
+        detections = []
+        for image, caption, logits, boxes, box_threshold, text_threshold in zip(
+            images, captions, logits_batch, boxes_batch, box_thresholds, text_thresholds
+        ):
+            keep = logits.max(dim=1)[0] > box_threshold
+            logits, boxes = logits[keep], boxes[keep]
+            tokenized = tokenizer(caption)
+            labels = [
+                get_phrases_from_posmap(logit > text_threshold, tokenized, tokenizer).replace(".", "")
+                for logit in logits
+            ]
+            
+            # Convert boxes to correct format
+            h, w = image.shape[:2]
+            boxes = boxes * torch.Tensor([w, h, w, h])
+            input_boxes = box_convert(boxes=boxes, in_fmt="cxcywh", out_fmt="xyxy").numpy()
+            detections.append((input_boxes, logits.max(dim=1)[0].numpy(), labels))
+        return detections
+    
+    def _get_image_predictor(self):
+        """The SAM2 image predictor, built on first use"""
+        if self.image_predictor is None:
+            from sam2.sam2_image_predictor import SAM2ImagePredictor
+            self.image_predictor = SAM2ImagePredictor(self.sam_model)
+        return self.image_predictor
+    
     def prepare_for_tracking(self, detection_results: Dict, frame_idx: int = 0) -> Dict:
         """
         Prepare detection results for video tracking with SAM-2
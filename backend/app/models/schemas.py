@@ -26,12 +26,15 @@ class TrackingTask(BaseModel):
     message: Optional[str] = None
     result_video_url: Optional[str] = None
     error: Optional[str] = None
+    updated_at: Optional[float] = None  # Unix time of the last status update
 
 class DetectionResult(BaseModel):
     object_id: int
     label: str
     confidence: float
     bbox: List[float]  # [x1, y1, x2, y2]
+    prompt_index: int = 0  # Which prompt of a multi-prompt task found the object
+    frame_idx: int = 0  # Frame the object was first detected on
 
 class TrackingResponse(BaseModel):
     task_id: str
@@ -45,3 +48,32 @@ class UploadResponse(BaseModel):
     message: str
     file_id: Optional[str] = None
     filename: Optional[str] = None
+    sha256: Optional[str] = None
+
+class UploadSessionRequest(BaseModel):
+    filename: str = Field(..., description="Original file name; its extension must be allowed")
+    total_size: int = Field(..., description="Size of the whole file in bytes")
+    chunk_size: Optional[int] = Field(None, description="Bytes per chunk; the last chunk may be shorter")
+
+class UploadSession(BaseModel):
+    upload_id: str
+    filename: str
+    total_size: int
+    chunk_size: int
+    total_chunks: int
+    received_chunks: List[int] = Field(default_factory=list, description="Indices of stored chunks")
+    received_bytes: int = 0
+
+class ImageDetection(BaseModel):
+    label: str
+    confidence: float
+    bbox: List[float]  # [x1, y1, x2, y2]
+    area: int  # Mask pixels
+    mask_rle: Optional[List[List[int]]] = Field(
+        None, description="[start, end) runs of mask pixels over the row-major flattened image"
+    )
+
+class ImageDetectionResponse(BaseModel):
+    width: int
+    height: int
+    detections: List[ImageDetection] = Field(default_factory=list)
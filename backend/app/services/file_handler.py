@@ -1,47 +1,243 @@
 import os
+import glob
+import json
+import time
 import uuid
+import hashlib
 import aiofiles
 from pathlib import Path
-from typing import Tuple, Optional
+from typing import AsyncIterator, Dict, Iterable, Tuple, Optional
 from fastapi import UploadFile, HTTPException
 from app.config import Config
 
 class FileHandler:
+    # Room for multipart boundaries and part headers around an uploaded file
+    MULTIPART_OVERHEAD = 64 * 1024
+    
     def __init__(self):
         self.config = Config()
         self.config.create_directories()
     
-    async def save_upload_file(self, upload_file: UploadFile) -> Tuple[str, str]:
+    async def save_upload_file(self, upload_file: UploadFile) -> Tuple[str, str, str]:
         """
-        Save uploaded file and return file_id and file_path
+        Copy an uploaded file from the parsed form to UPLOAD_FOLDER in fixed-size chunks
+        
+        Memory use is one chunk regardless of the file size, and a file over
+        MAX_FILE_SIZE is discarded. The request body has already been received at
+        this point; check_upload_length bounds it before it is read.
+        
+        Returns:
+            file_id, file_path and the SHA-256 hex digest of the content
         """
-        # Validate file
-        if not self._is_allowed_file(upload_file.filename):
-            raise HTTPException(
-                status_code=400, 
-                detail=f"File type not allowed. Supported formats: {', '.join(self.config.ALLOWED_EXTENSIONS)}"
-            )
+        self._check_allowed_file(upload_file.filename)
+        
+        async def read_chunks():
+            while True:
+                chunk = await upload_file.read(self.config.UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+        
+        return await self._store_upload(read_chunks(), upload_file.filename)
+    
+    async def _store_upload(self, chunks: AsyncIterator[bytes], filename: str) -> Tuple[str, str, str]:
+        """
+        Write a stream of chunks to UPLOAD_FOLDER, enforcing MAX_FILE_SIZE and hashing the content
+        
+        Uploads are content addressed: the file_id is the SHA-256 of the content, and
+        uploading a file that is already stored keeps the existing copy.
+        """
+        # Stream to a private temporary name, hashing and counting as it goes
+        partial_path = os.path.join(self.config.UPLOAD_FOLDER, f"{uuid.uuid4().hex}.part")
+        digest = hashlib.sha256()
+        file_size = 0
+        try:
+            async with aiofiles.open(partial_path, 'wb') as f:
+                async for chunk in chunks:
+                    file_size += len(chunk)
+                    if file_size > self.config.MAX_FILE_SIZE:
+                        raise self._file_too_large()
+                    digest.update(chunk)
+                    await f.write(chunk)
+            
+            file_id = digest.hexdigest()
+            file_path = self.find_upload(file_id)
+            if file_path is None:
+                file_path = os.path.join(self.config.UPLOAD_FOLDER, f"{file_id}{Path(filename).suffix}")
+                os.replace(partial_path, file_path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        
+        return file_id, file_path, file_id
+    
+    def check_upload_length(self, content_length: Optional[str]):
+        """
+        Reject a multipart upload by its Content-Length before any of the body is read
+        
+        The server never reads past the declared length, so this bounds what is
+        received and spooled. Requests without a length (chunked) are refused.
+        """
+        if content_length is None:
+            raise HTTPException(status_code=411, detail="Content-Length required")
+        try:
+            length = int(content_length)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Content-Length")
+        if length > self.config.MAX_FILE_SIZE + self.MULTIPART_OVERHEAD:
+            raise self._file_too_large()
+    
+    def find_upload(self, file_id: str) -> Optional[str]:
+        """Get the stored path of an uploaded video by file_id, if any"""
+        for path in sorted(Path(self.config.UPLOAD_FOLDER).glob(f"{file_id}.*")):
+            if path.suffix != ".part":
+                return str(path)
+        return None
+    
+    def create_upload_session(self, filename: str, total_size: int, chunk_size: Optional[int] = None) -> Dict:
+        """
+        Start a resumable upload of total_size bytes sent in numbered chunks
         
-        # Check file size
-        file_size = await self._get_file_size(upload_file)
-        if file_size > self.config.MAX_FILE_SIZE:
+        Chunk i covers bytes [i * chunk_size, (i + 1) * chunk_size); only the last
+        chunk may be shorter. Session state lives in UPLOAD_SESSIONS_DIR, so any API
+        replica sharing that directory can accept chunks.
+        """
+        self._check_allowed_file(filename)
+        if total_size <= 0:
+            raise HTTPException(status_code=400, detail="Upload size must be positive")
+        if total_size > self.config.MAX_FILE_SIZE:
+            raise self._file_too_large()
+        
+        chunk_size = chunk_size or self.config.UPLOAD_SESSION_CHUNK_SIZE
+        if not 0 < chunk_size <= self.config.MAX_UPLOAD_CHUNK_SIZE:
             raise HTTPException(
-                status_code=400, 
-                detail=f"File size too large. Maximum size: {self.config.MAX_FILE_SIZE / (1024*1024):.1f}MB"
+                status_code=400,
+                detail=f"Chunk size must be between 1 and {self.config.MAX_UPLOAD_CHUNK_SIZE} bytes"
             )
         
-        # Generate unique file ID and path
-        file_id = str(uuid.uuid4())
-        file_extension = Path(upload_file.filename).suffix
-        filename = f"{file_id}{file_extension}"
-        file_path = os.path.join(self.config.UPLOAD_FOLDER, filename)
+        upload_id = uuid.uuid4().hex
+        session = {
+            "upload_id": upload_id,
+            "filename": filename,
+            "total_size": total_size,
+            "chunk_size": chunk_size,
+            "total_chunks": -(-total_size // chunk_size),
+        }
+        session_dir = self._upload_session_dir(upload_id)
+        os.makedirs(os.path.join(session_dir, "chunks"))
+        with open(os.path.join(session_dir, "session.json"), "w") as f:
+            json.dump(session, f)
+        
+        return self.get_upload_session(upload_id)
+    
+    def get_upload_session(self, upload_id: str) -> Dict:
+        """Session parameters plus the chunks received so far"""
+        session = self._load_upload_session(upload_id)
+        chunks_dir = os.path.join(self._upload_session_dir(upload_id), "chunks")
+        received = sorted(int(name) for name in os.listdir(chunks_dir) if name.isdigit())
+        session["received_chunks"] = received
+        session["received_bytes"] = sum(self._chunk_length(session, index) for index in received)
+        return session
+    
+    async def save_upload_chunk(self, upload_id: str, index: int, chunks: AsyncIterator[bytes]) -> Dict:
+        """
+        Store one numbered chunk of an upload session
+        
+        Chunks may arrive in any order and in parallel; re-sending a chunk replaces it.
+        The body is streamed to disk and rejected as soon as it exceeds the chunk length.
+        """
+        session = self._load_upload_session(upload_id)
+        if not 0 <= index < session["total_chunks"]:
+            raise HTTPException(status_code=400, detail=f"Chunk index out of range: {index}")
+        
+        expected_length = self._chunk_length(session, index)
+        chunk_path = os.path.join(self._upload_session_dir(upload_id), "chunks", f"{index:06d}")
+        partial_path = f"{chunk_path}.{uuid.uuid4().hex}.part"
+        length = 0
+        try:
+            async with aiofiles.open(partial_path, 'wb') as f:
+                async for data in chunks:
+                    length += len(data)
+                    if length > expected_length:
+                        break
+                    await f.write(data)
+            if length != expected_length:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Chunk {index} must be {expected_length} bytes, received {length}"
+                )
+            os.replace(partial_path, chunk_path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        
+        return self.get_upload_session(upload_id)
+    
+    async def complete_upload_session(self, upload_id: str) -> Tuple[str, str, str]:
+        """
+        Assemble a finished upload session into UPLOAD_FOLDER and remove the session
+        
+        Returns:
+            file_id, file_path and the SHA-256 hex digest, as for save_upload_file
+        """
+        session = self.get_upload_session(upload_id)
+        missing = sorted(set(range(session["total_chunks"])) - set(session["received_chunks"]))
+        if missing:
+            raise HTTPException(status_code=409, detail=f"Upload incomplete, missing chunks: {missing[:20]}")
+        
+        chunks_dir = os.path.join(self._upload_session_dir(upload_id), "chunks")
         
-        # Save file
-        async with aiofiles.open(file_path, 'wb') as f:
-            content = await upload_file.read()
-            await f.write(content)
+        async def read_chunks():
+            for index in range(session["total_chunks"]):
+                async with aiofiles.open(os.path.join(chunks_dir, f"{index:06d}"), 'rb') as f:
+                    while True:
+                        data = await f.read(self.config.UPLOAD_CHUNK_SIZE)
+                        if not data:
+                            break
+                        yield data
         
-        return file_id, file_path
+        result = await self._store_upload(read_chunks(), session["filename"])
+        self.abort_upload_session(upload_id)
+        return result
+    
+    def abort_upload_session(self, upload_id: str):
+        """Delete an upload session and any chunks received"""
+        import shutil
+        
+        self._load_upload_session(upload_id)
+        shutil.rmtree(self._upload_session_dir(upload_id), ignore_errors=True)
+    
+    def _upload_session_dir(self, upload_id: str) -> str:
+        return os.path.join(self.config.UPLOAD_SESSIONS_DIR, upload_id)
+    
+    def _load_upload_session(self, upload_id: str) -> Dict:
+        # upload_id ends up in a path, so only accept IDs this handler could have issued
+        try:
+            valid = uuid.UUID(hex=upload_id).hex == upload_id
+        except ValueError:
+            valid = False
+        session_path = os.path.join(self._upload_session_dir(upload_id), "session.json")
+        if not valid or not os.path.exists(session_path):
+            raise HTTPException(status_code=404, detail="Upload session not found")
+        with open(session_path) as f:
+            return json.load(f)
+    
+    def _chunk_length(self, session: Dict, index: int) -> int:
+        start = index * session["chunk_size"]
+        return min(session["chunk_size"], session["total_size"] - start)
+    
+    def _check_allowed_file(self, filename: str):
+        if not self._is_allowed_file(filename):
+            raise HTTPException(
+                status_code=400, 
+                detail=f"File type not allowed. Supported formats: {', '.join(self.config.ALLOWED_EXTENSIONS)}"
+            )
+    
+    def _file_too_large(self) -> HTTPException:
+        return HTTPException(
+            status_code=400, 
+            detail=f"File size too large. Maximum size: {self.config.MAX_FILE_SIZE / (1024*1024):.1f}MB"
+        )
     
     def _is_allowed_file(self, filename: str) -> bool:
         """Check if file extension is allowed"""
@@ -49,22 +245,79 @@ class FileHandler:
             return False
         return Path(filename).suffix.lower().lstrip('.') in self.config.ALLOWED_EXTENSIONS
     
-    async def _get_file_size(self, upload_file: UploadFile) -> int:
-        """Get file size without consuming the file stream"""
-        # Read content to get size then reset stream
-        content = await upload_file.read()
-        await upload_file.seek(0)  # Reset stream position
-        return len(content)
-    
-    def get_output_video_path(self, task_id: str) -> str:
-        """Get output video file path for a task"""
+    def get_output_video_path(self, task_id: str, prompt_index: Optional[int] = None) -> str:
+        """Get output video file path for a task, or for one prompt of a multi-prompt task"""
+        if prompt_index is not None:
+            return os.path.join(self.config.OUTPUT_FOLDER, f"{task_id}_result_{prompt_index}.mp4")
         return os.path.join(self.config.OUTPUT_FOLDER, f"{task_id}_result.mp4")
     
-    def get_temp_frames_dir(self, task_id: str) -> str:
-        """Get temporary frames directory for a task"""
-        temp_dir = os.path.join(self.config.TEMP_FRAMES_DIR, task_id)
-        Path(temp_dir).mkdir(parents=True, exist_ok=True)
-        return temp_dir
+    def get_tracks_path(self, task_id: str) -> str:
+        """Get per-object track export path for a task"""
+        return os.path.join(self.config.OUTPUT_FOLDER, f"{task_id}_tracks.json")
+    
+    def get_frame_cache_dir(self, video_path: str, frame_source: str) -> str:
+        """
+        Get the decoded-frame cache directory of an uploaded video
+        
+        Keyed by file_id (the content hash), so every task on the same video shares
+        it. Task cleanup leaves it in place; evict_frame_caches bounds the total.
+        """
+        file_id = Path(video_path).stem
+        return os.path.join(self._frame_caches_dir(), file_id, frame_source)
+    
+    def mark_frame_cache_used(self, cache_dir: str):
+        """Record a use of a frame cache; eviction goes by the time of last use"""
+        try:
+            os.utime(cache_dir)
+        except OSError:
+            pass
+    
+    def evict_frame_caches(self, keep: Iterable[str] = ()):
+        """
+        Delete least recently used frame caches until they fit FRAME_CACHE_MAX_BYTES
+        
+        Caches in keep or used within FRAME_CACHE_GRACE_SECONDS are left alone. Build
+        directories left behind by crashed tasks are removed once past the grace period.
+        """
+        import shutil
+        
+        if self.config.FRAME_CACHE_MAX_BYTES <= 0:
+            return
+        keep = {os.path.abspath(path) for path in keep}
+        cutoff = time.time() - self.config.FRAME_CACHE_GRACE_SECONDS
+        
+        caches = []
+        total_bytes = 0
+        for cache_dir in glob.glob(os.path.join(self._frame_caches_dir(), "*", "*")):
+            try:
+                last_used = os.stat(cache_dir).st_mtime
+                size = sum(entry.stat().st_size for entry in os.scandir(cache_dir) if entry.is_file())
+            except OSError:
+                continue
+            if cache_dir.endswith(".tmp"):
+                if last_used < cutoff:
+                    shutil.rmtree(cache_dir, ignore_errors=True)
+                continue
+            total_bytes += size
+            if os.path.abspath(cache_dir) not in keep and last_used < cutoff:
+                caches.append((last_used, size, cache_dir))
+        
+        for last_used, size, cache_dir in sorted(caches):
+            if total_bytes <= self.config.FRAME_CACHE_MAX_BYTES:
+                break
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            total_bytes -= size
+            self._remove_if_empty(os.path.dirname(cache_dir))
+    
+    def _frame_caches_dir(self) -> str:
+        return os.path.join(self.config.TEMP_FRAMES_DIR, "videos")
+    
+    @staticmethod
+    def _remove_if_empty(directory: str):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            pass
     
     def get_tracking_results_dir(self, task_id: str) -> str:
         """Get tracking results directory for a task"""
@@ -72,13 +325,19 @@ class FileHandler:
         Path(results_dir).mkdir(parents=True, exist_ok=True)
         return results_dir
     
-    def cleanup_temp_files(self, task_id: str):
-        """Clean up temporary files for a task"""
+    def cleanup_temp_files(self, task_id: str, file_id: Optional[str] = None):
+        """
+        Clean up the intermediate results of a task
+        
+        With file_id, the frame caches of that upload are removed as well; other
+        tasks on the same video decode it again.
+        """
         import shutil
         
-        temp_frames_dir = os.path.join(self.config.TEMP_FRAMES_DIR, task_id)
-        tracking_results_dir = os.path.join(self.config.TRACKING_RESULTS_DIR, task_id)
+        directories = [os.path.join(self.config.TRACKING_RESULTS_DIR, task_id)]
+        if file_id is not None:
+            directories.append(os.path.join(self._frame_caches_dir(), Path(file_id).name))
         
-        for directory in [temp_frames_dir, tracking_results_dir]:
+        for directory in directories:
             if os.path.exists(directory):
                 shutil.rmtree(directory)
@@ -0,0 +1,97 @@
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from app.config import Config
+
+class JobRejectedError(Exception):
+    """Raised when a job cannot be queued"""
+
+class JobQueueFullError(JobRejectedError):
+    """Raised when a job is submitted while all running and queued slots are taken"""
+
+class JobRunnerShutdownError(JobRejectedError):
+    """Raised when a job is submitted after the runner was shut down"""
+
+class JobRunner:
+    """
+    Runs blocking pipeline jobs on a bounded pool of worker threads
+
+    Keeps CPU/GPU-bound model code off the FastAPI event loop. Up to
+    max_concurrent_jobs run at once; further jobs wait in FIFO order, and
+    submissions beyond max_queued_jobs waiting jobs are rejected.
+    """
+
+    def __init__(self, max_concurrent_jobs: int = None, max_queued_jobs: int = None):
+        config = Config()
+        self.max_concurrent_jobs = max_concurrent_jobs or config.MAX_CONCURRENT_JOBS
+        self.max_queued_jobs = max_queued_jobs if max_queued_jobs is not None else config.MAX_QUEUED_JOBS
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrent_jobs,
+            thread_name_prefix="tracking-job"
+        )
+        self._slots = threading.BoundedSemaphore(self.max_concurrent_jobs + self.max_queued_jobs)
+        self._lock = threading.Lock()
+        self._active = 0
+
+    def submit(self, fn: Callable, *args, on_cancelled: Optional[Callable[[], None]] = None, **kwargs) -> Future:
+        """
+        Queue a job
+
+        on_cancelled is called if the job is dropped before it starts, e.g. by
+        shutdown(wait=False).
+
+        Raises:
+            JobQueueFullError: If no running or queued slot is free
+            JobRunnerShutdownError: If the runner was shut down
+        """
+        if not self._slots.acquire(blocking=False):
+            raise JobQueueFullError(
+                f"Job queue is full ({self.max_concurrent_jobs} running, {self.max_queued_jobs} queued)"
+            )
+
+        with self._lock:
+            self._active += 1
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except RuntimeError:
+            self._release()
+            raise JobRunnerShutdownError("Server is shutting down")
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(lambda done: self._on_done(done, on_cancelled))
+        return future
+
+    def _on_done(self, future: Future, on_cancelled: Optional[Callable[[], None]]):
+        self._release()
+        if future.cancelled():
+            if on_cancelled is not None:
+                try:
+                    on_cancelled()
+                except Exception as e:
+                    logging.error(f"Failed to record cancelled job: {e}")
+        elif future.exception() is not None:
+            logging.error(f"Job failed: {future.exception()}")
+
+    def _release(self):
+        with self._lock:
+            self._active -= 1
+        self._slots.release()
+
+    def stats(self) -> dict:
+        """Number of running and waiting jobs"""
+        with self._lock:
+            active = self._active
+        running = min(active, self.max_concurrent_jobs)
+        return {
+            "running": running,
+            "queued": active - running,
+            "max_concurrent_jobs": self.max_concurrent_jobs,
+            "max_queued_jobs": self.max_queued_jobs
+        }
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting jobs; without wait, queued jobs are cancelled and running ones finish"""
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+class MicroBatcher:
+    """
+    Groups concurrent requests into batches for one batched model call
+
+    Each awaiting submit() adds its item to a queue. A worker task takes the first
+    waiting item, collects more until max_batch_size items are together or
+    max_wait seconds have passed, and runs process_batch over them on a dedicated
+    thread, off the event loop. Requests arriving while a batch runs form the next
+    one, so batches grow with load while a lone request waits at most max_wait.
+
+    process_batch gets a list of items and returns one result per item; a result
+    that is an Exception is raised to that item's caller only.
+    """
+
+    def __init__(self, process_batch: Callable[[List[Any]], List[Any]], max_batch_size: int = 8,
+                 max_wait: float = 0.01, max_queue: int = 256, name: str = "micro-batch"):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, item: Any) -> Any:
+        """
+        Process an item as part of the next batch and return its result
+
+        Raises:
+            asyncio.QueueFull: If max_queue items are already waiting
+        """
+        loop = asyncio.get_running_loop()
+        self._ensure_worker(loop)
+        future = loop.create_future()
+        self._queue.put_nowait((item, future))
+        return await future
+
+    def _ensure_worker(self, loop: asyncio.AbstractEventLoop):
+        with self._lock:
+            if self._loop is not loop or self._worker is None or self._worker.done():
+                self._loop = loop
+                self._queue = asyncio.Queue(maxsize=self.max_queue)
+                self._worker = loop.create_task(self._run(self._queue))
+
+    async def _run(self, requests: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await requests.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                if not requests.empty():
+                    batch.append(requests.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(requests.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Callers that gave up (e.g. disconnected) are left out
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if batch:
+                await self._run_batch(loop, batch)
+
+    async def _run_batch(self, loop: asyncio.AbstractEventLoop, batch: List[tuple]):
+        items = [item for item, _ in batch]
+        try:
+            results = await loop.run_in_executor(self._executor, self.process_batch, items)
+        except Exception as e:
+            logging.error(f"Batch of {len(items)} failed: {e}")
+            results = [e] * len(items)
+
+        with self._lock:
+            self.batches += 1
+            self.items += len(items)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        """Batches run, items processed and the resulting mean batch size"""
+        with self._lock:
+            batches, items = self.batches, self.items
+        return {
+            "batches": batches,
+            "items": items,
+            "mean_batch_size": items / batches if batches else 0.0,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_batch_size": self.max_batch_size,
+        }
+
+    def shutdown(self):
+        """Stop the worker; batches already running finish"""
+        if self._worker is not None and self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._worker.cancel)
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,137 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from typing import Dict, List, Optional, Union
+
+from app.config import Config
+
+class ResultCache:
+    """
+    Maps a job's inputs to the task that already produced (or is producing) its result
+
+    Keys cover the uploaded video (its content hash), the normalized prompt, the
+    thresholds, the video prompt type, the pipeline settings that change the output
+    (frame source, keyframe re-detection) and a fingerprint of the model files, so a
+    new checkpoint never serves stale results. Entries expire after RESULT_CACHE_TTL
+    seconds without a hit, and beyond RESULT_CACHE_MAX_ENTRIES the least recently
+    used are evicted. All state lives in Redis, shared by every API replica.
+    """
+
+    KEY_PREFIX = "result_cache:"
+    INDEX_KEY = "result_cache:index"
+    TASK_PREFIX = "result_cache:task:"
+
+    def __init__(self, redis_client):
+        self.config = Config()
+        self.redis_client = redis_client
+        self.ttl = self.config.RESULT_CACHE_TTL
+        self.max_entries = self.config.RESULT_CACHE_MAX_ENTRIES
+
+    def model_fingerprint(self) -> str:
+        """
+        Identify the deployed models without loading them
+
+        MODEL_VERSION wins when set (e.g. when the API has no access to the checkpoint
+        files); otherwise the model configs plus each checkpoint's size and mtime.
+        """
+        if self.config.MODEL_VERSION:
+            return self.config.MODEL_VERSION
+
+        parts = [self.config.MODEL_CFG, str(self.config.GROUNDING_DINO_CONFIG)]
+        for checkpoint in [self.config.SAM2_CHECKPOINT, self.config.GROUNDING_DINO_CHECKPOINT]:
+            try:
+                stat = os.stat(checkpoint)
+                parts.append(f"{checkpoint}:{stat.st_size}:{int(stat.st_mtime)}")
+            except OSError:
+                parts.append(f"{checkpoint}:missing")
+        return "|".join(parts)
+
+    def make_key(self, file_id: str, text_prompt: Union[str, List[str]], box_threshold: float,
+                 text_threshold: float, prompt_type: str) -> str:
+        """Hash every input that affects a job's result; a list holds the prompts of a multi-prompt job"""
+        if not isinstance(text_prompt, str) and len(text_prompt) == 1:
+            # One prompt in a list runs as a single-prompt job
+            text_prompt = text_prompt[0]
+        prompts = [text_prompt] if isinstance(text_prompt, str) else list(text_prompt)
+        captions = []
+        for prompt in prompts:
+            # Grounding DINO lower-cases the caption and terminates it with a period
+            caption = prompt.lower().strip()
+            if not caption.endswith("."):
+                caption += "."
+            captions.append(caption)
+
+        inputs = {
+            "file_id": file_id,
+            "caption": captions[0] if isinstance(text_prompt, str) else captions,
+            "box_threshold": round(float(box_threshold), 6),
+            "text_threshold": round(float(text_threshold), 6),
+            "prompt_type": prompt_type,
+            # JPEG frames are lossy, and keyframes re-detect and re-prompt objects
+            "frame_source": self.config.FRAME_SOURCE,
+            "keyframe_interval": self.config.KEYFRAME_INTERVAL,
+            "keyframe_scene_threshold": round(float(self.config.KEYFRAME_SCENE_THRESHOLD), 6),
+            "keyframe_iou_threshold": round(float(self.config.KEYFRAME_IOU_THRESHOLD), 6),
+            "models": self.model_fingerprint(),
+        }
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Get the task ID cached for a key, marking it recently used"""
+        try:
+            task_id = self.redis_client.get(self.KEY_PREFIX + key)
+            if task_id is not None:
+                self._touch(key, task_id)
+            return task_id
+        except Exception as e:
+            logging.error(f"Failed to read result cache: {e}")
+            return None
+
+    def put(self, key: str, task_id: str):
+        """Cache the task producing a key's result, evicting the oldest entries over the limit"""
+        try:
+            self._touch(key, task_id)
+
+            # The index outlives expired entries, so drop those first
+            self.redis_client.zremrangebyscore(self.INDEX_KEY, "-inf", time.time() - self.ttl)
+            excess = self.redis_client.zcard(self.INDEX_KEY) - self.max_entries
+            if excess > 0:
+                evicted = [member for member, _ in self.redis_client.zpopmin(self.INDEX_KEY, excess)]
+                self.redis_client.delete(*(self.KEY_PREFIX + member for member in evicted))
+        except Exception as e:
+            logging.error(f"Failed to update result cache: {e}")
+
+    def invalidate(self, key: str):
+        """Forget a cached result, e.g. because its task failed or its files are gone"""
+        try:
+            self.redis_client.delete(self.KEY_PREFIX + key)
+            self.redis_client.zrem(self.INDEX_KEY, key)
+        except Exception as e:
+            logging.error(f"Failed to invalidate result cache: {e}")
+
+    def invalidate_task(self, task_id: str):
+        """Forget the cached result a task was producing, e.g. because it failed"""
+        try:
+            key = self.redis_client.get(self.TASK_PREFIX + task_id)
+            if key is not None and self.redis_client.get(self.KEY_PREFIX + key) == task_id:
+                self.invalidate(key)
+            self.redis_client.delete(self.TASK_PREFIX + task_id)
+        except Exception as e:
+            logging.error(f"Failed to invalidate result cache: {e}")
+
+    def stats(self) -> Dict:
+        """Number of cached results and the eviction limits"""
+        return {
+            "entries": self.redis_client.zcard(self.INDEX_KEY),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+        }
+
+    def _touch(self, key: str, task_id: str):
+        pipe = self.redis_client.pipeline()
+        pipe.set(self.KEY_PREFIX + key, task_id, ex=self.ttl)
+        pipe.set(self.TASK_PREFIX + task_id, key, ex=self.ttl)
+        pipe.zadd(self.INDEX_KEY, {key: time.time()})
+        pipe.execute()
@@ -0,0 +1,58 @@
+import time
+import redis
+import logging
+from typing import Optional
+
+from app.config import Config
+from app.models.schemas import TaskStatus, TrackingTask
+from app.services.result_cache import ResultCache
+
+class TaskStore:
+    """
+    Task status records in Redis, shared by the API and the pipeline workers
+
+    Deliberately free of model dependencies so an API-only process can report
+    progress without importing torch.
+    """
+
+    def __init__(self):
+        self.config = Config()
+        self.redis_client = redis.Redis(
+            host=self.config.REDIS_HOST, 
+            port=self.config.REDIS_PORT, 
+            db=self.config.REDIS_DB,
+            decode_responses=True
+        )
+    
+    def get_task_status(self, task_id: str) -> Optional[TrackingTask]:
+        """Get task status from Redis"""
+        try:
+            task_data = self.redis_client.get(f"task:{task_id}")
+            if task_data:
+                return TrackingTask.parse_raw(task_data)
+            return None
+        except Exception as e:
+            logging.error(f"Failed to get task status: {e}")
+            return None
+    
+    def update_task_status(self, task_id: str, status: TaskStatus, progress: Optional[float] = None, 
+                          message: Optional[str] = None, result_video_url: Optional[str] = None, 
+                          error: Optional[str] = None):
+        """Update task status in Redis"""
+        try:
+            task = TrackingTask(
+                task_id=task_id,
+                status=status,
+                progress=progress,
+                message=message,
+                result_video_url=result_video_url,
+                error=error,
+                updated_at=time.time()
+            )
+            self.redis_client.set(f"task:{task_id}", task.json(), ex=self.config.TASK_STATUS_TTL)
+            logging.info(f"Updated task {task_id} status to {status}")
+            if status == TaskStatus.FAILED:
+                # Identical requests must start over instead of getting the failed task
+                ResultCache(self.redis_client).invalidate_task(task_id)
+        except Exception as e:
+            logging.error(f"Failed to update task status: {e}")
@@ -3,16 +3,16 @@ import sys
 import cv2
 import torch
 import numpy as np
-import supervision as sv
 from pathlib import Path
 from PIL import Image
-from tqdm import tqdm
 from torchvision.ops import box_convert
-from typing import Dict, List, Tuple, Optional
-import redis
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from contextlib import ExitStack, contextmanager, nullcontext
+from dataclasses import dataclass, field
+import threading
+import time
 import json
 import logging
-from celery import Celery
 
 # Add SAM2 and Grounding DINO to Python path
 project_root = Path(__file__).parent.parent.parent.parent  # Get to grounded-sam2-webapp root
@@ -29,33 +29,117 @@ for path in [grounded_sam2_path, segment_anything_2_path, grounding_dino_path]:
 logging.info(f"Python path (first 3): {sys.path[:3]}")
 
 from app.config import Config
-from app.models.schemas import TaskStatus, TrackingTask, DetectionResult
+from app.models.schemas import TaskStatus, TrackingTask, DetectionResult, ImageDetection, ImageDetectionResponse
+from app.models.sam_grounding import SAMGroundingModel
 from app.services.file_handler import FileHandler
+from app.services.task_store import TaskStore
+from app.utils.track_utils import box_iou, sample_points_from_masks, scene_cut_frames, select_keyframes
+from app.utils.frame_store import FrameStore, InMemoryFrameStore, MmapFrameStore, JpegFrameStore
+from app.utils.video_utils import VideoWriter, get_video_info
+from app.utils.render_utils import MaskRenderer, render_frames
+from app.utils.pipeline_utils import run_pipelined
+from app.utils.mask_store import FrameMasks, TrackMaskStore, encode_rle
+from app.utils.mask_postprocess import MaskPostprocessor
+from app.utils.feature_cache import SAM2FeatureCache
+from app.utils.text_feature_cache import GroundingTextCache
 
 # Import SAM2 and Grounding DINO components
 try:
-    from sam2.build_sam import build_sam2_video_predictor, build_sam2
+    from sam2.build_sam import build_sam2_video_predictor
     from sam2.sam2_image_predictor import SAM2ImagePredictor 
-    from grounding_dino.groundingdino.util.inference import load_model, load_image, predict
-    from app.utils.track_utils import sample_points_from_masks
-    from app.utils.video_utils import create_video_from_images
+    from grounding_dino.groundingdino.util.inference import load_model, predict
+    import grounding_dino.groundingdino.datasets.transforms as T
     imports_successful = True
 except ImportError as e:
     logging.error(f"Failed to import required dependencies: {e}")
     imports_successful = False
 
+@dataclass
+class TrackingContext:
+    """
+    State of one tracking job, carried through every pipeline stage
+    
+    The service itself only holds the shared models, so any number of jobs can run
+    through the same instance at once.
+    """
+    task_id: str
+    video_path: str
+    text_prompt: str
+    box_threshold: float = 0.35
+    text_threshold: float = 0.25
+    # Independent queries tracked together; defaults to [text_prompt]
+    text_prompts: List[str] = field(default_factory=list)
+    frame_store: Optional[FrameStore] = None
+    inference_state: Optional[Dict[str, Any]] = None
+    detections: List[DetectionResult] = field(default_factory=list)
+    masks: Optional[np.ndarray] = None      # (N, H, W) SAM2 masks of the detections
+    boxes: Optional[np.ndarray] = None      # (N, 4) xyxy boxes of the detections
+    labels: List[str] = field(default_factory=list)
+    # Detections on later keyframes by frame; they become tracks if no tracked object covers them
+    keyframe_detections: Dict[int, List[DetectionResult]] = field(default_factory=dict)
+    mask_store: Optional[TrackMaskStore] = None
+    
+    def __post_init__(self):
+        if not self.text_prompts:
+            self.text_prompts = [self.text_prompt]
+    
+    def candidate_objects(self) -> List[DetectionResult]:
+        """Tracked objects plus keyframe detections that may still start a track"""
+        return self.detections + [
+            det for frame_idx in sorted(self.keyframe_detections)
+            for det in self.keyframe_detections[frame_idx]
+        ]
+    
+    def close(self):
+        """Release the frames and the SAM2 state held for this job"""
+        if self.frame_store is not None:
+            self.frame_store.close()
+        self.inference_state = None
+
 class TrackingService:
-    def __init__(self):
+    def __init__(self, load_models: bool = True):
         self.config = Config()
         self.file_handler = FileHandler()
-        self.redis_client = redis.Redis(
-            host=self.config.REDIS_HOST, 
-            port=self.config.REDIS_PORT, 
-            db=self.config.REDIS_DB,
-            decode_responses=True
-        )
+        self.task_store = TaskStore()
         self.models_loaded = False
-        self._load_models()
+        self.feature_cache = None
+        self.text_feature_cache = None
+        self.detection_model = None
+        # "not_loaded", "loading", "warming_up", "ready" or "failed"
+        self.model_status = "not_loaded"
+        self._load_lock = threading.Lock()
+        # Held around model calls only; see _model_call
+        self._model_lock = threading.RLock()
+        if load_models:
+            self.ensure_models_loaded()
+    
+    def ensure_models_loaded(self) -> bool:
+        """
+        Load the models (and warm them up if configured) unless already loaded
+        
+        Safe to call from any thread; concurrent callers wait for a single load.
+        A failed load is retried on the next call.
+        """
+        with self._load_lock:
+            if self.models_loaded:
+                return True
+            
+            self.model_status = "loading"
+            self._load_models()
+            if not self.models_loaded:
+                self.model_status = "failed"
+                return False
+            
+            if self.config.MODEL_WARMUP:
+                self.model_status = "warming_up"
+                try:
+                    self._warmup_models()
+                except Exception as e:
+                    # A failed warmup only costs the first job its lazy initialization
+                    logging.warning(f"Model warmup failed: {e}")
+            
+            self.model_status = "ready"
+            return True
     
     def _load_models(self):
         """Load Grounding DINO and SAM2 models"""
@@ -70,6 +154,10 @@ class TrackingService:
                 model_checkpoint_path=self.config.GROUNDING_DINO_CHECKPOINT,
                 device=self.config.DEVICE
             )
+            if self.config.TEXT_FEATURE_CACHE_MAX_BYTES > 0:
+                self.text_feature_cache = GroundingTextCache.attach(
+                    self.grounding_model, self.config.TEXT_FEATURE_CACHE_MAX_BYTES
+                )
             
             # Load SAM2 models with our _C patches providing fallbacks
             self.video_predictor = build_sam2_video_predictor(
@@ -77,12 +165,20 @@ class TrackingService:
                 self.config.SAM2_CHECKPOINT,
                 device=self.config.DEVICE
             )
-            self.sam2_image_model = build_sam2(
-                self.config.MODEL_CFG, 
-                self.config.SAM2_CHECKPOINT,
-                device=self.config.DEVICE
+            if self.config.FEATURE_CACHE != "off":
+                self.feature_cache = SAM2FeatureCache(
+                    self.config.FEATURE_CACHE_MAX_BYTES,
+                    cache_dir=self.config.FEATURE_CACHE_DIR if self.config.FEATURE_CACHE == "disk" else None
+                )
+                self.feature_cache.install(self.video_predictor)
+            
+            # SAM2VideoPredictor is a SAM2Base, so the image predictor runs on the same
+            # weights instead of a second copy of the Hiera backbone
+            self.image_predictor = SAM2ImagePredictor(self.video_predictor)
+            # Single-image detection (/api/detect) runs on the same models
+            self.detection_model = SAMGroundingModel(
+                self.grounding_model, self.video_predictor, device=self.config.DEVICE
             )
-            self.image_predictor = SAM2ImagePredictor(self.sam2_image_model)
             
             # Enable optimizations for newer GPUs if available
             if torch.cuda.is_available() and torch.cuda.get_device_properties(0).major >= 8:
@@ -98,72 +194,200 @@ class TrackingService:
             traceback.print_exc()
             self.models_loaded = False
     
+    def _warmup_models(self):
+        """Run every model once on a small synthetic clip so CUDA kernels and buffers are initialized"""
+        start = time.time()
+        frame_store = InMemoryFrameStore([np.full((256, 256, 3), 127, dtype=np.uint8)] * 2)
+        box = np.array([[64, 64, 192, 192]], dtype=np.float32)
+        
+        image_source, image = self._load_detection_image(frame_store, 0)
+        with self._model_call():
+            predict(
+                model=self.grounding_model,
+                image=image,
+                caption="object.",
+                box_threshold=self.config.BOX_THRESHOLD,
+                text_threshold=self.config.TEXT_THRESHOLD,
+            )
+        
+        with self._model_call(stateful=True):
+            self.image_predictor.set_image(image_source)
+            self.image_predictor.predict(point_coords=None, point_labels=None, box=box, multimask_output=False)
+        
+        with self._model_call():
+            inference_state = frame_store.init_video_state(self.video_predictor)
+            self.video_predictor.add_new_points_or_box(
+                inference_state=inference_state, frame_idx=0, obj_id=1, box=box[0]
+            )
+        for _ in self._locked_iter(self.video_predictor.propagate_in_video(inference_state)):
+            pass
+        
+        logging.info(f"Models warmed up in {time.time() - start:.1f}s")
+    
     def get_task_status(self, task_id: str) -> Optional[TrackingTask]:
         """Get task status from Redis"""
-        try:
-            task_data = self.redis_client.get(f"task:{task_id}")
-            if task_data:
-                return TrackingTask.parse_raw(task_data)
-            return None
-        except Exception as e:
-            logging.error(f"Failed to get task status: {e}")
-            return None
+        return self.task_store.get_task_status(task_id)
     
-    def update_task_status(self, task_id: str, status: TaskStatus, progress: Optional[float] = None, 
-                          message: Optional[str] = None, result_video_url: Optional[str] = None, 
-                          error: Optional[str] = None):
+    def update_task_status(self, task_id: str, status: TaskStatus, **kwargs):
         """Update task status in Redis"""
-        try:
-            task = TrackingTask(
-                task_id=task_id,
-                status=status,
-                progress=progress,
-                message=message,
-                result_video_url=result_video_url,
-                error=error
-            )
-            self.redis_client.set(f"task:{task_id}", task.json(), ex=3600)  # Expire after 1 hour
-            logging.info(f"Updated task {task_id} status to {status}")
-        except Exception as e:
-            logging.error(f"Failed to update task status: {e}")
+        self.task_store.update_task_status(task_id, status, **kwargs)
     
-    async def start_tracking(self, task_id: str, video_path: str, text_prompt: str, 
-                           box_threshold: float = 0.35, text_threshold: float = 0.25) -> str:
-        """Start video tracking task"""
-        if not self.models_loaded:
+    def start_tracking(self, task_id: str, video_path: str, text_prompt: Optional[str] = None, 
+                       box_threshold: float = 0.35, text_threshold: float = 0.25,
+                       text_prompts: Optional[List[str]] = None) -> str:
+        """
+        Run a video tracking task (blocking; called from a JobRunner worker thread)
+        
+        With text_prompts, every prompt is detected on the same first frame and all
+        objects are tracked in one SAM2 pass, with one output video per prompt.
+        """
+        # Loads the models on first use when they were not preloaded
+        if not self.ensure_models_loaded():
             self.update_task_status(task_id, TaskStatus.FAILED, error="Models not loaded")
             return task_id
         
         self.update_task_status(task_id, TaskStatus.PROCESSING, progress=0, 
                               message="Starting video processing...")
         
+        if self.config.DEVICE == "cpu":
+            # The OpenMP team size is per calling thread, so each job gets its own budget
+            torch.set_num_threads(self.config.JOB_THREADS)
+        
+        text_prompts = list(text_prompts or [text_prompt])
+        ctx = TrackingContext(
+            task_id=task_id,
+            video_path=video_path,
+            text_prompt=" | ".join(text_prompts),
+            box_threshold=box_threshold,
+            text_threshold=text_threshold,
+            text_prompts=text_prompts
+        )
         try:
-            # Process video in background
-            await self._process_video_async(task_id, video_path, text_prompt, 
-                                          box_threshold, text_threshold)
+            with self._bind_feature_cache(ctx):
+                self._process_video(ctx)
         except Exception as e:
             logging.error(f"Error in tracking task {task_id}: {e}")
             self.update_task_status(task_id, TaskStatus.FAILED, error=str(e))
         
         return task_id
     
-    async def _process_video_async(self, task_id: str, video_path: str, text_prompt: str,
-                                 box_threshold: float, text_threshold: float):
-        """Process video tracking asynchronously"""
+    def detect_images(self, requests: List[Dict[str, Any]]) -> List[Any]:
+        """
+        Detect and segment a batch of single images (blocking; called by the /detect batcher)
+        
+        Each request holds the encoded "image" bytes, its "text_prompt", "box_threshold",
+        "text_threshold" and "include_masks". All decodable images go through the models
+        as one batch. Returns an ImageDetectionResponse per request, or a ValueError for
+        an image that could not be decoded.
+        """
+        if not self.ensure_models_loaded():
+            raise RuntimeError("Models not loaded")
+        
+        results: List[Any] = [None] * len(requests)
+        images = {}
+        for i, request in enumerate(requests):
+            image = cv2.imdecode(np.frombuffer(request["image"], np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                results[i] = ValueError("Could not decode image")
+            else:
+                images[i] = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        if not images:
+            return results
+        
+        batch = list(images)
+        with self._model_call():
+            outputs = self.detection_model.detect_and_segment_batch(
+                [images[i] for i in batch],
+                [requests[i]["text_prompt"] for i in batch],
+                box_threshold=[requests[i]["box_threshold"] for i in batch],
+                text_threshold=[requests[i]["text_threshold"] for i in batch],
+            )
+        for i, output in zip(batch, outputs):
+            results[i] = self._image_detection_response(images[i], output, requests[i]["include_masks"])
+        return results
+    
+    def _image_detection_response(self, image: np.ndarray, output: Dict, include_masks: bool) -> ImageDetectionResponse:
+        """Build the /detect response for one image from its detect_and_segment result"""
+        h, w = image.shape[:2]
+        masks = (np.asarray(output["masks"]) > 0.5).reshape(-1, h, w)
+        areas = masks.reshape(len(masks), -1).sum(axis=1)
+        if include_masks:
+            offsets, runs = encode_rle(masks)
+        
+        detections = []
+        for k, (box, confidence, label) in enumerate(zip(output["boxes"], output["confidences"], output["labels"])):
+            detections.append(ImageDetection(
+                label=label,
+                confidence=float(confidence),
+                bbox=np.asarray(box).tolist(),
+                area=int(areas[k]),
+                mask_rle=runs[offsets[k]:offsets[k + 1]].tolist() if include_masks else None
+            ))
+        return ImageDetectionResponse(width=w, height=h, detections=detections)
+    
+    def _bind_feature_cache(self, ctx: TrackingContext):
+        """
+        Scope a job's SAM2 frame features in the feature cache
+        
+        Features depend on the video content (its file_id is the content hash), on how
+        frames reach SAM2 (SAM2's JPEG loader resizes differently) and on the model.
+        """
+        if self.feature_cache is None:
+            return nullcontext()
+        
+        try:
+            stat = os.stat(self.config.SAM2_CHECKPOINT)
+            checkpoint = f"{self.config.SAM2_CHECKPOINT}:{stat.st_size}:{int(stat.st_mtime)}"
+        except OSError:
+            checkpoint = self.config.SAM2_CHECKPOINT
+        preprocessing = "jpeg" if self.config.FRAME_SOURCE == "jpeg" else "decoded"
+        file_id = Path(ctx.video_path).stem
+        return self.feature_cache.bind(
+            f"{file_id}:{preprocessing}:{self.config.MODEL_CFG}:{checkpoint}:{self.video_predictor.image_size}"
+        )
+    
+    @contextmanager
+    def _model_call(self, stateful: bool = False):
+        """
+        Guard one model call shared by concurrent jobs
+        
+        With MODEL_CALL_LOCK the calls of all jobs are serialized while decoding,
+        rendering and encoding still overlap. Stateful calls (the image predictor
+        keeps the last image it was given) are always serialized.
+        """
+        if stateful or self.config.MODEL_CALL_LOCK:
+            with self._model_lock:
+                yield
+        else:
+            yield
+    
+    def _locked_iter(self, iterator: Iterator) -> Iterator:
+        """Advance a model-driven generator one step at a time under _model_call"""
+        while True:
+            with self._model_call():
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+    
+    def _process_video(self, ctx: TrackingContext):
+        """Run the full tracking pipeline for one video"""
+        task_id = ctx.task_id
         try:
             # Step 1: Extract frames from video
             self.update_task_status(task_id, TaskStatus.PROCESSING, progress=10, 
                                   message="Extracting video frames...")
             
-            frames_dir = self.file_handler.get_temp_frames_dir(task_id)
-            frame_names = self._extract_video_frames(video_path, frames_dir)
+            ctx.frame_store = self._extract_video_frames(ctx)
             
             # Step 2: Initialize video predictor
             self.update_task_status(task_id, TaskStatus.PROCESSING, progress=20, 
                                   message="Initializing video predictor...")
             
-            logging.info(f"About to initialize video predictor for {frames_dir}")
-            inference_state = self.video_predictor.init_state(video_path=frames_dir)
+            logging.info(f"About to initialize video predictor for {len(ctx.frame_store)} frames")
+            with self._model_call():
+                ctx.inference_state = ctx.frame_store.init_video_state(self.video_predictor)
             logging.info(f"Video predictor initialized successfully")
             
             # Step 3: Process first frame for object detection
@@ -171,37 +395,59 @@ class TrackingService:
                                   message="Detecting objects in first frame...")
             
             logging.info(f"About to detect objects in first frame")
-            detections = self._detect_objects_in_frame(
-                frames_dir, frame_names[0], text_prompt, box_threshold, text_threshold
-            )
-            logging.info(f"Object detection completed, found {len(detections)} objects")
+            self._detect_objects_in_frame(ctx, 0)
+            logging.info(f"Object detection completed, found {len(ctx.detections)} objects")
             
-            if not detections:
-                raise Exception(f"No objects detected with prompt: {text_prompt}")
+            if self.config.KEYFRAME_INTERVAL > 0 or self.config.KEYFRAME_SCENE_THRESHOLD > 0:
+                ctx.keyframe_detections = self._detect_keyframes(ctx)
+                logging.info(f"Keyframe detection found objects on {len(ctx.keyframe_detections)} keyframes")
+            
+            if not ctx.detections and not ctx.keyframe_detections:
+                raise Exception(f"No objects detected with prompt: {ctx.text_prompt}")
             
             # Step 4: Set up tracking for detected objects
             self.update_task_status(task_id, TaskStatus.PROCESSING, progress=40, 
                                   message="Setting up object tracking...")
             
-            logging.info(f"About to setup video tracking for {len(detections)} objects")
-            self._setup_video_tracking(inference_state, detections, 0)
-            logging.info(f"Video tracking setup completed")
-            
-            # Step 5: Propagate tracking across all frames
-            self.update_task_status(task_id, TaskStatus.PROCESSING, progress=50, 
-                                  message="Tracking objects across video...")
+            if ctx.detections:
+                logging.info(f"About to setup video tracking for {len(ctx.detections)} objects")
+                self._setup_video_tracking(ctx, 0)
+                logging.info(f"Video tracking setup completed")
             
-            logging.info(f"About to propagate tracking across {len(frame_names)} frames")
-            video_segments = self._propagate_tracking(inference_state)
-            logging.info(f"Tracking propagation completed")
+            ctx.mask_store = self._create_mask_store(ctx)
             
-            # Step 6: Create annotated video
-            self.update_task_status(task_id, TaskStatus.PROCESSING, progress=70, 
-                                  message="Creating annotated video...")
+            if self.config.PIPELINED_RENDER:
+                # Steps 5+6: Render and encode frames while SAM2 is still propagating
+                self.update_task_status(task_id, TaskStatus.PROCESSING, progress=50, 
+                                      message="Tracking objects and creating annotated video...")
+                
+                logging.info(f"About to propagate and render {len(ctx.frame_store)} frames")
+                output_video_path = run_pipelined(
+                    self._iter_propagation(ctx),
+                    lambda frame_masks: self._create_annotated_video(ctx, frame_masks, record=True),
+                    max_queue=self.config.PIPELINE_QUEUE_DEPTH
+                )
+                logging.info(f"Tracking propagation and rendering completed")
+            else:
+                # Step 5: Propagate tracking across all frames
+                self.update_task_status(task_id, TaskStatus.PROCESSING, progress=50, 
+                                      message="Tracking objects across video...")
+                
+                logging.info(f"About to propagate tracking across {len(ctx.frame_store)} frames")
+                self._propagate_tracking(ctx)
+                logging.info(f"Tracking propagation completed")
+                
+                # Step 6: Create annotated video
+                self.update_task_status(task_id, TaskStatus.PROCESSING, progress=70, 
+                                      message="Creating annotated video...")
+                
+                output_video_path = self._create_annotated_video(ctx, ctx.mask_store.iter_frames())
             
-            output_video_path = self._create_annotated_video(
-                task_id, frames_dir, frame_names, video_segments, detections
-            )
+            self._export_tracks(ctx)
+            if self.feature_cache is not None:
+                logging.info(f"SAM2 feature cache: {self.feature_cache.stats()}")
+            if self.text_feature_cache is not None:
+                logging.info(f"Grounding DINO text cache: {self.text_feature_cache.stats()}")
             
             # Step 7: Complete task
             self.update_task_status(task_id, TaskStatus.COMPLETED, progress=100, 
@@ -216,164 +462,401 @@ class TrackingService:
             import traceback
             logging.error(f"Full traceback: {traceback.format_exc()}")
             self.update_task_status(task_id, TaskStatus.FAILED, error=str(e))
+        finally:
+            ctx.close()
     
-    def _extract_video_frames(self, video_path: str, frames_dir: str) -> List[str]:
-        """Extract frames from video file"""
-        video_info = sv.VideoInfo.from_video_path(video_path)
-        frame_generator = sv.get_video_frames_generator(video_path, stride=1, start=0, end=None)
-        
-        with sv.ImageSink(
-            target_dir_path=frames_dir, 
-            overwrite=True, 
-            image_name_pattern="{:05d}.jpg"
-        ) as sink:
-            for frame in tqdm(frame_generator, desc="Extracting frames"):
-                sink.save_image(frame)
-        
-        # Get sorted frame names
-        frame_names = [
-            p for p in os.listdir(frames_dir)
-            if os.path.splitext(p)[-1].lower() in [".jpg", ".jpeg"]
-        ]
-        frame_names.sort(key=lambda p: int(os.path.splitext(p)[0]))
+    def _extract_video_frames(self, ctx: TrackingContext) -> FrameStore:
+        """Open the video's cached frames in the configured frame store, decoding them on first use"""
+        frame_source = self._frame_source(ctx.video_path)
+        if frame_source == "memory":
+            return InMemoryFrameStore.from_video(ctx.video_path)
         
-        return frame_names
+        cache_dir = self.file_handler.get_frame_cache_dir(ctx.video_path, frame_source)
+        if frame_source == "mmap":
+            frame_store = MmapFrameStore.from_video(ctx.video_path, cache_dir)
+        else:
+            frame_store = JpegFrameStore.from_video(ctx.video_path, cache_dir)
+        
+        self.file_handler.mark_frame_cache_used(cache_dir)
+        self.file_handler.evict_frame_caches(keep=[cache_dir])
+        return frame_store
     
-    def _detect_objects_in_frame(self, frames_dir: str, frame_name: str, text_prompt: str,
-                               box_threshold: float, text_threshold: float) -> List[DetectionResult]:
-        """Detect objects in the first frame using Grounding DINO"""
-        img_path = os.path.join(frames_dir, frame_name)
-        image_source, image = load_image(img_path)
+    def _frame_source(self, video_path: str) -> str:
+        """FRAME_SOURCE, with mmap falling back to memory when the raw frames would not fit the frame cache budget"""
+        if self.config.FRAME_SOURCE != "mmap" or self.config.FRAME_CACHE_MAX_BYTES <= 0:
+            return self.config.FRAME_SOURCE
         
-        boxes, confidences, labels = predict(
-            model=self.grounding_model,
-            image=image,
-            caption=text_prompt,
-            box_threshold=box_threshold,
-            text_threshold=text_threshold,
-        )
+        video_info = get_video_info(video_path)
+        raw_bytes = video_info["frame_count"] * video_info["height"] * video_info["width"] * 3
+        if raw_bytes > self.config.FRAME_CACHE_MAX_BYTES:
+            logging.warning(f"Raw frames of {video_path} ({raw_bytes} bytes) exceed FRAME_CACHE_MAX_BYTES, "
+                            f"keeping them in memory instead of a memory-mapped cache")
+            return "memory"
+        return "mmap"
+    
+    def _load_detection_image(self, frame_store: FrameStore, frame_idx: int):
+        """Prepare a stored frame for Grounding DINO, mirroring load_image"""
+        transform = T.Compose([
+            T.RandomResize([800], max_size=1333),
+            T.ToTensor(),
+            T.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]),
+        ])
+        image_source = frame_store.get_rgb(frame_idx)
+        image, _ = transform(Image.fromarray(image_source), None)
+        return image_source, image
+    
+    def _detect_objects_in_frame(self, ctx: TrackingContext, frame_idx: int) -> List[DetectionResult]:
+        """
+        Detect objects for every prompt of the context in one frame and record them on it
         
-        # Process detected boxes
+        The frame is prepared once for Grounding DINO and embedded once by the SAM2
+        image predictor; object IDs run on across prompts.
+        """
+        image_source, image = self._load_detection_image(ctx.frame_store, frame_idx)
         h, w, _ = image_source.shape
-        boxes = boxes * torch.Tensor([w, h, w, h])
-        input_boxes = box_convert(boxes=boxes, in_fmt="cxcywh", out_fmt="xyxy").numpy()
         
-        # Create detection results
         detections = []
-        for i, (box, confidence, label) in enumerate(zip(input_boxes, confidences, labels)):
-            detections.append(DetectionResult(
-                object_id=i + 1,
-                label=label,
-                confidence=float(confidence),
-                bbox=box.tolist()
-            ))
+        all_boxes = []
+        all_labels = []
+        for prompt_index, text_prompt in enumerate(ctx.text_prompts):
+            with self._model_call():
+                boxes, confidences, labels = predict(
+                    model=self.grounding_model,
+                    image=image,
+                    caption=text_prompt,
+                    box_threshold=ctx.box_threshold,
+                    text_threshold=ctx.text_threshold,
+                )
+            
+            # Process detected boxes
+            boxes = boxes * torch.Tensor([w, h, w, h])
+            input_boxes = box_convert(boxes=boxes, in_fmt="cxcywh", out_fmt="xyxy").numpy()
+            
+            # Create detection results
+            for box, confidence, label in zip(input_boxes, confidences, labels):
+                detections.append(DetectionResult(
+                    object_id=len(detections) + 1,
+                    label=label,
+                    confidence=float(confidence),
+                    bbox=box.tolist(),
+                    prompt_index=prompt_index
+                ))
+            all_boxes.append(input_boxes.reshape(-1, 4))
+            all_labels.extend(labels)
+        
+        input_boxes = np.concatenate(all_boxes)
+        ctx.detections = detections
+        ctx.boxes = input_boxes
+        ctx.labels = all_labels
+        if not detections:
+            return detections
         
         # Get masks for the detected objects
-        self.image_predictor.set_image(image_source)
-        masks, scores, logits = self.image_predictor.predict(
-            point_coords=None,
-            point_labels=None,
-            box=input_boxes,
-            multimask_output=False,
-        )
+        with self._model_call(stateful=True):
+            self.image_predictor.set_image(image_source)
+            masks, scores, logits = self.image_predictor.predict(
+                point_coords=None,
+                point_labels=None,
+                box=input_boxes,
+                multimask_output=False,
+            )
         
         if masks.ndim == 4:
             masks = masks.squeeze(1)
-        
-        # Store masks for tracking setup
-        self._current_masks = masks
-        self._current_boxes = input_boxes
-        self._current_labels = labels
+        ctx.masks = masks
         
         return detections
     
-    def _setup_video_tracking(self, inference_state, detections: List[DetectionResult], frame_idx: int):
-        """Set up SAM2 video tracking for detected objects"""
+    def _detect_keyframes(self, ctx: TrackingContext) -> Dict[int, List[DetectionResult]]:
+        """
+        Detect objects on the keyframes after frame 0 with batched Grounding DINO passes
+        
+        Each (keyframe, prompt) pair is one batch item, and KEYFRAME_BATCH_SIZE items
+        go through one padded forward pass. Detections get object IDs following the
+        frame 0 ones; whether they start a track is decided during propagation.
+        """
+        scene_cuts = []
+        if self.config.KEYFRAME_SCENE_THRESHOLD > 0:
+            scene_cuts = scene_cut_frames(ctx.frame_store, self.config.KEYFRAME_SCENE_THRESHOLD)
+        keyframes = select_keyframes(len(ctx.frame_store), self.config.KEYFRAME_INTERVAL, scene_cuts)
+        
+        items = [(frame_idx, prompt_index) for frame_idx in keyframes for prompt_index in range(len(ctx.text_prompts))]
+        batch_size = max(1, self.config.KEYFRAME_BATCH_SIZE)
+        next_object_id = len(ctx.detections) + 1
+        keyframe_detections = {}
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            images = {frame_idx: ctx.frame_store.get_rgb(frame_idx) for frame_idx, _ in batch}
+            with self._model_call():
+                outputs = self.detection_model.detect_batch(
+                    [images[frame_idx] for frame_idx, _ in batch],
+                    [ctx.text_prompts[prompt_index] for _, prompt_index in batch],
+                    [ctx.box_threshold] * len(batch),
+                    [ctx.text_threshold] * len(batch),
+                )
+            
+            for (frame_idx, prompt_index), (boxes, confidences, labels) in zip(batch, outputs):
+                for box, confidence, label in zip(boxes, confidences, labels):
+                    keyframe_detections.setdefault(frame_idx, []).append(DetectionResult(
+                        object_id=next_object_id,
+                        label=label,
+                        confidence=float(confidence),
+                        bbox=np.asarray(box).tolist(),
+                        prompt_index=prompt_index,
+                        frame_idx=frame_idx
+                    ))
+                    next_object_id += 1
+        
+        return keyframe_detections
+    
+    def _setup_video_tracking(self, ctx: TrackingContext, frame_idx: int):
+        """Set up SAM2 video tracking for the objects detected on the context"""
         prompt_type = self.config.PROMPT_TYPE_FOR_VIDEO
+        inference_state = ctx.inference_state
         
         if prompt_type == "point":
-            all_sample_points = sample_points_from_masks(masks=self._current_masks, num_points=10)
-            for object_id, points in enumerate(all_sample_points, start=1):
+            all_sample_points = sample_points_from_masks(masks=ctx.masks, num_points=10)
+            for det, points in zip(ctx.detections, all_sample_points):
+                object_id = det.object_id
                 labels = np.ones((points.shape[0]), dtype=np.int32)
-                self.video_predictor.add_new_points_or_box(
-                    inference_state=inference_state,
-                    frame_idx=frame_idx,
-                    obj_id=object_id,
-                    points=points,
-                    labels=labels,
-                )
+                with self._model_call():
+                    self.video_predictor.add_new_points_or_box(
+                        inference_state=inference_state,
+                        frame_idx=frame_idx,
+                        obj_id=object_id,
+                        points=points,
+                        labels=labels,
+                    )
         
         elif prompt_type == "box":
-            for object_id, box in enumerate(self._current_boxes, start=1):
-                self.video_predictor.add_new_points_or_box(
-                    inference_state=inference_state,
-                    frame_idx=frame_idx,
-                    obj_id=object_id,
-                    box=box,
-                )
+            for det, box in zip(ctx.detections, ctx.boxes):
+                object_id = det.object_id
+                with self._model_call():
+                    self.video_predictor.add_new_points_or_box(
+                        inference_state=inference_state,
+                        frame_idx=frame_idx,
+                        obj_id=object_id,
+                        box=box,
+                    )
         
         elif prompt_type == "mask":
-            for object_id, mask in enumerate(self._current_masks, start=1):
-                self.video_predictor.add_new_mask(
+            for det, mask in zip(ctx.detections, ctx.masks):
+                object_id = det.object_id
+                with self._model_call():
+                    self.video_predictor.add_new_mask(
+                        inference_state=inference_state,
+                        frame_idx=frame_idx,
+                        obj_id=object_id,
+                        mask=mask
+                    )
+    
+    def _create_mask_store(self, ctx: TrackingContext) -> TrackMaskStore:
+        """Create the compact mask store for a task, spilling to disk if configured"""
+        spill_dir = None
+        if self.config.MASK_STORE_SPILL:
+            spill_dir = os.path.join(self.file_handler.get_tracking_results_dir(ctx.task_id), "masks")
+        return TrackMaskStore(ctx.frame_store.height, ctx.frame_store.width, spill_dir=spill_dir)
+    
+    def _iter_propagation(self, ctx: TrackingContext) -> Iterator[FrameMasks]:
+        """Yield masks, boxes, areas and centroids per frame as SAM2 propagates across the video"""
+        if ctx.keyframe_detections:
+            yield from self._iter_keyframe_propagation(ctx)
+            return
+        
+        postprocess = MaskPostprocessor(pin_memory=self.config.DEVICE == "cuda")
+        propagation = self._locked_iter(self.video_predictor.propagate_in_video(ctx.inference_state))
+        for out_frame_idx, out_obj_ids, out_mask_logits in propagation:
+            yield postprocess(out_frame_idx, out_obj_ids, out_mask_logits)
+    
+    def _iter_keyframe_propagation(self, ctx: TrackingContext) -> Iterator[FrameMasks]:
+        """
+        Propagate in windows that end at keyframes, starting tracks for new objects there
+        
+        At each keyframe, detections whose box overlaps no tracked object by
+        KEYFRAME_IOU_THRESHOLD become new objects. SAM2 cannot add objects once
+        tracking has started, so the state is then reset and prompted again at the
+        keyframe: current objects with their tracked masks, new ones with their boxes.
+        Without new objects propagation simply continues. Frames before the first
+        tracked object are yielded without masks.
+        """
+        postprocess = MaskPostprocessor(pin_memory=self.config.DEVICE == "cuda")
+        num_frames = len(ctx.frame_store)
+        tracking = bool(ctx.detections)
+        start = 0
+        next_frame = 0  # First frame not yielded yet
+        
+        for end in sorted(set(ctx.keyframe_detections) | {num_frames - 1}):
+            # The keyframe itself is held back until it is known whether it gets re-prompted
+            at_end = None
+            if tracking:
+                for frame in self._propagate_window(ctx, postprocess, start, end):
+                    if frame.frame_idx == end:
+                        at_end = frame
+                    elif frame.frame_idx >= next_frame:
+                        yield frame
+                        next_frame = frame.frame_idx + 1
+            else:
+                for frame_idx in range(next_frame, end):
+                    yield self._empty_frame_masks(ctx, frame_idx)
+                next_frame = end
+            
+            new_objects = self._new_keyframe_objects(ctx, end, at_end)
+            if new_objects:
+                self._prompt_keyframe(ctx, end, at_end, new_objects)
+                ctx.detections.extend(new_objects)
+                tracking = True
+                logging.info(f"Started {len(new_objects)} new tracks at keyframe {end}")
+            else:
+                yield at_end if at_end is not None else self._empty_frame_masks(ctx, end)
+                next_frame = end + 1
+            start = end
+        
+        # New objects on the last frame still need their masks there
+        if next_frame < num_frames:
+            for frame in self._propagate_window(ctx, postprocess, start, num_frames - 1):
+                if frame.frame_idx >= next_frame:
+                    yield frame
+    
+    def _propagate_window(self, ctx: TrackingContext, postprocess: MaskPostprocessor,
+                          start: int, end: int) -> Iterator[FrameMasks]:
+        """Propagate from frame start through frame end"""
+        propagation = self._locked_iter(self.video_predictor.propagate_in_video(
+            ctx.inference_state, start_frame_idx=start, max_frame_num_to_track=end - start
+        ))
+        for out_frame_idx, out_obj_ids, out_mask_logits in propagation:
+            yield postprocess(out_frame_idx, out_obj_ids, out_mask_logits)
+    
+    def _new_keyframe_objects(self, ctx: TrackingContext, frame_idx: int,
+                              tracked: Optional[FrameMasks]) -> List[DetectionResult]:
+        """Keyframe detections that no object tracked on that frame accounts for"""
+        candidates = ctx.keyframe_detections.get(frame_idx, [])
+        if not candidates or tracked is None:
+            return list(candidates)
+        
+        visible = np.asarray(tracked.areas) > 0
+        overlaps = box_iou([det.bbox for det in candidates], np.asarray(tracked.boxes)[visible])
+        best_overlap = overlaps.max(axis=1, initial=0.0)
+        return [det for det, overlap in zip(candidates, best_overlap) if overlap < self.config.KEYFRAME_IOU_THRESHOLD]
+    
+    def _prompt_keyframe(self, ctx: TrackingContext, frame_idx: int, tracked: Optional[FrameMasks],
+                         new_objects: List[DetectionResult]):
+        """Restart SAM2 tracking at a keyframe with the tracked objects plus new ones"""
+        inference_state = ctx.inference_state
+        with self._model_call():
+            self.video_predictor.reset_state(inference_state)
+            if tracked is not None:
+                # Objects lost by now are dropped; a later keyframe can pick them up again
+                for object_id, mask, area in zip(tracked.object_ids, tracked.masks, tracked.areas):
+                    if area > 0:
+                        self.video_predictor.add_new_mask(
+                            inference_state=inference_state,
+                            frame_idx=frame_idx,
+                            obj_id=object_id,
+                            mask=mask
+                        )
+            for det in new_objects:
+                self.video_predictor.add_new_points_or_box(
                     inference_state=inference_state,
                     frame_idx=frame_idx,
-                    obj_id=object_id,
-                    mask=mask
+                    obj_id=det.object_id,
+                    box=np.asarray(det.bbox, dtype=np.float32),
                 )
     
-    def _propagate_tracking(self, inference_state) -> Dict:
-        """Propagate tracking across all video frames"""
-        video_segments = {}
-        for out_frame_idx, out_obj_ids, out_mask_logits in self.video_predictor.propagate_in_video(inference_state):
-            video_segments[out_frame_idx] = {
-                out_obj_id: (out_mask_logits[i] > 0.0).cpu().numpy()
-                for i, out_obj_id in enumerate(out_obj_ids)
+    def _empty_frame_masks(self, ctx: TrackingContext, frame_idx: int) -> FrameMasks:
+        """A frame without tracked objects"""
+        h, w = ctx.frame_store.height, ctx.frame_store.width
+        return FrameMasks(
+            frame_idx=frame_idx,
+            object_ids=[],
+            masks=np.zeros((0, h, w), dtype=bool),
+            boxes=np.zeros((0, 4), dtype=np.float32),
+            areas=np.zeros(0, dtype=np.int64),
+            centroids=np.zeros((0, 2), dtype=np.float32),
+        )
+    
+    def _propagate_tracking(self, ctx: TrackingContext) -> TrackMaskStore:
+        """Propagate tracking across all video frames into the context's mask store"""
+        for frame in self._iter_propagation(ctx):
+            ctx.mask_store.add(frame)
+        return ctx.mask_store
+    
+    def _export_tracks(self, ctx: TrackingContext):
+        """Write per-object boxes, areas and centroids for every frame, read from the mask store"""
+        object_tracks = ctx.mask_store.object_tracks([det.object_id for det in ctx.detections])
+        tracks = {
+            det.object_id: {
+                "label": det.label,
+                "confidence": det.confidence,
+                "prompt": ctx.text_prompts[det.prompt_index],
+                "prompt_index": det.prompt_index,
+                "first_frame": det.frame_idx,
+                "frames": object_tracks[det.object_id]
             }
-        return video_segments
+            for det in ctx.detections
+        }
+        with open(self.file_handler.get_tracks_path(ctx.task_id), "w") as f:
+            json.dump(tracks, f)
     
-    def _create_annotated_video(self, task_id: str, frames_dir: str, frame_names: List[str],
-                              video_segments: Dict, detections: List[DetectionResult]) -> str:
-        """Create annotated video with tracking results"""
-        tracking_results_dir = self.file_handler.get_tracking_results_dir(task_id)
+    def _create_annotated_video(self, ctx: TrackingContext, frame_masks: Iterable[FrameMasks],
+                              record: bool = False) -> str:
+        """
+        Create annotated video with tracking results, encoding frames as they are rendered
         
-        # Create object ID to label mapping
-        id_to_objects = {det.object_id: det.label for det in detections}
+        With several prompts, one video per prompt (only its objects) is written next
+        to the combined one. With record set, masks streaming through are also added
+        to the context's mask store.
+        """
+        task_id = ctx.task_id
+        frame_store = ctx.frame_store
+        output_video_path = self.file_handler.get_output_video_path(task_id)
         
-        # Annotate each frame
-        for frame_idx, segments in video_segments.items():
-            img = cv2.imread(os.path.join(frames_dir, frame_names[frame_idx]))
-            
-            if segments:
-                object_ids = list(segments.keys())
-                masks = list(segments.values())
-                masks = np.concatenate(masks, axis=0)
-                
-                detections_sv = sv.Detections(
-                    xyxy=sv.mask_to_xyxy(masks),
-                    mask=masks,
-                    class_id=np.array(object_ids, dtype=np.int32),
-                )
-                
-                # Apply annotations
-                box_annotator = sv.BoxAnnotator()
-                annotated_frame = box_annotator.annotate(scene=img.copy(), detections=detections_sv)
-                
-                label_annotator = sv.LabelAnnotator()
-                labels = [id_to_objects.get(i, f"Object_{i}") for i in object_ids]
-                annotated_frame = label_annotator.annotate(annotated_frame, detections=detections_sv, labels=labels)
+        # (path, object IDs to draw or None for all) per output video
+        outputs = [(output_video_path, None)]
+        if len(ctx.text_prompts) > 1:
+            for prompt_index in range(len(ctx.text_prompts)):
+                object_ids = [det.object_id for det in ctx.candidate_objects() if det.prompt_index == prompt_index]
+                outputs.append((self.file_handler.get_output_video_path(task_id, prompt_index), object_ids))
+        
+        # Intermediate JPEGs are only written in debug mode
+        tracking_results_dir = None
+        if self.config.SAVE_ANNOTATED_FRAMES:
+            tracking_results_dir = self.file_handler.get_tracking_results_dir(task_id)
+        
+        if record:
+            frame_masks = self._record_masks(frame_masks, ctx.mask_store)
+        
+        def split_outputs(frames: Iterable[FrameMasks]) -> Iterator[FrameMasks]:
+            for frame in frames:
+                for _, object_ids in outputs:
+                    yield frame if object_ids is None else frame.select(object_ids)
+        
+        # One renderer per task: object IDs are unique across prompts, so it serves every output.
+        # Keyframe detections are included since they may start tracks while rendering runs
+        renderer = MaskRenderer({det.object_id: det.label for det in ctx.candidate_objects()})
+        
+        with ExitStack() as stack:
+            writers = [stack.enter_context(VideoWriter(path, fps=frame_store.fps)) for path, _ in outputs]
+            for position, (frame_idx, annotated_frame) in enumerate(render_frames(
+                frame_store, split_outputs(frame_masks), renderer,
+                workers=self.config.RENDER_WORKERS,
+                backend=self.config.RENDER_BACKEND
+            )):
+                output_index = position % len(outputs)
+                writers[output_index].write(annotated_frame)
                 
-                mask_annotator = sv.MaskAnnotator()
-                annotated_frame = mask_annotator.annotate(scene=annotated_frame, detections=detections_sv)
-            else:
-                annotated_frame = img
-            
-            cv2.imwrite(
-                os.path.join(tracking_results_dir, f"annotated_frame_{frame_idx:05d}.jpg"), 
-                annotated_frame
-            )
+                if tracking_results_dir and output_index == 0:
+                    cv2.imwrite(
+                        os.path.join(tracking_results_dir, f"annotated_frame_{frame_idx:05d}.jpg"), 
+                        annotated_frame
+                    )
         
-        # Create output video
-        output_video_path = self.file_handler.get_output_video_path(task_id)
-        create_video_from_images(tracking_results_dir, output_video_path)
+        if writers[0].frame_count == 0:
+            raise ValueError("No frames to save")
         
-        return output_video_path
\ No newline at end of file
+        return output_video_path
+    
+    def _record_masks(self, frame_masks: Iterable[FrameMasks], mask_store: TrackMaskStore) -> Iterator[FrameMasks]:
+        """Pass frame masks through unchanged while adding them to a mask store"""
+        for frame in frame_masks:
+            mask_store.add(frame)
+            yield frame
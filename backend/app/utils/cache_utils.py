@@ -0,0 +1,83 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+class ByteBudgetLRU:
+    """
+    Thread-safe LRU mapping whose capacity is a total size in bytes
+
+    Each entry is stored with its size; adding entries evicts the least recently
+    used ones until the total fits max_bytes. An entry larger than the whole budget
+    is not stored. on_evict is called with (key, value) for every entry evicted to
+    make room, e.g. to delete a backing file.
+    """
+
+    def __init__(self, max_bytes: int, on_evict: Optional[Callable[[Hashable, Any], None]] = None):
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get an entry and mark it most recently used"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, nbytes: int) -> bool:
+        """Add or replace an entry; returns False if it exceeds the whole budget"""
+        if nbytes > self.max_bytes:
+            return False
+
+        evicted = []
+        with self._lock:
+            if key in self._entries:
+                # Replacing an entry is not an eviction
+                self._pop(key)
+            self._entries[key] = (value, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                evicted.append((oldest, self._pop(oldest)))
+
+        # Callbacks may do I/O, so they run outside the lock
+        if self.on_evict is not None:
+            for evicted_key, evicted_value in evicted:
+                self.on_evict(evicted_key, evicted_value)
+        return True
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove an entry without calling on_evict"""
+        with self._lock:
+            if key not in self._entries:
+                return default
+            return self._pop(key)
+
+    def _pop(self, key: Hashable) -> Any:
+        value, nbytes = self._entries.pop(key)
+        self.nbytes -= nbytes
+        return value
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        """Entry count, bytes held and hit/miss counters"""
+        return {
+            "entries": len(self._entries),
+            "bytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,245 @@
+import os
+import uuid
+import hashlib
+import logging
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import torch
+import numpy as np
+
+from app.utils.cache_utils import ByteBudgetLRU
+
+# Identifies the video whose frames the current job encodes; set per job with bind()
+_video_key = contextvars.ContextVar("sam2_feature_cache_video_key", default=None)
+
+class SAM2FeatureCache:
+    """
+    Image-encoder outputs of SAM2 video frames, reused across jobs on the same video
+
+    SAM2's inference_state only remembers the backbone output of the most recent
+    frame, so every job runs the Hiera encoder over the whole video again although
+    only the prompt changed. install() wraps a video predictor's
+    _get_image_feature so that, while a video key is bound, each frame's backbone
+    output is looked up here first and stored after it is computed.
+
+    Entries live in memory (on CPU) or, with cache_dir, as files that survive
+    restarts and are shared by processes; either way the least recently used are
+    evicted beyond max_bytes. Positional encodings only depend on the feature map
+    shapes, so one copy per shape is kept instead of one per frame.
+    """
+
+    def __init__(self, max_bytes: int, cache_dir: Optional[str] = None):
+        self.cache_dir = cache_dir
+        self._entries = ByteBudgetLRU(max_bytes, on_evict=self._remove_file if cache_dir else None)
+        self._pos_enc: Dict[tuple, List[torch.Tensor]] = {}
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._index_existing_files()
+
+    @contextmanager
+    def bind(self, video_key: str):
+        """Cache the features of frames encoded in this context under video_key"""
+        token = _video_key.set(video_key)
+        try:
+            yield
+        finally:
+            _video_key.reset(token)
+
+    def install(self, video_predictor):
+        """Route a SAM2VideoPredictor's per-frame image features through the cache"""
+        compute_image_feature = video_predictor._get_image_feature
+
+        def _get_image_feature(inference_state, frame_idx, batch_size):
+            video_key = _video_key.get()
+            if video_key is None or frame_idx in inference_state["cached_features"]:
+                return compute_image_feature(inference_state, frame_idx, batch_size)
+
+            key = self._entry_key(video_key, frame_idx)
+            device = inference_state["device"]
+            backbone_out = self.load(key, device)
+            if backbone_out is not None:
+                # SAM2 uses its one-frame cache instead of running the encoder
+                image = inference_state["images"][frame_idx].to(device).float().unsqueeze(0)
+                inference_state["cached_features"] = {frame_idx: (image, backbone_out)}
+                return compute_image_feature(inference_state, frame_idx, batch_size)
+
+            features = compute_image_feature(inference_state, frame_idx, batch_size)
+            self.store(key, inference_state["cached_features"][frame_idx][1])
+            return features
+
+        video_predictor._get_image_feature = _get_image_feature
+
+    def store(self, key: str, backbone_out: Dict):
+        """Keep one frame's backbone output (a copy on CPU, without positional encodings)"""
+        fpn = backbone_out["backbone_fpn"]
+        self._pos_enc[self._shape_key(fpn, fpn[0].device)] = backbone_out["vision_pos_enc"]
+
+        entry = {"backbone_fpn": [t.detach().to("cpu") for t in fpn]}
+        # In SAM2 vision_features is the last FPN level itself
+        if backbone_out["vision_features"] is not fpn[-1]:
+            entry["vision_features"] = backbone_out["vision_features"].detach().to("cpu")
+        nbytes = sum(t.numel() * t.element_size() for t in entry["backbone_fpn"])
+        if "vision_features" in entry:
+            nbytes += entry["vision_features"].numel() * entry["vision_features"].element_size()
+
+        if self.cache_dir is None:
+            self._entries.put(key, entry, nbytes)
+            return
+
+        path = self._path(key)
+        partial_path = f"{path}.{uuid.uuid4().hex}.part"
+        try:
+            torch.save(entry, partial_path)
+            os.replace(partial_path, path)
+            if not self._entries.put(key, path, os.path.getsize(path)):
+                os.remove(path)
+        except OSError as e:
+            logging.warning(f"Could not write SAM2 feature cache entry: {e}")
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+    def load(self, key: str, device) -> Optional[Dict]:
+        """Rebuild a frame's backbone output on device, or None on a miss"""
+        entry = self._entries.get(key)
+        if entry is not None and self.cache_dir is not None:
+            entry = self._read_file(key, entry)
+        elif entry is None and self.cache_dir is not None and os.path.exists(self._path(key)):
+            # Written by another process sharing the directory
+            entry = self._read_file(key, self._path(key))
+            if entry is not None:
+                self._entries.put(key, self._path(key), os.path.getsize(self._path(key)))
+        if entry is None:
+            return None
+
+        fpn = [t.to(device, non_blocking=True) for t in entry["backbone_fpn"]]
+        pos_enc = self._pos_enc.get(self._shape_key(fpn, fpn[0].device))
+        if pos_enc is None:
+            # Nothing encoded at this resolution in this process yet
+            return None
+        vision_features = entry.get("vision_features")
+        return {
+            "vision_features": fpn[-1] if vision_features is None else vision_features.to(device, non_blocking=True),
+            "vision_pos_enc": pos_enc,
+            "backbone_fpn": fpn,
+        }
+
+    def stats(self) -> Dict[str, int]:
+        return self._entries.stats()
+
+    def _read_file(self, key: str, path: str) -> Optional[Dict]:
+        try:
+            return torch.load(path, map_location="cpu")
+        except (OSError, RuntimeError, EOFError):
+            # Evicted by another process or truncated
+            self._entries.pop(key)
+            return None
+
+    def _index_existing_files(self):
+        paths = [
+            os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+            if name.endswith(".pt")
+        ]
+        for path in sorted(paths, key=os.path.getmtime):
+            key = os.path.basename(path)[:-len(".pt")]
+            self._entries.put(key, path, os.path.getsize(path))
+
+    def _remove_file(self, key: str, path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pt")
+
+    @staticmethod
+    def _entry_key(video_key: str, frame_idx: int) -> str:
+        return hashlib.sha1(f"{video_key}:{frame_idx}".encode()).hexdigest()
+
+    @staticmethod
+    def _shape_key(fpn: List[torch.Tensor], device) -> tuple:
+        return (str(device),) + tuple(tuple(t.shape) for t in fpn)
+
+class SAM2ImageEmbeddingCache:
+    """
+    SAM2ImagePredictor image embeddings keyed by a hash of the image content
+
+    Segmenting the same image again with other boxes (a threshold tweak, another
+    prompt) only needs the prompt encoder and mask decoder. set_image() restores
+    the predictor's embedding from here when the image was seen before and runs
+    the image encoder otherwise. Entries stay on the model's device; the least
+    recently used are evicted beyond max_bytes.
+    """
+
+    def __init__(self, max_bytes: int):
+        self._entries = ByteBudgetLRU(max_bytes)
+
+    def set_image(self, image_predictor, image: np.ndarray) -> bool:
+        """Embed an image into image_predictor; returns True if the encoder was skipped"""
+        key = self.image_key(image)
+        entry = self._entries.get(key)
+        if entry is not None:
+            features, orig_hw = entry
+            image_predictor.reset_predictor()
+            image_predictor._features = features
+            image_predictor._orig_hw = [orig_hw]
+            image_predictor._is_image_set = True
+            return True
+
+        image_predictor.set_image(image)
+        features = image_predictor._features
+        self._entries.put(key, (features, image_predictor._orig_hw[0]), self._nbytes(features))
+        return False
+
+    def set_image_batch(self, image_predictor, images: List[np.ndarray]) -> int:
+        """
+        Embed a batch of images into image_predictor for predict_batch
+
+        Only images without a cached embedding go through the encoder, in one
+        set_image_batch call. Returns the number of images that skipped the encoder.
+        """
+        keys = [self.image_key(image) for image in images]
+        entries = {key: self._entries.get(key) for key in set(keys)}
+        missing = [key for key, entry in entries.items() if entry is None]
+        if missing:
+            first_index = {key: keys.index(key) for key in missing}
+            image_predictor.set_image_batch([images[first_index[key]] for key in missing])
+            features = image_predictor._features
+            for position, key in enumerate(missing):
+                # Copies, so an entry does not keep the whole batch alive
+                entry_features = {
+                    "image_embed": features["image_embed"][position:position + 1].clone(),
+                    "high_res_feats": [t[position:position + 1].clone() for t in features["high_res_feats"]],
+                }
+                entries[key] = (entry_features, image_predictor._orig_hw[position])
+                self._entries.put(key, entries[key], self._nbytes(entry_features))
+
+        batch = [entries[key] for key in keys]
+        image_predictor.reset_predictor()
+        image_predictor._features = {
+            "image_embed": torch.cat([features["image_embed"] for features, _ in batch]),
+            "high_res_feats": [
+                torch.cat(level) for level in zip(*(features["high_res_feats"] for features, _ in batch))
+            ],
+        }
+        image_predictor._orig_hw = [orig_hw for _, orig_hw in batch]
+        image_predictor._is_image_set = True
+        image_predictor._is_batch = True
+        return len(keys) - len(missing)
+
+    def stats(self) -> Dict[str, int]:
+        return self._entries.stats()
+
+    @staticmethod
+    def _nbytes(features: Dict) -> int:
+        tensors = [features["image_embed"]] + list(features["high_res_feats"])
+        return sum(t.numel() * t.element_size() for t in tensors)
+
+    @staticmethod
+    def image_key(image: np.ndarray) -> str:
+        image = np.ascontiguousarray(image)
+        digest = hashlib.sha1(f"{image.dtype}{image.shape}".encode())
+        digest.update(image.data)
+        return digest.hexdigest()
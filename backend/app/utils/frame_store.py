@@ -0,0 +1,351 @@
+import os
+import cv2
+import json
+import shutil
+import tempfile
+import threading
+import numpy as np
+from contextlib import contextmanager
+from typing import Iterator, List
+
+from app.utils.video_utils import get_video_info, iter_video_frames, read_video_frames
+
+# Normalization constants used by SAM2's own frame loader
+SAM2_IMG_MEAN = (0.485, 0.456, 0.406)
+SAM2_IMG_STD = (0.229, 0.224, 0.225)
+
+# init_state looks up load_video_frames as a module global, so swapping it is
+# serialized across threads
+_sam2_loader_lock = threading.Lock()
+
+
+@contextmanager
+def _building(cache_dir: str) -> Iterator[str]:
+    """
+    Build a cache directory privately and move it into place when complete
+
+    If another process finished the same cache first, the private copy is dropped
+    and theirs is used.
+    """
+    parent = os.path.dirname(os.path.abspath(cache_dir))
+    os.makedirs(parent, exist_ok=True)
+    build_dir = tempfile.mkdtemp(prefix=os.path.basename(cache_dir) + ".", suffix=".tmp", dir=parent)
+    try:
+        yield build_dir
+        try:
+            # Replaces a missing or empty directory atomically
+            os.rename(build_dir, cache_dir)
+        except OSError:
+            if not os.listdir(cache_dir):
+                raise
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+
+class FrameStore:
+    """
+    Random access to the decoded frames of one video (BGR, uint8)
+
+    Every pipeline stage (SAM2 state init, detection, annotation) reads frames
+    through this interface so the video only has to be decoded once.
+    """
+
+    fps: float = 30
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def __getitem__(self, frame_idx: int) -> np.ndarray:
+        raise NotImplementedError
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        for frame_idx in range(len(self)):
+            yield self[frame_idx]
+
+    @property
+    def height(self) -> int:
+        return self[0].shape[0]
+
+    @property
+    def width(self) -> int:
+        return self[0].shape[1]
+
+    def get_rgb(self, frame_idx: int) -> np.ndarray:
+        """Get a frame converted to RGB"""
+        return cv2.cvtColor(self[frame_idx], cv2.COLOR_BGR2RGB)
+
+    def sam2_images(self, image_size: int, offload_video_to_cpu: bool = False,
+                    compute_device="cpu") -> "SAM2FrameSequence":
+        """
+        Frames as SAM2 expects them in inference_state["images"], prepared on access
+
+        Args:
+            image_size: SAM2 input resolution (video_predictor.image_size)
+            offload_video_to_cpu: Return frames on CPU instead of compute_device
+            compute_device: Device the model runs on
+        """
+        return SAM2FrameSequence(self, image_size, "cpu" if offload_video_to_cpu else compute_device)
+
+    def init_video_state(self, video_predictor, offload_video_to_cpu: bool = False, **kwargs):
+        """
+        Initialize a SAM2 inference_state directly from the stored frames
+
+        SAM2's init_state only accepts a path, so its frame loader is swapped for
+        one that returns a lazy sequence over this store. Like SAM2's own
+        AsyncVideoFrameLoader, frames are only resized and normalized when SAM2
+        encodes them, so no N x 3 x S x S tensor of the whole video is built.
+        """
+        import sam2.sam2_video_predictor as sam2_video_predictor
+
+        images = self.sam2_images(
+            video_predictor.image_size,
+            offload_video_to_cpu=offload_video_to_cpu,
+            compute_device=video_predictor.device
+        )
+        video_height, video_width = self.height, self.width
+
+        def load_frames_from_store(*args, **loader_kwargs):
+            return images, video_height, video_width
+
+        with _sam2_loader_lock:
+            original_loader = sam2_video_predictor.load_video_frames
+            sam2_video_predictor.load_video_frames = load_frames_from_store
+            try:
+                return video_predictor.init_state(
+                    video_path="<frame_store>",
+                    offload_video_to_cpu=offload_video_to_cpu,
+                    **kwargs
+                )
+            finally:
+                sam2_video_predictor.load_video_frames = original_loader
+
+    def close(self):
+        """Release any resources held by the store"""
+        pass
+
+
+class SAM2FrameSequence:
+    """
+    Lazy stand-in for the (N, 3, S, S) image tensor of a SAM2 inference_state
+
+    SAM2 only takes len() of its images and indexes single frames, so each lookup
+    reads one frame from the store (a slice of the memmap for MmapFrameStore) and
+    resizes and normalizes just that frame.
+    """
+
+    def __init__(self, frame_store: FrameStore, image_size: int, device="cpu"):
+        import torch
+
+        self.frame_store = frame_store
+        self.image_size = image_size
+        self.device = device
+        self.img_mean = torch.tensor(SAM2_IMG_MEAN, dtype=torch.float32)[:, None, None]
+        self.img_std = torch.tensor(SAM2_IMG_STD, dtype=torch.float32)[:, None, None]
+
+    def __len__(self) -> int:
+        return len(self.frame_store)
+
+    def __getitem__(self, frame_idx: int):
+        import torch
+
+        frame = self.frame_store[frame_idx]
+        resized = cv2.resize(frame, (self.image_size, self.image_size), interpolation=cv2.INTER_CUBIC)
+        rgb = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
+        image = torch.from_numpy(rgb).permute(2, 0, 1).float().div_(255.0)
+        image -= self.img_mean
+        image /= self.img_std
+        return image.to(self.device)
+
+
+class InMemoryFrameStore(FrameStore):
+    """Frames decoded once and kept in RAM"""
+
+    def __init__(self, frames: List[np.ndarray], fps: float = 30):
+        if not frames:
+            raise ValueError("No frames to store")
+        self.frames = frames
+        self.fps = fps
+
+    @classmethod
+    def from_video(cls, video_path: str) -> "InMemoryFrameStore":
+        """Decode every frame of a video into memory"""
+        video_info = get_video_info(video_path)
+        frames = read_video_frames(video_path)
+        return cls(frames, fps=video_info["fps"] or 30)
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def __getitem__(self, frame_idx: int) -> np.ndarray:
+        return self.frames[frame_idx]
+
+    def close(self):
+        self.frames = []
+
+
+class MmapFrameStore(FrameStore):
+    """
+    Frames stored as one raw uint8 array (N x H x W x 3) on disk and memory-mapped
+
+    A small JSON header next to the array records its shape. The header is written
+    last, so its presence marks a complete cache that later runs can reopen without
+    decoding the video again. Frames are read-only views into the mapping, and the
+    OS page cache shares them between processes.
+    """
+
+    DATA_FILENAME = "frames.u8"
+    HEADER_FILENAME = "frames.json"
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        with open(os.path.join(cache_dir, self.HEADER_FILENAME)) as f:
+            header = json.load(f)
+
+        self.fps = header["fps"]
+        self.frames = np.memmap(
+            os.path.join(cache_dir, self.DATA_FILENAME),
+            dtype=np.uint8,
+            mode="r",
+            shape=(header["count"], header["height"], header["width"], header["channels"])
+        )
+
+    @classmethod
+    def exists(cls, cache_dir: str) -> bool:
+        """Check whether a complete frame cache is present in a directory"""
+        return os.path.exists(os.path.join(cache_dir, cls.HEADER_FILENAME))
+
+    @classmethod
+    def from_video(cls, video_path: str, cache_dir: str) -> "MmapFrameStore":
+        """
+        Decode a video into a frame cache, reusing an existing one if present
+
+        The cache is built in a private directory and renamed into place, so tasks
+        sharing cache_dir never see a partial cache.
+
+        Args:
+            video_path: Path to the video file
+            cache_dir: Directory holding the raw frame array and its header
+
+        Returns:
+            MmapFrameStore over the cached frames
+        """
+        if cls.exists(cache_dir):
+            return cls(cache_dir)
+
+        with _building(cache_dir) as build_dir:
+            video_info = get_video_info(video_path)
+            count, shape = 0, None
+
+            with open(os.path.join(build_dir, cls.DATA_FILENAME), "wb") as f:
+                for frame in iter_video_frames(video_path):
+                    if shape is None:
+                        shape = frame.shape
+                    elif frame.shape != shape:
+                        raise ValueError(f"Inconsistent frame size in video: {video_path}")
+                    f.write(np.ascontiguousarray(frame, dtype=np.uint8).tobytes())
+                    count += 1
+
+            if count == 0:
+                raise ValueError(f"Could not read any frames from video: {video_path}")
+
+            header = {
+                "count": count,
+                "height": shape[0],
+                "width": shape[1],
+                "channels": shape[2],
+                "fps": video_info["fps"] or 30,
+            }
+            with open(os.path.join(build_dir, cls.HEADER_FILENAME), "w") as f:
+                json.dump(header, f)
+
+        return cls(cache_dir)
+
+    def __len__(self) -> int:
+        return self.frames.shape[0]
+
+    def __getitem__(self, frame_idx: int) -> np.ndarray:
+        return self.frames[frame_idx]
+
+    @property
+    def height(self) -> int:
+        return self.frames.shape[1]
+
+    @property
+    def width(self) -> int:
+        return self.frames.shape[2]
+
+    def __getstate__(self):
+        # Worker processes reopen the mapping instead of pickling frame data
+        return {"cache_dir": self.cache_dir}
+
+    def __setstate__(self, state):
+        self.__init__(state["cache_dir"])
+
+    def close(self):
+        self.frames = None
+
+
+class JpegFrameStore(FrameStore):
+    """Frames stored as numbered JPEG files in a directory"""
+
+    INFO_FILENAME = "frames.json"
+
+    def __init__(self, frames_dir: str, frame_names: List[str], fps: float = 30):
+        if not frame_names:
+            raise ValueError(f"No frames found in directory: {frames_dir}")
+        self.frames_dir = frames_dir
+        self.frame_names = frame_names
+        self.fps = fps
+        self._shape = None
+
+    @classmethod
+    def from_video(cls, video_path: str, frames_dir: str) -> "JpegFrameStore":
+        """Dump every frame of a video as JPEG into frames_dir, reusing an existing dump"""
+        info_path = os.path.join(frames_dir, cls.INFO_FILENAME)
+        if not os.path.exists(info_path):
+            with _building(frames_dir) as build_dir:
+                frame_names = []
+                for frame_idx, frame in enumerate(iter_video_frames(video_path)):
+                    frame_names.append(f"{frame_idx:05d}.jpg")
+                    cv2.imwrite(os.path.join(build_dir, frame_names[-1]), frame)
+                if not frame_names:
+                    raise ValueError(f"Could not read any frames from video: {video_path}")
+
+                info = {"frame_names": frame_names, "fps": get_video_info(video_path)["fps"] or 30}
+                with open(os.path.join(build_dir, cls.INFO_FILENAME), "w") as f:
+                    json.dump(info, f)
+
+        with open(info_path) as f:
+            info = json.load(f)
+        return cls(frames_dir, info["frame_names"], fps=info["fps"])
+
+    def __len__(self) -> int:
+        return len(self.frame_names)
+
+    def __getitem__(self, frame_idx: int) -> np.ndarray:
+        img_path = os.path.join(self.frames_dir, self.frame_names[frame_idx])
+        frame = cv2.imread(img_path)
+        if frame is None:
+            raise ValueError(f"Could not read frame: {img_path}")
+        return frame
+
+    @property
+    def height(self) -> int:
+        return self._frame_shape()[0]
+
+    @property
+    def width(self) -> int:
+        return self._frame_shape()[1]
+
+    def _frame_shape(self):
+        if self._shape is None:
+            self._shape = self[0].shape
+        return self._shape
+
+    def init_video_state(self, video_predictor, offload_video_to_cpu: bool = False, **kwargs):
+        """SAM2 reads the JPEG directory itself"""
+        return video_predictor.init_state(
+            video_path=self.frames_dir,
+            offload_video_to_cpu=offload_video_to_cpu,
+            **kwargs
+        )
@@ -0,0 +1,99 @@
+import numpy as np
+import torch
+from typing import List
+
+from app.utils.mask_store import FrameMasks
+
+# Per-object statistics computed on the device: x1, y1, x2, y2, area, cx, cy
+NUM_STATS = 7
+
+def compute_mask_stats(masks: torch.Tensor) -> torch.Tensor:
+    """
+    Compute boxes, areas and centroids for all masks of a frame on their device
+
+    Args:
+        masks: Boolean tensor of shape (N, H, W)
+
+    Returns:
+        Float32 tensor of shape (N, 7): x1, y1, x2, y2, area, cx, cy
+        (all zeros for empty masks)
+    """
+    num_objects, height, width = masks.shape
+    xs = torch.arange(width, device=masks.device)
+    ys = torch.arange(height, device=masks.device)
+
+    row_counts = masks.sum(dim=2).float()
+    col_counts = masks.sum(dim=1).float()
+    rows = row_counts > 0
+    cols = col_counts > 0
+
+    x1 = torch.where(cols, xs, width).amin(dim=1)
+    x2 = torch.where(cols, xs, -1).amax(dim=1)
+    y1 = torch.where(rows, ys, height).amin(dim=1)
+    y2 = torch.where(rows, ys, -1).amax(dim=1)
+
+    areas = row_counts.sum(dim=1)
+    safe_areas = areas.clamp(min=1)
+    cx = (col_counts * xs).sum(dim=1) / safe_areas
+    cy = (row_counts * ys).sum(dim=1) / safe_areas
+
+    stats = torch.stack([x1.float(), y1.float(), x2.float(), y2.float(), areas, cx, cy], dim=1)
+    return torch.where((areas > 0)[:, None], stats, torch.zeros_like(stats))
+
+class MaskPostprocessor:
+    """
+    Turns SAM2 mask logits into FrameMasks with a single device-to-host copy per frame
+
+    Thresholding and per-object statistics run on the model device for all objects
+    at once. Masks and statistics are then packed into one byte buffer and copied to
+    the host in one (pinned, non-blocking) transfer. Not thread-safe: use one
+    instance per propagation loop.
+    """
+
+    def __init__(self, pin_memory: bool = True):
+        self.pin_memory = pin_memory and torch.cuda.is_available()
+        self._staging = None
+
+    @torch.inference_mode()
+    def __call__(self, frame_idx: int, object_ids: List[int], mask_logits: torch.Tensor) -> FrameMasks:
+        """
+        Args:
+            frame_idx: Frame index
+            object_ids: Object IDs in mask_logits order
+            mask_logits: SAM2 output logits of shape (N, 1, H, W)
+        """
+        masks = (mask_logits > 0.0).reshape(len(object_ids), *mask_logits.shape[-2:])
+        stats = compute_mask_stats(masks)
+        num_objects, height, width = masks.shape
+
+        payload = torch.cat([
+            masks.reshape(-1).view(torch.uint8),
+            stats.contiguous().view(torch.uint8).reshape(-1),
+        ])
+        host = self._to_host(payload)
+
+        mask_bytes = num_objects * height * width
+        host_stats = host[mask_bytes:].view(np.float32).reshape(num_objects, NUM_STATS)
+        return FrameMasks(
+            frame_idx=frame_idx,
+            object_ids=list(object_ids),
+            masks=host[:mask_bytes].view(np.bool_).reshape(num_objects, height, width),
+            boxes=host_stats[:, :4],
+            areas=host_stats[:, 4].astype(np.int64),
+            centroids=host_stats[:, 5:],
+        )
+
+    def _to_host(self, payload: torch.Tensor) -> np.ndarray:
+        if payload.device.type == "cpu":
+            return payload.numpy()
+
+        if not self.pin_memory:
+            return payload.cpu().numpy()
+
+        # Reuse one pinned staging buffer; copy out of it since frames outlive this call
+        if self._staging is None or self._staging.numel() < payload.numel():
+            self._staging = torch.empty(payload.numel(), dtype=torch.uint8, pin_memory=True)
+        staging = self._staging[:payload.numel()]
+        staging.copy_(payload, non_blocking=True)
+        torch.cuda.current_stream(payload.device).synchronize()
+        return staging.numpy().copy()
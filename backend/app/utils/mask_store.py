@@ -0,0 +1,235 @@
+import os
+import numpy as np
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from app.utils.track_utils import masks_to_boxes
+
+class FrameMasks(NamedTuple):
+    """Tracked masks of one frame with optional per-object statistics"""
+    frame_idx: int
+    object_ids: List[int]
+    masks: np.ndarray                        # (N, H, W) bool
+    boxes: Optional[np.ndarray] = None       # (N, 4) xyxy
+    areas: Optional[np.ndarray] = None       # (N,) pixels
+    centroids: Optional[np.ndarray] = None   # (N, 2) x, y
+
+    def select(self, object_ids: List[int]) -> "FrameMasks":
+        """The same frame restricted to the given objects (those present, in frame order)"""
+        keep = np.isin(np.asarray(self.object_ids), object_ids)
+        return FrameMasks(
+            frame_idx=self.frame_idx,
+            object_ids=[object_id for object_id, kept in zip(self.object_ids, keep) if kept],
+            masks=self.masks[keep],
+            boxes=None if self.boxes is None else self.boxes[keep],
+            areas=None if self.areas is None else self.areas[keep],
+            centroids=None if self.centroids is None else self.centroids[keep],
+        )
+
+def encode_rle(masks: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Run-length encode a stack of binary masks in one vectorized pass
+
+    Args:
+        masks: Boolean array of shape (N, H, W)
+
+    Returns:
+        offsets: (N + 1,) array; runs of mask i are runs[offsets[i]:offsets[i + 1]]
+        runs: (R, 2) int32 array of [start, end) ranges over the row-major flattened mask
+    """
+    count = masks.shape[0]
+    flat = masks.reshape(count, int(np.prod(masks.shape[1:])))
+    size = flat.shape[1]
+
+    # Transitions between neighbouring pixels, plus runs touching either end
+    rows, cols = np.nonzero(flat[:, 1:] != flat[:, :-1])
+    cols += 1
+    first_on = np.flatnonzero(flat[:, 0])
+    last_on = np.flatnonzero(flat[:, -1])
+    rows = np.concatenate([rows, first_on, last_on])
+    cols = np.concatenate([cols, np.zeros(len(first_on), cols.dtype), np.full(len(last_on), size, cols.dtype)])
+    order = np.lexsort((cols, rows))
+
+    # Transitions alternate start/end within each mask
+    runs = cols[order].astype(np.int32).reshape(-1, 2)
+    runs_per_mask = np.bincount(rows, minlength=count) // 2
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(runs_per_mask, out=offsets[1:])
+    return offsets, runs
+
+def decode_rle(offsets: np.ndarray, runs: np.ndarray, height: int, width: int) -> np.ndarray:
+    """
+    Decode masks produced by encode_rle with a single np.repeat
+
+    Returns:
+        Boolean array of shape (N, H, W)
+    """
+    count = len(offsets) - 1
+    size = height * width
+
+    # Run boundaries over all masks laid end to end, alternating off/on segments
+    base = np.repeat(np.arange(count, dtype=np.int64) * size, np.diff(offsets))
+    bounds = np.empty(2 * len(runs) + 2, dtype=np.int64)
+    bounds[0] = 0
+    bounds[-1] = count * size
+    bounds[1:-1:2] = runs[:, 0] + base
+    bounds[2:-1:2] = runs[:, 1] + base
+
+    values = np.zeros(len(bounds) - 1, dtype=bool)
+    values[1::2] = True
+    return np.repeat(values, np.diff(bounds)).reshape(count, height, width)
+
+class TrackMaskStore:
+    """
+    Compact per-frame store of tracked object masks
+
+    Masks are kept run-length encoded together with their boxes and areas, so a
+    1080p mask costs a few KB instead of 2 MB. Whole frames decode in one
+    vectorized pass. With spill_dir set, encoded frames live on disk and only a
+    small index stays in memory.
+    """
+
+    def __init__(self, height: int, width: int, spill_dir: Optional[str] = None):
+        self.height = height
+        self.width = width
+        self.spill_dir = spill_dir
+        self._frames: Dict[int, Dict[str, np.ndarray]] = {}
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def add(self, frame: FrameMasks):
+        """
+        Store the masks of one frame
+
+        Boxes are computed from the masks if the frame does not carry them;
+        centroids are kept when present.
+        """
+        object_ids = frame.object_ids
+        masks = np.asarray(frame.masks).reshape(len(object_ids), self.height, self.width)
+        if masks.dtype != bool:
+            masks = masks > 0.5
+        offsets, runs = encode_rle(masks)
+
+        run_lengths = (runs[:, 1] - runs[:, 0]).astype(np.int64)
+        run_sums = np.concatenate([[0], np.cumsum(run_lengths)])
+        boxes = frame.boxes if frame.boxes is not None else masks_to_boxes(masks)
+        entry = {
+            "object_ids": np.asarray(object_ids, dtype=np.int32),
+            "offsets": offsets,
+            "runs": runs,
+            "areas": run_sums[offsets[1:]] - run_sums[offsets[:-1]],
+            "boxes": np.asarray(boxes, dtype=np.float32),
+        }
+        if frame.centroids is not None:
+            entry["centroids"] = np.asarray(frame.centroids, dtype=np.float32)
+        frame_idx = frame.frame_idx
+
+        if self.spill_dir:
+            path = os.path.join(self.spill_dir, f"{frame_idx:06d}.npz")
+            np.savez(path, **entry)
+            self._frames[frame_idx] = {"path": path, "object_ids": entry["object_ids"]}
+        else:
+            self._frames[frame_idx] = entry
+
+    def _entry(self, frame_idx: int) -> Dict[str, np.ndarray]:
+        entry = self._frames[frame_idx]
+        if "path" in entry:
+            with np.load(entry["path"]) as data:
+                return {key: data[key] for key in data.files}
+        return entry
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def __contains__(self, frame_idx: int) -> bool:
+        return frame_idx in self._frames
+
+    def frame_indices(self) -> List[int]:
+        """Stored frame indices in ascending order"""
+        return sorted(self._frames)
+
+    def object_ids(self, frame_idx: int) -> List[int]:
+        """IDs of the objects stored for a frame"""
+        return self._frames[frame_idx]["object_ids"].tolist()
+
+    def get_frame(self, frame_idx: int) -> Tuple[List[int], np.ndarray]:
+        """Decode all masks of a frame as (object_ids, (N, H, W) boolean masks)"""
+        entry = self._entry(frame_idx)
+        masks = decode_rle(entry["offsets"], entry["runs"], self.height, self.width)
+        return entry["object_ids"].tolist(), masks
+
+    def get_mask(self, frame_idx: int, object_id: int) -> np.ndarray:
+        """Decode the (H, W) mask of one object in one frame"""
+        entry = self._entry(frame_idx)
+        position = int(np.flatnonzero(entry["object_ids"] == object_id)[0])
+        start, end = entry["offsets"][position], entry["offsets"][position + 1]
+        offsets = np.array([0, end - start], dtype=np.int64)
+        return decode_rle(offsets, entry["runs"][start:end], self.height, self.width)[0]
+
+    def get_boxes(self, frame_idx: int) -> np.ndarray:
+        """(N, 4) xyxy boxes of a frame, in object_ids order"""
+        return self._entry(frame_idx)["boxes"]
+
+    def get_areas(self, frame_idx: int) -> np.ndarray:
+        """(N,) mask areas in pixels of a frame, in object_ids order"""
+        return self._entry(frame_idx)["areas"]
+
+    def iter_frames(self) -> Iterator[FrameMasks]:
+        """Yield decoded frames in ascending frame order"""
+        for frame_idx in self.frame_indices():
+            entry = self._entry(frame_idx)
+            yield FrameMasks(
+                frame_idx=frame_idx,
+                object_ids=entry["object_ids"].tolist(),
+                masks=decode_rle(entry["offsets"], entry["runs"], self.height, self.width),
+                boxes=entry["boxes"],
+                areas=entry["areas"],
+                centroids=entry.get("centroids"),
+            )
+
+    def object_track(self, object_id: int) -> Dict[int, Dict]:
+        """
+        Per-frame box, area and centroid of one object, without decoding any mask
+
+        Returns:
+            Mapping of frame index to {"bbox": [x1, y1, x2, y2], "area": int} plus
+            "centroid": [x, y] when centroids were stored
+        """
+        return self.object_tracks([object_id])[object_id]
+
+    def object_tracks(self, object_ids: Optional[List[int]] = None) -> Dict[int, Dict[int, Dict]]:
+        """
+        Tracks of several objects, built in a single pass over the stored frames
+
+        Each frame entry (an npz file when spilling) is read once for all objects,
+        so exporting every track costs one read per frame.
+
+        Args:
+            object_ids: Objects to collect; all stored objects if omitted
+
+        Returns:
+            Mapping of object ID to its object_track
+        """
+        tracks = {object_id: {} for object_id in object_ids} if object_ids is not None else {}
+        for frame_idx in self.frame_indices():
+            entry = self._entry(frame_idx)
+            for position, object_id in enumerate(entry["object_ids"].tolist()):
+                if object_ids is not None and object_id not in tracks:
+                    continue
+                if entry["areas"][position] <= 0:
+                    continue
+                point = {
+                    "bbox": entry["boxes"][position].tolist(),
+                    "area": int(entry["areas"][position]),
+                }
+                if "centroids" in entry:
+                    point["centroid"] = entry["centroids"][position].tolist()
+                tracks.setdefault(object_id, {})[frame_idx] = point
+        return tracks
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held in memory by the encoded masks"""
+        return sum(
+            array.nbytes for entry in self._frames.values()
+            for array in entry.values() if isinstance(array, np.ndarray)
+        )
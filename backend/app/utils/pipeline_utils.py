@@ -0,0 +1,82 @@
+import queue
+import threading
+from typing import Callable, Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+_END = object()
+
+class _Aborted(Exception):
+    """Raised inside the consumer when the producer fails"""
+
+def _iter_queue(items: queue.Queue) -> Iterator:
+    while True:
+        item = items.get()
+        if item is _END:
+            return
+        if isinstance(item, _Aborted):
+            raise item
+        yield item
+
+def run_pipelined(producer: Iterable, consumer: Callable[[Iterable], T], max_queue: int = 16) -> T:
+    """
+    Overlap a producer and a consumer through a bounded queue
+
+    The producer is iterated in the calling thread (e.g. model inference), while the
+    consumer runs in a background thread over the items as they arrive (e.g.
+    rendering and encoding). Total time approaches max(producer, consumer) instead of
+    their sum, and at most max_queue items are buffered between them.
+
+    Args:
+        producer: Iterable of items, consumed in order
+        consumer: Function that takes an iterable of items and returns a result
+        max_queue: Maximum number of items waiting for the consumer
+
+    Returns:
+        The consumer's return value
+
+    Raises:
+        Whatever the producer or the consumer raised; the other side is stopped
+    """
+    items = queue.Queue(maxsize=max(1, max_queue))
+    outcome = {}
+
+    def consume():
+        try:
+            outcome["result"] = consumer(_iter_queue(items))
+        except BaseException as e:
+            outcome["error"] = e
+        finally:
+            # Unblock a producer waiting on a full queue
+            while True:
+                try:
+                    items.get_nowait()
+                except queue.Empty:
+                    break
+
+    consumer_thread = threading.Thread(target=consume, name="pipeline-consumer", daemon=True)
+    consumer_thread.start()
+
+    def put(item):
+        while consumer_thread.is_alive():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        for item in producer:
+            if not put(item):
+                break
+    except BaseException as e:
+        put(_Aborted(str(e)))
+        consumer_thread.join()
+        raise
+    put(_END)
+    consumer_thread.join()
+
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
@@ -0,0 +1,186 @@
+import cv2
+import logging
+import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.utils.frame_store import FrameStore, InMemoryFrameStore
+from app.utils.mask_store import FrameMasks
+from app.utils.track_utils import masks_to_boxes
+
+# Per-process render state, set by the pool initializer
+_worker_state = {}
+
+class MaskRenderer:
+    """
+    Draws tracked masks, boxes and labels onto frames
+
+    Built once per task. Object colors come from a precomputed lookup table, and all
+    masks of a frame are merged into a single label map and blended in one pass, so
+    the cost of the overlay barely depends on the number of objects.
+    """
+
+    def __init__(self, id_to_objects: Dict[int, str], mask_opacity: float = 0.5,
+                 box_thickness: int = 2, text_scale: float = 0.5, text_thickness: int = 1,
+                 text_padding: int = 4):
+        self.id_to_objects = dict(id_to_objects)
+        self.mask_opacity = mask_opacity
+        self.box_thickness = box_thickness
+        self.text_scale = text_scale
+        self.text_thickness = text_thickness
+        self.text_padding = text_padding
+        self.colors = np.zeros((1, 3), dtype=np.uint8)
+        self._ensure_colors(max(self.id_to_objects, default=0))
+
+    def _ensure_colors(self, max_object_id: int):
+        """Grow the BGR color lookup table to cover max_object_id (index 0 is background)"""
+        if max_object_id < len(self.colors):
+            return
+
+        object_ids = np.arange(max_object_id + 1)
+        # Golden-ratio hue steps keep neighbouring IDs visually distinct
+        hues = (object_ids * 0.618033988749895 % 1.0) * 180
+        hsv = np.stack([
+            hues,
+            np.full_like(hues, 200),
+            np.full_like(hues, 255)
+        ], axis=-1).astype(np.uint8)[None]
+        self.colors = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)[0]
+        self.colors[0] = 0
+
+    def label_map(self, masks: np.ndarray) -> np.ndarray:
+        """
+        Merge per-object masks into one (H, W) map in a single vectorized pass
+
+        Values are 1-based positions into the frame's object list (0 where no object).
+        Where masks overlap, the object listed last wins.
+        """
+        dtype = np.uint8 if len(masks) < 256 else np.uint16
+        ranks = np.arange(1, len(masks) + 1, dtype=dtype)
+        if masks.dtype == bool and dtype == np.uint8:
+            masks = masks.view(np.uint8)
+        return (masks.astype(dtype, copy=False) * ranks[:, None, None]).max(axis=0)
+
+    def render(self, frame: np.ndarray, object_ids: List[int], masks: np.ndarray,
+               boxes: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Annotate one frame
+
+        Args:
+            frame: BGR frame (left untouched)
+            object_ids: IDs of the objects in masks
+            masks: Boolean masks of shape (N, H, W)
+            boxes: Optional (N, 4) xyxy boxes; computed from masks if omitted
+
+        Returns:
+            Annotated copy of the frame
+        """
+        annotated_frame = frame.copy()
+        if len(object_ids) == 0:
+            return annotated_frame
+
+        masks = masks.reshape(len(object_ids), *frame.shape[:2])
+        self._ensure_colors(max(object_ids))
+
+        # Masks: one label map, one color lookup and one blend for all objects
+        label_map = self.label_map(masks)
+        frame_colors = np.zeros((max(256, len(object_ids) + 1), 3), dtype=np.uint8)
+        frame_colors[1:len(object_ids) + 1] = self.colors[object_ids]
+        if label_map.dtype == np.uint8:
+            overlay = cv2.LUT(cv2.merge([label_map] * 3), frame_colors[:256].reshape(256, 1, 3))
+            covered = label_map
+        else:
+            overlay = frame_colors[label_map]
+            covered = (label_map > 0).view(np.uint8)
+        blended = cv2.addWeighted(frame, 1 - self.mask_opacity, overlay, self.mask_opacity, 0)
+        cv2.copyTo(blended, covered, annotated_frame)
+
+        # Boxes and labels: cheap primitives, drawn per visible object
+        if boxes is None:
+            boxes = masks_to_boxes(masks)
+        visible = masks.reshape(len(object_ids), -1).any(axis=1)
+        for object_id, box, is_visible in zip(object_ids, boxes, visible):
+            if is_visible:
+                self._draw_box_and_label(annotated_frame, object_id, box)
+
+        return annotated_frame
+
+    def render_frame(self, frame_store: FrameStore, frame: FrameMasks) -> np.ndarray:
+        """Annotate a stored frame with its tracked masks"""
+        return self.render(frame_store[frame.frame_idx], frame.object_ids, frame.masks, frame.boxes)
+
+    def _draw_box_and_label(self, frame: np.ndarray, object_id: int, box: np.ndarray):
+        color = tuple(int(c) for c in self.colors[object_id])
+        x1, y1, x2, y2 = (int(round(v)) for v in box)
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, self.box_thickness)
+
+        label = self.id_to_objects.get(object_id, f"Object_{object_id}")
+        (text_w, text_h), baseline = cv2.getTextSize(
+            label, cv2.FONT_HERSHEY_SIMPLEX, self.text_scale, self.text_thickness
+        )
+        label_h = text_h + baseline + 2 * self.text_padding
+        top = max(y1 - label_h, 0)
+        cv2.rectangle(frame, (x1, top), (x1 + text_w + 2 * self.text_padding, top + label_h), color, -1)
+        cv2.putText(
+            frame, label, (x1 + self.text_padding, top + self.text_padding + text_h),
+            cv2.FONT_HERSHEY_SIMPLEX, self.text_scale, (255, 255, 255), self.text_thickness, cv2.LINE_AA
+        )
+
+def _init_render_worker(frame_store: FrameStore, renderer: MaskRenderer):
+    _worker_state["frame_store"] = frame_store
+    _worker_state["renderer"] = renderer
+
+def _render_in_worker(frame: FrameMasks) -> np.ndarray:
+    return _worker_state["renderer"].render_frame(_worker_state["frame_store"], frame)
+
+def render_frames(frame_store: FrameStore, frame_masks: Iterable[FrameMasks], renderer: MaskRenderer,
+                  workers: int = 1, backend: str = "thread") -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Annotate frames in parallel and yield them in input order
+
+    At most two frames per worker are in flight, so memory stays bounded while the
+    consumer (usually the video encoder) keeps up. frame_masks may be a lazy
+    stream, e.g. masks arriving from SAM2 propagation.
+
+    Args:
+        frame_store: Source frames
+        frame_masks: FrameMasks in frame order
+        renderer: Renderer shared by all frames of the task
+        workers: Number of render workers; 1 renders in the calling thread
+        backend: "thread" or "process"
+
+    Yields:
+        (frame_idx, annotated_frame) tuples in the order they were given
+    """
+    if workers <= 1:
+        for frame in frame_masks:
+            yield frame.frame_idx, renderer.render_frame(frame_store, frame)
+        return
+
+    if backend == "process" and isinstance(frame_store, InMemoryFrameStore):
+        # Each worker process would receive its own copy of every decoded frame
+        logging.warning("In-memory frame store cannot be shared with render processes, using threads")
+        backend = "thread"
+
+    executor_cls = ProcessPoolExecutor if backend == "process" else ThreadPoolExecutor
+    with executor_cls(
+        max_workers=workers,
+        initializer=_init_render_worker,
+        initargs=(frame_store, renderer)
+    ) as executor:
+        pending = deque()
+        for frame in frame_masks:
+            if backend == "process":
+                future = executor.submit(_render_in_worker, frame)
+            else:
+                future = executor.submit(renderer.render_frame, frame_store, frame)
+            pending.append((frame.frame_idx, future))
+
+            if len(pending) >= workers * 2:
+                done_idx, done_future = pending.popleft()
+                yield done_idx, done_future.result()
+
+        while pending:
+            done_idx, done_future = pending.popleft()
+            yield done_idx, done_future.result()
@@ -0,0 +1,101 @@
+import threading
+from typing import Any, Dict, List, Optional
+
+import torch
+
+from app.utils.cache_utils import ByteBudgetLRU
+
+class GroundingTextCache:
+    """
+    Grounding DINO text-encoder outputs, reused per caption across calls
+
+    Grounding DINO runs its BERT text branch on every forward pass although jobs
+    draw their prompts from a small vocabulary. install() records the captions a
+    model call is made with and wraps the text encoder so that, in inference mode,
+    each row of the batch is looked up by its caption and only the missing rows are
+    encoded. A caption is therefore reused whatever it is batched with. Rows are
+    stored without padding and padded back to the batch's length with zeros; those
+    positions are outside the text attention mask, which Grounding DINO applies to
+    every later use of the features. Least recently used captions are evicted
+    beyond max_bytes.
+    """
+
+    def __init__(self, max_bytes: int):
+        self._entries = ByteBudgetLRU(max_bytes)
+        self._calls = threading.local()
+
+    @classmethod
+    def attach(cls, grounding_model, max_bytes: int) -> "GroundingTextCache":
+        """The cache installed on a model, installing a new one if there is none"""
+        existing = getattr(grounding_model.bert, "text_feature_cache", None)
+        if existing is not None:
+            return existing
+        cache = cls(max_bytes)
+        cache.install(grounding_model)
+        return cache
+
+    def install(self, grounding_model):
+        """Route a Grounding DINO model's text encoder through the cache"""
+        text_encoder = grounding_model.bert
+        encode = text_encoder.forward
+        model_forward = grounding_model.forward
+        tokenizer = getattr(grounding_model, "tokenizer", None)
+        pad_token_id = getattr(tokenizer, "pad_token_id", None) or 0
+
+        def forward_with_captions(*args, **kwargs):
+            previous = getattr(self._calls, "captions", None)
+            self._calls.captions = kwargs.get("captions")
+            try:
+                return model_forward(*args, **kwargs)
+            finally:
+                self._calls.captions = previous
+
+        def forward(*args, **inputs):
+            captions = getattr(self._calls, "captions", None)
+            input_ids = inputs.get("input_ids")
+            if (args or torch.is_grad_enabled() or captions is None or input_ids is None
+                    or len(captions) != input_ids.shape[0]):
+                return encode(*args, **inputs)
+            return {"last_hidden_state": self._encode_rows(encode, list(captions), inputs, pad_token_id)}
+
+        grounding_model.forward = forward_with_captions
+        text_encoder.forward = forward
+        text_encoder.text_feature_cache = self
+
+    def _encode_rows(self, encode, captions: List[str], inputs: Dict[str, Any], pad_token_id: int) -> torch.Tensor:
+        rows: List[Optional[torch.Tensor]] = [self._entries.get(caption) for caption in captions]
+
+        missing = {}
+        for row, caption in enumerate(captions):
+            if rows[row] is None:
+                missing.setdefault(caption, row)
+        if missing:
+            batch_rows = list(missing.values())
+            subset = {
+                name: value[batch_rows] if isinstance(value, torch.Tensor) else value
+                for name, value in inputs.items()
+            }
+            hidden = encode(**subset)["last_hidden_state"]
+            lengths = (inputs["input_ids"][batch_rows] != pad_token_id).sum(dim=1).tolist()
+            encoded = {}
+            for (caption, _), features, length in zip(missing.items(), hidden, lengths):
+                encoded[caption] = features[:length].clone()
+                self._entries.put(caption, encoded[caption], self._nbytes(encoded[caption]))
+            rows = [encoded[caption] if row is None else row for row, caption in zip(rows, captions)]
+
+        batch_size, seq_len = inputs["input_ids"].shape[:2]
+        output = rows[0].new_zeros((batch_size, seq_len, rows[0].shape[-1]))
+        for i, row in enumerate(rows):
+            output[i, :row.shape[0]] = row
+        return output
+
+    def stats(self) -> Dict[str, Any]:
+        """Entry count, bytes held, hit/miss counters and hit rate"""
+        stats = self._entries.stats()
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    @staticmethod
+    def _nbytes(features: torch.Tensor) -> int:
+        return features.numel() * features.element_size()
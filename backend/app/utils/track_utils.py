@@ -31,6 +31,35 @@ def sample_points_from_masks(masks, num_points=10):
             points.append(np.array([]).reshape(0, 2))
     return points
 
+def masks_to_boxes(masks):
+    """
+    Compute bounding boxes for a stack of binary masks in one vectorized pass
+    
+    Args:
+        masks: numpy array of shape (N, H, W)
+    
+    Returns:
+        Array of shape (N, 4) with [x1, y1, x2, y2] boxes (zeros for empty masks)
+    """
+    masks = np.asarray(masks)
+    if masks.dtype != bool:
+        masks = masks > 0.5
+    boxes = np.zeros((masks.shape[0], 4), dtype=np.float32)
+    if masks.shape[0] == 0:
+        return boxes
+    
+    rows = masks.any(axis=2)
+    cols = masks.any(axis=1)
+    present = rows.any(axis=1)
+    
+    height, width = masks.shape[1:]
+    boxes[:, 0] = cols.argmax(axis=1)
+    boxes[:, 1] = rows.argmax(axis=1)
+    boxes[:, 2] = width - 1 - cols[:, ::-1].argmax(axis=1)
+    boxes[:, 3] = height - 1 - rows[:, ::-1].argmax(axis=1)
+    boxes[~present] = 0
+    return boxes
+
 def filter_detections_by_confidence(boxes, confidences, labels, threshold=0.5):
     """
     Filter detections based on confidence threshold
@@ -59,4 +88,67 @@ def compute_mask_centroid(mask):
         centroid_y = np.mean(y_indices)
         return np.array([centroid_x, centroid_y])
     else:
-        return np.array([0.0, 0.0])
\ No newline at end of file
+        return np.array([0.0, 0.0])
+
+def box_iou(boxes_a, boxes_b):
+    """
+    Pairwise intersection over union of two sets of boxes
+    
+    Args:
+        boxes_a: array of shape (N, 4) with [x1, y1, x2, y2] boxes
+        boxes_b: array of shape (M, 4) with [x1, y1, x2, y2] boxes
+    
+    Returns:
+        Array of shape (N, M)
+    """
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    intersection = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    area_a = (boxes_a[:, 2:] - boxes_a[:, :2]).clip(0).prod(axis=1)
+    area_b = (boxes_b[:, 2:] - boxes_b[:, :2]).clip(0).prod(axis=1)
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-9), 0.0)
+
+def scene_cut_frames(frames, threshold, size=32):
+    """
+    Find the frames that start a new scene
+    
+    Consecutive frames are compared on coarse grayscale thumbnails, so a cut is a
+    large change of the whole picture rather than of a moving object.
+    
+    Args:
+        frames: iterable of (H, W, 3) frames in order
+        threshold: mean absolute thumbnail difference (0-255) that marks a cut
+        size: approximate thumbnail side length
+    
+    Returns:
+        Indices of the first frame of every scene after the first one
+    """
+    cuts = []
+    previous = None
+    for frame_idx, frame in enumerate(frames):
+        height, width = frame.shape[:2]
+        thumbnail = frame[::max(1, height // size), ::max(1, width // size)].mean(axis=2)
+        if previous is not None and thumbnail.shape == previous.shape:
+            if np.abs(thumbnail - previous).mean() > threshold:
+                cuts.append(frame_idx)
+        previous = thumbnail
+    return cuts
+
+def select_keyframes(num_frames, interval=0, scene_cuts=()):
+    """
+    Frames after the first one to run detection on
+    
+    Args:
+        num_frames: number of frames in the video
+        interval: detect on every interval-th frame (0 disables)
+        scene_cuts: frame indices where a new scene starts
+    
+    Returns:
+        Sorted frame indices, excluding frame 0
+    """
+    keyframes = set(range(interval, num_frames, interval)) if interval > 0 else set()
+    keyframes.update(frame_idx for frame_idx in scene_cuts if 0 < frame_idx < num_frames)
+    return sorted(keyframes)
@@ -2,19 +2,18 @@ import cv2
 import os
 import logging
 from pathlib import Path
-from typing import List, Optional
+from typing import Iterable, Iterator, List, Optional
 
-def read_video_frames(video_path: str) -> List:
+def iter_video_frames(video_path: str) -> Iterator:
     """
-    Read all frames from a video file
+    Yield frames from a video file one at a time
     
     Args:
         video_path: Path to the video file
     
-    Returns:
-        List of video frames
+    Yields:
+        Video frames in decode order
     """
-    frames = []
     cap = cv2.VideoCapture(video_path)
     
     if not cap.isOpened():
@@ -25,11 +24,21 @@ def read_video_frames(video_path: str) -> List:
             ret, frame = cap.read()
             if not ret:
                 break
-            frames.append(frame)
+            yield frame
     finally:
         cap.release()
+
+def read_video_frames(video_path: str) -> List:
+    """
+    Read all frames from a video file
     
-    return frames
+    Args:
+        video_path: Path to the video file
+    
+    Returns:
+        List of video frames
+    """
+    return list(iter_video_frames(video_path))
 
 def get_video_info(video_path: str) -> dict:
     """
@@ -62,6 +71,76 @@ def get_video_info(video_path: str) -> dict:
     finally:
         cap.release()
 
+class VideoWriter:
+    """
+    Streaming video writer that encodes frames as they arrive
+    
+    The underlying encoder is opened on the first frame, so memory stays flat
+    regardless of video length. `write` can be used directly as a frame callback.
+    
+    Example:
+        with VideoWriter(output_path, fps=25) as writer:
+            for frame in frames:
+                writer.write(frame)
+    """
+    
+    def __init__(self, output_path: str, fps: float = 30, fourcc: str = 'mp4v'):
+        self.output_path = output_path
+        self.fps = fps
+        self.fourcc = fourcc
+        self.frame_count = 0
+        self.frame_size = None
+        self._writer = None
+    
+    def write(self, frame):
+        """Encode a single frame"""
+        height, width = frame.shape[:2]
+        if self._writer is None:
+            # Ensure output directory exists
+            Path(self.output_path).parent.mkdir(parents=True, exist_ok=True)
+            self.frame_size = (width, height)
+            self._writer = cv2.VideoWriter(
+                self.output_path, cv2.VideoWriter_fourcc(*self.fourcc), self.fps, self.frame_size
+            )
+            if not self._writer.isOpened():
+                raise ValueError(f"Could not open video writer: {self.output_path}")
+        elif (width, height) != self.frame_size:
+            raise ValueError(f"Frame size {(width, height)} does not match video size {self.frame_size}")
+        
+        self._writer.write(frame)
+        self.frame_count += 1
+    
+    def close(self):
+        """Finish encoding and release the writer"""
+        if self._writer is not None:
+            self._writer.release()
+            self._writer = None
+            logging.info(f"Video saved to: {self.output_path}")
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def save_video_stream(frames: Iterable, output_path: str, fps: float = 30) -> int:
+    """
+    Save frames from any iterable (e.g. a generator) as a video file
+    
+    Args:
+        frames: Iterable of video frames, consumed one at a time
+        output_path: Output video file path
+        fps: Frames per second for output video
+    
+    Returns:
+        Number of frames written (no file is created when this is 0)
+    """
+    with VideoWriter(output_path, fps=fps) as writer:
+        for frame in frames:
+            writer.write(frame)
+    
+    return writer.frame_count
+
 def save_video(frames: List, output_path: str, fps: float = 30):
     """
     Save frames as a video file
@@ -74,28 +153,17 @@ def save_video(frames: List, output_path: str, fps: float = 30):
     if not frames:
         raise ValueError("No frames to save")
     
-    # Ensure output directory exists
-    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
-    
-    height, width = frames[0].shape[:2]
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
-    
-    try:
-        for frame in frames:
-            out.write(frame)
-        logging.info(f"Video saved to: {output_path}")
-    finally:
-        out.release()
+    save_video_stream(frames, output_path, fps)
 
-def create_video_from_images(image_dir: str, output_path: str, fps: float = 30):
+def iter_images_from_dir(image_dir: str) -> Iterator:
     """
-    Create a video from a directory of images
+    Yield images from a directory one at a time, in numeric filename order
     
     Args:
         image_dir: Directory containing images
-        output_path: Output video file path
-        fps: Frames per second for output video
+    
+    Yields:
+        Loaded images; unreadable files are skipped
     """
     # Get all image files and sort them
     image_extensions = {'.png', '.jpg', '.jpeg', '.bmp', '.tiff'}
@@ -115,19 +183,27 @@ def create_video_from_images(image_dir: str, output_path: str, fps: float = 30):
         # Fallback to alphabetical sort if numeric sort fails
         images.sort()
     
-    frames = []
     for image in images:
         img_path = os.path.join(image_dir, image)
         frame = cv2.imread(img_path)
         if frame is not None:
-            frames.append(frame)
+            yield frame
         else:
             logging.warning(f"Could not read image: {img_path}")
+
+def create_video_from_images(image_dir: str, output_path: str, fps: float = 30):
+    """
+    Create a video from a directory of images
     
-    if not frames:
-        raise ValueError("No valid frames could be loaded from images")
+    Images are streamed into the encoder one at a time.
     
-    save_video(frames, output_path, fps)
+    Args:
+        image_dir: Directory containing images
+        output_path: Output video file path
+        fps: Frames per second for output video
+    """
+    if save_video_stream(iter_images_from_dir(image_dir), output_path, fps) == 0:
+        raise ValueError("No valid frames could be loaded from images")
 
 def resize_frame(frame, target_width: Optional[int] = None, target_height: Optional[int] = None, 
                  maintain_aspect: bool = True):
@@ -0,0 +1,64 @@
+"""
+Celery worker for the tracking pipeline
+
+With EXECUTION_MODE=celery, /api/track enqueues jobs on the Redis broker and
+separate worker processes (possibly on other hosts) run them. Each worker
+process (one per --concurrency slot) loads the models once and then consumes jobs:
+
+    celery -A app.worker worker --concurrency=1 -Q tracking
+
+UPLOAD_FOLDER, TEMP_FRAMES_DIR and OUTPUT_FOLDER must be shared between the API
+and the workers (e.g. a common volume), since jobs refer to files by path.
+"""
+import logging
+from typing import List, Optional
+from celery import Celery
+from celery.signals import worker_process_init
+
+from app.config import Config
+
+config = Config()
+
+celery_app = Celery(
+    "grounded_sam2",
+    broker=config.CELERY_BROKER_URL,
+)
+celery_app.conf.update(
+    task_default_queue=config.CELERY_QUEUE,
+    task_always_eager=config.CELERY_TASK_ALWAYS_EAGER,
+    task_ignore_result=True,
+    # A job is long and memory heavy: take one at a time, ack only when done
+    task_acks_late=True,
+    worker_prefetch_multiplier=1,
+)
+
+_tracking_service = None
+
+def get_tracking_service():
+    """Get the worker's TrackingService, loading models on first use"""
+    global _tracking_service
+    if _tracking_service is None:
+        from app.services.tracking_service import TrackingService
+        _tracking_service = TrackingService()
+    return _tracking_service
+
+@worker_process_init.connect
+def load_models_on_start(**kwargs):
+    """Load models when the worker process starts instead of on the first job"""
+    get_tracking_service()
+    logging.info("Tracking worker ready")
+
+@celery_app.task(name="tracking.process_video")
+def process_video(task_id: str, video_path: str, text_prompt: Optional[str] = None,
+                  box_threshold: float = 0.35, text_threshold: float = 0.25,
+                  text_prompts: Optional[List[str]] = None):
+    """Run one tracking job; progress and results are reported through Redis task status"""
+    get_tracking_service().start_tracking(
+        task_id=task_id,
+        video_path=video_path,
+        text_prompt=text_prompt,
+        box_threshold=box_threshold,
+        text_threshold=text_threshold,
+        text_prompts=text_prompts
+    )
+    return task_id
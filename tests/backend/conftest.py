@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# The backend imports itself as the top-level `app` package
+BACKEND_DIR = Path(__file__).parent.parent.parent / "backend"
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
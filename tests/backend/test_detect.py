@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api import tracking
+from app.main import app
+from app.models.schemas import ImageDetectionResponse
+from app.services.micro_batcher import MicroBatcher
+
+client = TestClient(app)
+
+def test_concurrent_requests_share_a_batch():
+    batches = []
+    
+    def process_batch(items):
+        batches.append(list(items))
+        return [ValueError("bad item") if item == "bad" else item * 2 for item in items]
+    
+    batcher = MicroBatcher(process_batch, max_batch_size=4, max_wait=0.5)
+    
+    async def submit_all():
+        return await asyncio.gather(
+            *(batcher.submit(item) for item in [1, 2, "bad", 3, 4]),
+            return_exceptions=True
+        )
+    
+    results = asyncio.run(submit_all())
+    batcher.shutdown()
+    
+    assert [len(batch) for batch in batches] == [4, 1]
+    assert results[:2] == [2, 4] and results[3:] == [6, 8]
+    assert isinstance(results[2], ValueError)
+    assert batcher.stats()["mean_batch_size"] == 2.5
+
+def test_lone_request_waits_at_most_max_wait():
+    batcher = MicroBatcher(lambda items: items, max_batch_size=64, max_wait=0.01)
+    
+    async def submit_one():
+        return await asyncio.wait_for(batcher.submit("x"), timeout=2)
+    
+    assert asyncio.run(submit_one()) == "x"
+    batcher.shutdown()
+
+def test_detect_endpoint_returns_batched_result(monkeypatch):
+    def process_batch(requests):
+        return [
+            ImageDetectionResponse(width=4, height=2, detections=[]) if request["image"] == b"ok"
+            else ValueError("Could not decode image")
+            for request in requests
+        ]
+    
+    monkeypatch.setattr(tracking.file_handler.config, "EXECUTION_MODE", "local")
+    monkeypatch.setattr(tracking.detection_batcher, "process_batch", process_batch)
+    
+    response = client.post("/api/detect", files={"file": ("a.jpg", b"ok")}, data={"text_prompt": "car."})
+    assert response.status_code == 200
+    assert response.json() == {"width": 4, "height": 2, "detections": []}
+    
+    response = client.post("/api/detect", files={"file": ("b.jpg", b"junk")}, data={"text_prompt": "car."})
+    assert response.status_code == 400
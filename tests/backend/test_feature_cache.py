@@ -0,0 +1,131 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from app.utils.cache_utils import ByteBudgetLRU
+from app.utils.feature_cache import SAM2FeatureCache, SAM2ImageEmbeddingCache
+
+class FakeVideoPredictor:
+    """Mirrors SAM2VideoPredictor's one-frame feature cache around forward_image"""
+    
+    def __init__(self):
+        self.encoded = 0
+    
+    def forward_image(self, image):
+        self.encoded += 1
+        fpn = [image.mean() + torch.zeros(1, 8, 16, 16), image.mean() + torch.zeros(1, 8, 8, 8)]
+        return {"vision_features": fpn[-1], "vision_pos_enc": [torch.ones(1, 8, 16, 16), torch.ones(1, 8, 8, 8)], "backbone_fpn": fpn}
+    
+    def _get_image_feature(self, inference_state, frame_idx, batch_size):
+        image, backbone_out = inference_state["cached_features"].get(frame_idx, (None, None))
+        if backbone_out is None:
+            image = inference_state["images"][frame_idx].float().unsqueeze(0)
+            backbone_out = self.forward_image(image)
+            inference_state["cached_features"] = {frame_idx: (image, backbone_out)}
+        return image, backbone_out["backbone_fpn"][-1]
+
+def run_job(predictor, cache, video_key, frames):
+    inference_state = {"images": frames, "device": torch.device("cpu"), "cached_features": {}}
+    with cache.bind(video_key):
+        return [predictor._get_image_feature(inference_state, i, 1)[1] for i in range(len(frames))]
+
+@pytest.mark.parametrize("on_disk", [False, True])
+def test_second_job_on_a_video_skips_the_encoder(tmp_path, on_disk):
+    frames = torch.rand(5, 3, 4, 4)
+    predictor = FakeVideoPredictor()
+    cache = SAM2FeatureCache(1 << 20, cache_dir=str(tmp_path) if on_disk else None)
+    cache.install(predictor)
+    
+    first = run_job(predictor, cache, "video-a", frames)
+    assert predictor.encoded == 5
+    
+    second = run_job(predictor, cache, "video-a", frames)
+    assert predictor.encoded == 5
+    assert all(torch.equal(a, b) for a, b in zip(first, second))
+    
+    run_job(predictor, cache, "video-b", frames)
+    assert predictor.encoded == 10
+
+def test_restarted_process_reuses_features_on_disk(tmp_path):
+    frames = torch.rand(5, 3, 4, 4)
+    predictor = FakeVideoPredictor()
+    cache = SAM2FeatureCache(1 << 20, cache_dir=str(tmp_path))
+    cache.install(predictor)
+    run_job(predictor, cache, "video-a", frames)
+    
+    restarted = FakeVideoPredictor()
+    restarted_cache = SAM2FeatureCache(1 << 20, cache_dir=str(tmp_path))
+    restarted_cache.install(restarted)
+    run_job(restarted, restarted_cache, "video-a", frames)
+    
+    # Only the first frame is encoded, to recover the positional encodings
+    assert restarted.encoded == 1
+
+def test_byte_budget_lru_evicts_least_recently_used():
+    evicted = []
+    lru = ByteBudgetLRU(100, on_evict=lambda key, value: evicted.append(key))
+    lru.put("a", 1, 40)
+    lru.put("b", 2, 40)
+    lru.get("a")
+    lru.put("c", 3, 40)
+    
+    assert evicted == ["b"]
+    assert lru.nbytes == 80
+    assert not lru.put("huge", 4, 101)
+
+class FakeImagePredictor:
+    """Mirrors the per-image state of SAM2ImagePredictor"""
+    
+    def __init__(self):
+        self.encoded = 0
+        self.reset_predictor()
+    
+    def reset_predictor(self):
+        self._features = None
+        self._orig_hw = None
+        self._is_image_set = False
+    
+    def set_image(self, image):
+        self.encoded += 1
+        self._orig_hw = [image.shape[:2]]
+        self._features = {
+            "image_embed": torch.full((1, 8, 4, 4), float(image.mean())),
+            "high_res_feats": [torch.zeros(1, 2, 16, 16), torch.zeros(1, 4, 8, 8)],
+        }
+        self._is_image_set = True
+    
+    def set_image_batch(self, images):
+        self.encoded += len(images)
+        self._orig_hw = [image.shape[:2] for image in images]
+        self._features = {
+            "image_embed": torch.stack([torch.full((8, 4, 4), float(image.mean())) for image in images]),
+            "high_res_feats": [torch.zeros(len(images), 2, 16, 16), torch.zeros(len(images), 4, 8, 8)],
+        }
+        self._is_image_set = True
+
+def test_same_image_reuses_its_embedding():
+    predictor = FakeImagePredictor()
+    cache = SAM2ImageEmbeddingCache(1 << 20)
+    image = np.full((6, 10, 3), 7, dtype=np.uint8)
+    
+    assert not cache.set_image(predictor, image)
+    assert not cache.set_image(predictor, np.zeros_like(image))
+    assert cache.set_image(predictor, image.copy())
+    
+    assert predictor.encoded == 2
+    assert predictor._is_image_set and predictor._orig_hw == [(6, 10)]
+    assert float(predictor._features["image_embed"].mean()) == 7
+
+def test_batch_only_encodes_new_images():
+    predictor = FakeImagePredictor()
+    cache = SAM2ImageEmbeddingCache(1 << 20)
+    seen, new = np.full((6, 10, 3), 1, dtype=np.uint8), np.full((4, 4, 3), 2, dtype=np.uint8)
+    cache.set_image(predictor, seen)
+    
+    assert cache.set_image_batch(predictor, [new, seen, new]) == 2
+    
+    assert predictor.encoded == 2
+    assert predictor._is_batch and predictor._orig_hw == [(4, 4), (6, 10), (4, 4)]
+    assert predictor._features["image_embed"][:, 0, 0, 0].tolist() == [2, 1, 2]
+    assert [t.shape[0] for t in predictor._features["high_res_feats"]] == [3, 3]
@@ -0,0 +1,108 @@
+import asyncio
+import hashlib
+import io
+import os
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+from app.services.file_handler import FileHandler
+
+@pytest.fixture
+def file_handler(tmp_path, monkeypatch):
+    handler = FileHandler()
+    monkeypatch.setattr(handler.config, "UPLOAD_FOLDER", str(tmp_path))
+    monkeypatch.setattr(handler.config, "UPLOAD_CHUNK_SIZE", 1000)
+    monkeypatch.setattr(handler.config, "MAX_FILE_SIZE", 10_000)
+    return handler
+
+def test_upload_streams_to_disk_and_hashes(file_handler):
+    content = os.urandom(9_500)
+    upload = UploadFile(file=io.BytesIO(content), filename="clip.mp4")
+    
+    file_id, file_path, sha256 = asyncio.run(file_handler.save_upload_file(upload))
+    
+    assert file_id == sha256 == hashlib.sha256(content).hexdigest()
+    assert file_path.endswith(f"{file_id}.mp4")
+    assert open(file_path, "rb").read() == content
+
+def test_identical_uploads_share_one_file(file_handler, tmp_path):
+    content = os.urandom(5_000)
+    first = asyncio.run(file_handler.save_upload_file(UploadFile(file=io.BytesIO(content), filename="a.mp4")))
+    second = asyncio.run(file_handler.save_upload_file(UploadFile(file=io.BytesIO(content), filename="b.mov")))
+    
+    assert second == first
+    assert os.listdir(tmp_path) == [os.path.basename(first[1])]
+
+def test_oversized_upload_is_aborted(file_handler, tmp_path):
+    upload = UploadFile(file=io.BytesIO(os.urandom(10_001)), filename="clip.mp4")
+    
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(file_handler.save_upload_file(upload))
+    
+    assert error.value.status_code == 400
+    assert os.listdir(tmp_path) == []
+
+def test_frame_caches_are_evicted_least_recently_used_first(file_handler, tmp_path, monkeypatch):
+    monkeypatch.setattr(file_handler.config, "TEMP_FRAMES_DIR", str(tmp_path / "frames"))
+    monkeypatch.setattr(file_handler.config, "FRAME_CACHE_MAX_BYTES", 2_500)
+    monkeypatch.setattr(file_handler.config, "FRAME_CACHE_GRACE_SECONDS", 60)
+    
+    def make_cache(file_id, age, source="mmap"):
+        cache_dir = file_handler.get_frame_cache_dir(f"{file_id}.mp4", source)
+        os.makedirs(cache_dir)
+        with open(os.path.join(cache_dir, "frames.npy"), "wb") as f:
+            f.write(b"\0" * 1_000)
+        stamp = os.path.getmtime(cache_dir) - age
+        os.utime(cache_dir, (stamp, stamp))
+        return cache_dir
+    
+    oldest = make_cache("a", age=500)
+    older = make_cache("b", age=400)
+    current = make_cache("c", age=1_000)
+    recent = make_cache("d", age=10)
+    stale_build = make_cache("e", age=300, source="mmap.tmp")
+    
+    file_handler.evict_frame_caches(keep=[current])
+    
+    assert not os.path.exists(oldest) and not os.path.exists(os.path.dirname(oldest))
+    assert not os.path.exists(older)
+    assert not os.path.exists(stale_build)
+    assert os.path.exists(current) and os.path.exists(recent)
+
+def test_upload_endpoint_rejects_a_large_declared_length_before_reading(monkeypatch, tmp_path):
+    from fastapi.testclient import TestClient
+    from app.api import tracking
+    from app.main import app
+    
+    monkeypatch.setattr(tracking.file_handler.config, "UPLOAD_FOLDER", str(tmp_path))
+    monkeypatch.setattr(tracking.file_handler.config, "MAX_FILE_SIZE", 10_000)
+    client = TestClient(app)
+    
+    response = client.post("/api/upload", files={"file": ("clip.mp4", os.urandom(5_000))})
+    assert response.status_code == 200
+    assert response.json()["sha256"] == response.json()["file_id"]
+    
+    received = []
+    sent = []
+    
+    async def receive():
+        received.append(True)
+        return {"type": "http.request", "body": b"", "more_body": False}
+    
+    async def send(message):
+        sent.append(message)
+    
+    scope = {
+        "type": "http", "method": "POST", "path": "/api/upload", "raw_path": b"/api/upload",
+        "root_path": "", "scheme": "http", "query_string": b"", "server": ("test", 80),
+        "client": ("test", 1), "http_version": "1.1",
+        "headers": [
+            (b"content-type", b"multipart/form-data; boundary=x"),
+            (b"content-length", str(5 * 1024 ** 3).encode()),
+        ],
+    }
+    asyncio.run(app(scope, receive, send))
+    
+    assert sent[0]["status"] == 400
+    assert received == []
@@ -0,0 +1,32 @@
+from fastapi.testclient import TestClient
+
+from app.api import tracking
+from app.main import app
+
+# No context manager: startup events (background model loading) do not run
+client = TestClient(app)
+
+def test_liveness_does_not_wait_for_models(monkeypatch):
+    monkeypatch.setattr(tracking, "model_status", lambda: "loading")
+    
+    assert client.get("/api/health/live").status_code == 200
+    
+    response = client.get("/api/health/ready")
+    assert response.status_code == 503
+    assert response.json()["model_status"] == "loading"
+
+def test_ready_once_models_are_warm(monkeypatch):
+    monkeypatch.setattr(tracking, "model_status", lambda: "ready")
+    
+    response = client.get("/api/health/ready")
+    assert response.status_code == 200
+    assert client.get("/api/health").json()["ready"] is True
+
+def test_lazy_loading_reports_ready_before_models_load(monkeypatch):
+    monkeypatch.setattr(tracking, "model_status", lambda: "not_loaded")
+    monkeypatch.setattr(tracking.file_handler.config, "EXECUTION_MODE", "local")
+    monkeypatch.setattr(tracking.file_handler.config, "PRELOAD_MODELS", False)
+    
+    response = client.get("/api/health/ready")
+    assert response.status_code == 200
+    assert response.json()["model_status"] == "not_loaded"
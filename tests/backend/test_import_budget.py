@@ -0,0 +1,33 @@
+import os
+import subprocess
+import sys
+
+from conftest import BACKEND_DIR
+
+# Cumulative `python -X importtime` budget for the API entry point (measured ~0.7s)
+API_IMPORT_BUDGET_US = 2_000_000
+HEAVY_MODULES = ["torch", "torchvision", "cv2", "supervision", "sam2", "groundingdino"]
+
+def test_api_imports_without_model_stack():
+    script = (
+        "import sys, app.main; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        cwd=BACKEND_DIR,
+        env={**os.environ, "EXECUTION_MODE": "celery"},
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    
+    assert result.stdout.strip() == ""
+    
+    # Lines look like "import time:   self [us] | cumulative | imported package"
+    cumulative = {
+        fields[2].strip(): int(fields[1])
+        for fields in (line.split("|") for line in result.stderr.splitlines())
+        if len(fields) == 3 and fields[1].strip().isdigit()
+    }
+    assert cumulative["app.main"] < API_IMPORT_BUDGET_US
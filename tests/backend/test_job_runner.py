@@ -0,0 +1,96 @@
+import threading
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from fastapi.testclient import TestClient
+
+from app.api import tracking
+from app.main import app
+from app.models.schemas import TaskStatus
+from app.services.job_runner import JobQueueFullError, JobRunner, JobRunnerShutdownError
+
+def test_jobs_run_in_fifo_order_within_the_queue_bound():
+    release = threading.Event()
+    order = []
+    runner = JobRunner(max_concurrent_jobs=1, max_queued_jobs=2)
+    
+    def job(name):
+        release.wait(5)
+        order.append(name)
+    
+    futures = [runner.submit(job, name) for name in ["a", "b", "c"]]
+    assert runner.stats() == {"running": 1, "queued": 2, "max_concurrent_jobs": 1, "max_queued_jobs": 2}
+    with pytest.raises(JobQueueFullError):
+        runner.submit(job, "d")
+    
+    release.set()
+    for future in futures:
+        future.result(timeout=5)
+    assert order == ["a", "b", "c"]
+    
+    # Finished jobs free their slots
+    runner.submit(job, "e").result(timeout=5)
+    runner.shutdown()
+
+def test_jobs_dropped_at_shutdown_are_marked_failed(monkeypatch):
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(tracking.task_store, "redis_client", redis_client)
+    monkeypatch.setattr(tracking.file_handler.config, "EXECUTION_MODE", "local")
+    started, release = threading.Event(), threading.Event()
+    
+    def blocking_job(task_id, **kwargs):
+        started.set()
+        release.wait(5)
+    
+    runner = JobRunner(max_concurrent_jobs=1, max_queued_jobs=1)
+    monkeypatch.setattr(tracking, "job_runner", runner)
+    monkeypatch.setattr(tracking, "run_tracking_job", blocking_job)
+    
+    tracking.submit_tracking_job(task_id="running")
+    assert started.wait(5)
+    tracking.submit_tracking_job(task_id="queued")
+    runner.shutdown(wait=False)
+    
+    queued = tracking.task_store.get_task_status("queued")
+    assert queued.status == TaskStatus.FAILED and "shutting down" in queued.error
+    assert runner.stats()["queued"] == 0
+    with pytest.raises(JobRunnerShutdownError):
+        tracking.submit_tracking_job(task_id="late")
+    release.set()
+
+def test_api_stays_responsive_and_rejects_jobs_beyond_the_queue(monkeypatch, tmp_path):
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(tracking.task_store, "redis_client", redis_client)
+    monkeypatch.setattr(tracking.file_handler.config, "EXECUTION_MODE", "local")
+    monkeypatch.setattr(tracking.file_handler.config, "RESULT_CACHE_ENABLED", False)
+    monkeypatch.setattr(tracking.file_handler, "find_upload", lambda file_id: str(tmp_path / f"{file_id}.mp4"))
+    
+    started, release = threading.Event(), threading.Event()
+    
+    def blocking_job(task_id, **kwargs):
+        tracking.task_store.update_task_status(task_id, TaskStatus.PROCESSING, progress=10)
+        started.set()
+        release.wait(5)
+    
+    runner = JobRunner(max_concurrent_jobs=1, max_queued_jobs=0)
+    monkeypatch.setattr(tracking, "job_runner", runner)
+    monkeypatch.setattr(tracking, "run_tracking_job", blocking_job)
+    client = TestClient(app)
+    form = {"file_id": "abc", "text_prompt": "car.", "box_threshold": 0.35, "text_threshold": 0.25}
+    
+    try:
+        task_id = client.post("/api/track", data=form).json()["task_id"]
+        assert started.wait(5)
+        
+        # The running job does not block the event loop
+        assert client.get(f"/api/status/{task_id}").json()["status"] == "processing"
+        assert client.get("/api/health").json()["jobs"]["running"] == 1
+        
+        rejected = client.post("/api/track", data=form)
+        assert rejected.status_code == 503
+        assert "queue is full" in rejected.json()["detail"]
+    finally:
+        release.set()
+        runner.shutdown()
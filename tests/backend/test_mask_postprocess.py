@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from app.utils.mask_postprocess import MaskPostprocessor
+
+def reference_stats(masks):
+    boxes, areas, centroids = [], [], []
+    for mask in masks:
+        ys, xs = np.nonzero(mask)
+        if len(xs) == 0:
+            boxes.append([0, 0, 0, 0])
+            areas.append(0)
+            centroids.append([0, 0])
+        else:
+            boxes.append([xs.min(), ys.min(), xs.max(), ys.max()])
+            areas.append(len(xs))
+            centroids.append([xs.mean(), ys.mean()])
+    return np.array(boxes), np.array(areas), np.array(centroids)
+
+def test_stats_match_numpy_reference():
+    rng = np.random.default_rng(0)
+    logits = torch.from_numpy(rng.normal(size=(4, 1, 24, 40)).astype(np.float32))
+    logits[1] = -1  # Empty mask
+    logits[2] = -1
+    logits[2, 0, 5:9, 30:33] = 1
+    
+    frame = MaskPostprocessor(pin_memory=False)(7, [3, 5, 8, 9], logits)
+    
+    expected_masks = logits.numpy()[:, 0] > 0
+    boxes, areas, centroids = reference_stats(expected_masks)
+    assert frame.frame_idx == 7 and frame.object_ids == [3, 5, 8, 9]
+    assert np.array_equal(frame.masks, expected_masks)
+    assert np.array_equal(frame.boxes, boxes)
+    assert np.array_equal(frame.areas, areas)
+    assert np.allclose(frame.centroids, centroids, atol=1e-4)
+
+def test_frame_without_objects():
+    frame = MaskPostprocessor(pin_memory=False)(0, [], torch.zeros(0, 1, 24, 40))
+    
+    assert frame.object_ids == []
+    assert frame.masks.shape == (0, 24, 40)
+    assert frame.boxes.shape == (0, 4) and frame.areas.shape == (0,) and frame.centroids.shape == (0, 2)
@@ -0,0 +1,51 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app.utils.mask_store import FrameMasks, TrackMaskStore, decode_rle, encode_rle
+
+def make_masks():
+    masks = np.zeros((3, 24, 32), dtype=bool)
+    masks[0, 2:8, 3:10] = True
+    masks[1, 0, 0] = True
+    masks[1, -1, -1] = True
+    return masks
+
+def test_rle_round_trip():
+    masks = make_masks()
+    offsets, runs = encode_rle(masks)
+    assert np.array_equal(decode_rle(offsets, runs, 24, 32), masks)
+    
+    noisy = np.random.default_rng(0).random((4, 24, 32)) > 0.5
+    offsets, runs = encode_rle(noisy)
+    assert np.array_equal(decode_rle(offsets, runs, 24, 32), noisy)
+
+@pytest.mark.parametrize("spill", [False, True])
+def test_track_mask_store(tmp_path, spill):
+    masks = make_masks()
+    store = TrackMaskStore(24, 32, spill_dir=str(tmp_path / "masks") if spill else None)
+    store.add(FrameMasks(0, [1, 2, 3], masks))
+    
+    object_ids, decoded = store.get_frame(0)
+    assert object_ids == [1, 2, 3]
+    assert np.array_equal(decoded, masks)
+    assert np.array_equal(store.get_mask(0, 2), masks[1])
+    assert store.get_areas(0).tolist() == [42, 2, 0]
+    assert store.object_track(1) == {0: {"bbox": [3.0, 2.0, 9.0, 7.0], "area": 42}}
+    assert store.object_track(3) == {}
+
+def test_all_tracks_are_built_with_one_read_per_frame(tmp_path, monkeypatch):
+    masks = make_masks()
+    store = TrackMaskStore(24, 32, spill_dir=str(tmp_path / "masks"))
+    for frame_idx in range(4):
+        store.add(FrameMasks(frame_idx, [1, 2, 3], masks))
+    
+    reads = []
+    load = np.load
+    monkeypatch.setattr(np, "load", lambda path: reads.append(path) or load(path))
+    tracks = store.object_tracks([1, 2, 3])
+    
+    assert len(reads) == 4
+    assert tracks[1] == {i: {"bbox": [3.0, 2.0, 9.0, 7.0], "area": 42} for i in range(4)}
+    assert tracks[3] == {}
+    assert store.object_tracks().keys() == {1, 2}
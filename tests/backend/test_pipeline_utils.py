@@ -0,0 +1,22 @@
+import pytest
+
+from app.utils.pipeline_utils import run_pipelined
+
+def test_run_pipelined_preserves_order():
+    assert run_pipelined(iter(range(100)), list, max_queue=4) == list(range(100))
+
+def test_run_pipelined_reraises_producer_error():
+    def producer():
+        yield 1
+        raise RuntimeError("propagation failed")
+    
+    with pytest.raises(RuntimeError, match="propagation failed"):
+        run_pipelined(producer(), list)
+
+def test_run_pipelined_reraises_consumer_error():
+    def consumer(items):
+        for _ in items:
+            raise ValueError("encoder failed")
+    
+    with pytest.raises(ValueError, match="encoder failed"):
+        run_pipelined(iter(range(100)), consumer, max_queue=1)
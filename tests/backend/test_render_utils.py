@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("cv2")
+
+from app.utils.frame_store import InMemoryFrameStore, MmapFrameStore
+from app.utils.mask_store import FrameMasks
+from app.utils.render_utils import MaskRenderer, render_frames
+from app.utils.track_utils import masks_to_boxes
+
+def write_mmap_store(cache_dir, frames):
+    cache_dir.mkdir()
+    np.array(frames, dtype=np.uint8).tofile(cache_dir / MmapFrameStore.DATA_FILENAME)
+    (cache_dir / MmapFrameStore.HEADER_FILENAME).write_text(
+        '{"count": %d, "height": 16, "width": 16, "channels": 3, "fps": 10}' % len(frames)
+    )
+    return MmapFrameStore(str(cache_dir))
+
+def test_label_map_lets_the_last_object_win_overlaps():
+    masks = np.zeros((3, 4, 4), dtype=bool)
+    masks[0, :2, :2] = True
+    masks[1, 1:3, 1:3] = True
+    masks[2, 3, 3] = True
+    
+    label_map = MaskRenderer({}).label_map(masks)
+    
+    assert label_map.dtype == np.uint8
+    assert label_map[0, 0] == 1 and label_map[1, 1] == 2 and label_map[2, 2] == 2
+    assert label_map[3, 3] == 3 and label_map[0, 3] == 0
+
+def test_more_than_255_objects_use_a_uint16_label_map():
+    count = 300
+    masks = np.zeros((count, 1, count), dtype=bool)
+    masks[np.arange(count), 0, np.arange(count)] = True
+    renderer = MaskRenderer({})
+    
+    label_map = renderer.label_map(masks)
+    assert label_map.dtype == np.uint16
+    assert np.array_equal(label_map[0], np.arange(1, count + 1))
+    
+    frame = np.zeros((1, count, 3), dtype=np.uint8)
+    annotated = renderer.render(frame, list(range(1, count + 1)), masks, boxes=np.zeros((count, 4)))
+    # Objects past 255 still get their own color
+    assert annotated[0, 299].any() and not np.array_equal(annotated[0, 299], annotated[0, 43])
+
+def test_masks_to_boxes():
+    masks = np.zeros((3, 6, 8), dtype=bool)
+    masks[0, 1:4, 2:5] = True
+    masks[2, 5, 7] = True
+    
+    boxes = masks_to_boxes(masks)
+    
+    assert boxes.tolist() == [[2, 1, 4, 3], [0, 0, 0, 0], [7, 5, 7, 5]]
+    assert masks_to_boxes(np.zeros((0, 6, 8), dtype=bool)).shape == (0, 4)
+    # Float masks are thresholded at 0.5
+    assert masks_to_boxes(masks[:1].astype(np.float32) * 0.4).tolist() == [[0, 0, 0, 0]]
+
+@pytest.mark.parametrize("backend", ["thread", "process"])
+def test_parallel_render_keeps_frame_order(tmp_path, backend):
+    # Each frame has its own gray level, so output order is visible in the pixels
+    frames = [np.full((16, 16, 3), 10 * i, dtype=np.uint8) for i in range(12)]
+    if backend == "process":
+        store = write_mmap_store(tmp_path / "frames", frames)
+    else:
+        store = InMemoryFrameStore(frames)
+    
+    masks = np.zeros((1, 16, 16), dtype=bool)
+    masks[0, 4:8, 4:8] = True
+    frame_masks = (FrameMasks(frame_idx=i, object_ids=[1], masks=masks) for i in range(12))
+    renderer = MaskRenderer({1: "car"})
+    
+    rendered = list(render_frames(store, frame_masks, renderer, workers=3, backend=backend))
+    
+    assert [frame_idx for frame_idx, _ in rendered] == list(range(12))
+    for frame_idx, annotated in rendered:
+        assert annotated[15, 0, 0] == 10 * frame_idx
+        assert np.array_equal(annotated, renderer.render_frame(store, FrameMasks(frame_idx, [1], masks)))
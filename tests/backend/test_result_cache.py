@@ -0,0 +1,104 @@
+import time
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from fastapi.testclient import TestClient
+
+from app.api import tracking
+from app.main import app
+from app.models.schemas import TaskStatus
+from app.services.result_cache import ResultCache
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeRedis(decode_responses=True)
+
+def test_key_normalizes_prompt_and_tracks_model_version(redis_client, monkeypatch):
+    cache = ResultCache(redis_client)
+    key = cache.make_key("abc", "Person", 0.35, 0.25, "box")
+    
+    assert cache.make_key("abc", " person. ", 0.35, 0.25, "box") == key
+    assert cache.make_key("abc", ["person"], 0.35, 0.25, "box") == key
+    assert cache.make_key("abc", "person", 0.3, 0.25, "box") != key
+    
+    monkeypatch.setattr(cache.config, "MODEL_VERSION", "sam2.1-new")
+    assert cache.make_key("abc", "person", 0.35, 0.25, "box") != key
+
+@pytest.mark.parametrize("setting, value", [
+    ("FRAME_SOURCE", "jpeg"),
+    ("KEYFRAME_INTERVAL", 30),
+    ("KEYFRAME_SCENE_THRESHOLD", 0.4),
+    ("KEYFRAME_IOU_THRESHOLD", 0.7),
+])
+def test_key_tracks_pipeline_settings(redis_client, monkeypatch, setting, value):
+    cache = ResultCache(redis_client)
+    key = cache.make_key("abc", "person", 0.35, 0.25, "box")
+    
+    monkeypatch.setattr(cache.config, setting, value)
+    assert cache.make_key("abc", "person", 0.35, 0.25, "box") != key
+
+def test_least_recently_used_entries_are_evicted(redis_client, monkeypatch):
+    cache = ResultCache(redis_client)
+    monkeypatch.setattr(cache, "max_entries", 2)
+    
+    cache.put("a", "task-a")
+    cache.put("b", "task-b")
+    assert cache.get("a") == "task-a"
+    cache.put("c", "task-c")
+    
+    assert cache.get("b") is None
+    assert cache.get("a") == "task-a"
+    assert cache.get("c") == "task-c"
+
+def test_identical_track_requests_share_a_task(redis_client, monkeypatch, tmp_path):
+    monkeypatch.setattr(tracking.task_store, "redis_client", redis_client)
+    monkeypatch.setattr(tracking.result_cache, "redis_client", redis_client)
+    monkeypatch.setattr(tracking.file_handler, "find_upload", lambda file_id: str(tmp_path / f"{file_id}.mp4"))
+    submitted = []
+    monkeypatch.setattr(tracking, "submit_tracking_job", lambda **kwargs: submitted.append(kwargs))
+    client = TestClient(app)
+    form = {"file_id": "abc", "text_prompt": "car.", "box_threshold": 0.35, "text_threshold": 0.25}
+    
+    first = client.post("/api/track", data=form).json()
+    second = client.post("/api/track", data=form).json()
+    assert second["task_id"] == first["task_id"]
+    assert len(submitted) == 1
+    
+    # A one-element text_prompts list is the same single-prompt job
+    single = {key: value for key, value in form.items() if key != "text_prompt"}
+    assert client.post("/api/track", data={**single, "text_prompts": ["car."]}).json()["task_id"] == first["task_id"]
+    
+    # A failed task is not served from the cache
+    tracking.task_store.update_task_status(first["task_id"], TaskStatus.FAILED, error="boom")
+    third = client.post("/api/track", data=form).json()
+    assert third["task_id"] != first["task_id"]
+    assert len(submitted) == 2
+
+def test_failed_task_drops_its_cache_entry(redis_client, monkeypatch):
+    monkeypatch.setattr(tracking.task_store, "redis_client", redis_client)
+    cache = ResultCache(redis_client)
+    cache.put("key", "task-1")
+    
+    tracking.task_store.update_task_status("task-1", TaskStatus.FAILED, error="boom")
+    
+    assert cache.get("key") is None
+    assert cache.stats()["entries"] == 0
+
+def test_stale_in_flight_task_is_not_reused(redis_client, monkeypatch, tmp_path):
+    monkeypatch.setattr(tracking.task_store, "redis_client", redis_client)
+    monkeypatch.setattr(tracking.result_cache, "redis_client", redis_client)
+    monkeypatch.setattr(tracking.file_handler.config, "RESULT_CACHE_STALE_SECONDS", 60)
+    monkeypatch.setattr(tracking.file_handler, "find_upload", lambda file_id: str(tmp_path / f"{file_id}.mp4"))
+    monkeypatch.setattr(tracking, "submit_tracking_job", lambda **kwargs: None)
+    client = TestClient(app)
+    form = {"file_id": "abc", "text_prompt": "car.", "box_threshold": 0.35, "text_threshold": 0.25}
+    
+    first = client.post("/api/track", data=form).json()
+    assert client.post("/api/track", data=form).json()["task_id"] == first["task_id"]
+    
+    # The worker died without another status update
+    now = time.time()
+    monkeypatch.setattr(tracking.time, "time", lambda: now + 61)
+    assert client.post("/api/track", data=form).json()["task_id"] != first["task_id"]
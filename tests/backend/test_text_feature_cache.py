@@ -0,0 +1,58 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from app.utils.text_feature_cache import GroundingTextCache
+
+VOCAB = {"person": 2158, "dog": 3899, "car": 2482, ".": 1012}
+
+class FakeTextEncoder(torch.nn.Module):
+    """Stands in for Grounding DINO's BertModelWarper"""
+
+    def __init__(self):
+        super().__init__()
+        self.rows = 0
+
+    def forward(self, input_ids, attention_mask):
+        self.rows += input_ids.shape[0]
+        features = input_ids.float()[..., None].repeat(1, 1, 4)
+        return {"last_hidden_state": features * attention_mask[..., None]}
+
+class FakeGroundingModel(torch.nn.Module):
+    """Tokenizes its captions padded to the longest, like Grounding DINO's forward"""
+
+    def __init__(self):
+        super().__init__()
+        self.bert = FakeTextEncoder()
+
+    def forward(self, images, captions):
+        tokens = [[101] + [VOCAB[word] for word in caption.replace(".", " .").split()] + [102] for caption in captions]
+        seq_len = max(len(row) for row in tokens)
+        input_ids = torch.tensor([row + [0] * (seq_len - len(row)) for row in tokens])
+        return self.bert(input_ids=input_ids, attention_mask=input_ids != 0)["last_hidden_state"]
+
+def test_captions_are_cached_per_row_across_batches():
+    model = FakeGroundingModel()
+    cache = GroundingTextCache.attach(model, 1 << 20)
+    reference = FakeGroundingModel()
+
+    with torch.no_grad():
+        model(None, captions=["person."])
+        batch = model(None, captions=["dog car.", "person.", "dog car."])
+
+    # "person." comes from the cache; the repeated caption is encoded once
+    assert model.bert.rows == 2
+    assert torch.equal(batch, reference(None, captions=["dog car.", "person.", "dog car."]))
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["hit_rate"] == pytest.approx(1 / 4)
+    # Attaching again reuses the installed cache instead of wrapping twice
+    assert GroundingTextCache.attach(model, 1 << 20) is cache
+
+def test_training_forward_is_not_cached():
+    model = FakeGroundingModel()
+    GroundingTextCache.attach(model, 1 << 20)
+
+    model(None, captions=["person."])
+    model(None, captions=["person."])
+
+    assert model.bert.rows == 2
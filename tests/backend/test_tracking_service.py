@@ -0,0 +1,169 @@
+import threading
+
+import cv2
+import numpy as np
+import pytest
+import torch
+
+pytest.importorskip("torchvision")
+
+from app.services import tracking_service
+from app.services.tracking_service import TrackingContext, TrackingService
+from app.utils.frame_store import InMemoryFrameStore, MmapFrameStore
+from app.models.schemas import DetectionResult
+from app.utils.mask_store import FrameMasks
+from app.utils.video_utils import get_video_info
+
+class FakeImagePredictor:
+    """Returns one full-frame mask per box for the last image set"""
+    
+    def set_image(self, image):
+        self.image = image
+    
+    def predict(self, box, **kwargs):
+        h, w = self.image.shape[:2]
+        return np.ones((len(box), 1, h, w), dtype=bool), None, None
+
+class FakeVideoPredictor:
+    def add_new_points_or_box(self, inference_state, frame_idx, obj_id, box=None, **kwargs):
+        inference_state["prompts"].append((obj_id, tuple(box)))
+
+def test_concurrent_jobs_keep_their_own_detections(monkeypatch):
+    def fake_predict(model, image, caption, box_threshold, text_threshold):
+        # One centered box per word of the caption
+        count = len(caption.split())
+        return torch.full((count, 4), 0.5), torch.ones(count), caption.split()
+    
+    monkeypatch.setattr(tracking_service, "predict", fake_predict, raising=False)
+    monkeypatch.setattr(TrackingService, "_load_detection_image",
+                        lambda self, store, idx: (store.get_rgb(idx), None))
+    
+    service = TrackingService(load_models=False)
+    service.grounding_model = None
+    service.image_predictor = FakeImagePredictor()
+    service.video_predictor = FakeVideoPredictor()
+    service.config.PROMPT_TYPE_FOR_VIDEO = "box"
+    
+    barrier = threading.Barrier(2)
+    contexts = {}
+    
+    def run(prompt, size):
+        ctx = TrackingContext(task_id=prompt, video_path="", text_prompt=prompt)
+        ctx.frame_store = InMemoryFrameStore([np.zeros((size, size, 3), dtype=np.uint8)])
+        ctx.inference_state = {"prompts": []}
+        service._detect_objects_in_frame(ctx, 0)
+        barrier.wait()
+        service._setup_video_tracking(ctx, 0)
+        contexts[prompt] = ctx
+    
+    threads = [
+        threading.Thread(target=run, args=("car", 20)),
+        threading.Thread(target=run, args=("person dog", 40)),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert contexts["car"].labels == ["car"]
+    assert contexts["car"].masks.shape == (1, 20, 20)
+    assert contexts["car"].inference_state["prompts"] == [(1, (5.0, 5.0, 15.0, 15.0))]
+    assert contexts["person dog"].masks.shape == (2, 40, 40)
+    assert [obj_id for obj_id, _ in contexts["person dog"].inference_state["prompts"]] == [1, 2]
+
+def test_multi_prompt_job_writes_one_video_per_prompt(monkeypatch, tmp_path):
+    def fake_predict(model, image, caption, box_threshold, text_threshold):
+        count = len(caption.split())
+        return torch.full((count, 4), 0.5), torch.ones(count), caption.split()
+    
+    monkeypatch.setattr(tracking_service, "predict", fake_predict, raising=False)
+    monkeypatch.setattr(TrackingService, "_load_detection_image",
+                        lambda self, store, idx: (store.get_rgb(idx), None))
+    service = TrackingService(load_models=False)
+    service.grounding_model = None
+    service.image_predictor = FakeImagePredictor()
+    monkeypatch.setattr(service.file_handler.config, "OUTPUT_FOLDER", str(tmp_path))
+    monkeypatch.setattr(service.config, "RENDER_WORKERS", 1)
+    
+    frames = [np.zeros((32, 32, 3), dtype=np.uint8) for _ in range(4)]
+    ctx = TrackingContext(task_id="multi", video_path="", text_prompt="", text_prompts=["car", "person dog"])
+    ctx.frame_store = InMemoryFrameStore(frames, fps=10)
+    detections = service._detect_objects_in_frame(ctx, 0)
+    
+    assert [(det.object_id, det.prompt_index) for det in detections] == [(1, 0), (2, 1), (3, 1)]
+    
+    frame_masks = [
+        FrameMasks(frame_idx=i, object_ids=[1, 2, 3], masks=np.ones((3, 32, 32), dtype=bool))
+        for i in range(len(frames))
+    ]
+    service._create_annotated_video(ctx, frame_masks)
+    
+    for prompt_index in [None, 0, 1]:
+        path = service.file_handler.get_output_video_path("multi", prompt_index)
+        assert get_video_info(path)["frame_count"] == 4
+
+class FakeKeyframeVideoPredictor:
+    """Tracks every prompted object as a static box; objects can only be added after a reset"""
+    
+    def reset_state(self, inference_state):
+        inference_state["objects"] = {}
+        inference_state["resets"] += 1
+    
+    def add_new_points_or_box(self, inference_state, frame_idx, obj_id, box=None, **kwargs):
+        inference_state["objects"][obj_id] = [int(v) for v in box]
+    
+    def add_new_mask(self, inference_state, frame_idx, obj_id, mask):
+        ys, xs = np.nonzero(mask)
+        inference_state["objects"][obj_id] = [xs.min(), ys.min(), xs.max() + 1, ys.max() + 1]
+    
+    def propagate_in_video(self, inference_state, start_frame_idx=0, max_frame_num_to_track=None):
+        h, w = inference_state["size"]
+        object_ids = sorted(inference_state["objects"])
+        for frame_idx in range(start_frame_idx, start_frame_idx + max_frame_num_to_track + 1):
+            logits = -torch.ones(len(object_ids), 1, h, w)
+            for i, object_id in enumerate(object_ids):
+                x1, y1, x2, y2 = inference_state["objects"][object_id]
+                logits[i, 0, y1:y2, x1:x2] = 1
+            yield frame_idx, object_ids, logits
+
+def test_objects_appearing_on_keyframes_start_new_tracks(monkeypatch):
+    service = TrackingService(load_models=False)
+    service.video_predictor = FakeKeyframeVideoPredictor()
+    monkeypatch.setattr(service.config, "KEYFRAME_IOU_THRESHOLD", 0.5)
+    
+    ctx = TrackingContext(task_id="keyframes", video_path="", text_prompt="car")
+    ctx.frame_store = InMemoryFrameStore([np.zeros((20, 20, 3), dtype=np.uint8) for _ in range(9)])
+    ctx.inference_state = {"size": (20, 20), "objects": {1: [0, 0, 5, 5]}, "resets": 0}
+    ctx.detections = [DetectionResult(object_id=1, label="car", confidence=0.9, bbox=[0, 0, 5, 5])]
+    ctx.keyframe_detections = {
+        # Already tracked: no new track, no reset
+        3: [DetectionResult(object_id=2, label="car", confidence=0.9, bbox=[0, 0, 5, 4], frame_idx=3)],
+        6: [DetectionResult(object_id=3, label="car", confidence=0.8, bbox=[10, 10, 15, 15], frame_idx=6)],
+    }
+    
+    frames = list(service._iter_propagation(ctx))
+    
+    assert [frame.frame_idx for frame in frames] == list(range(9))
+    assert [frame.object_ids for frame in frames] == [[1]] * 6 + [[1, 3]] * 3
+    assert frames[8].masks[1, 12, 12] and not frames[5].masks[:, 12, 12].any()
+    assert ctx.inference_state["resets"] == 1
+    assert [det.object_id for det in ctx.detections] == [1, 3]
+
+def test_mmap_frames_over_the_cache_budget_stay_in_memory(monkeypatch, tmp_path):
+    video_path = str(tmp_path / "clip.mp4")
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*"mp4v"), 10, (32, 32))
+    for _ in range(4):
+        writer.write(np.zeros((32, 32, 3), dtype=np.uint8))
+    writer.release()
+    
+    service = TrackingService(load_models=False)
+    monkeypatch.setattr(service.file_handler.config, "TEMP_FRAMES_DIR", str(tmp_path / "frames"))
+    monkeypatch.setattr(service.config, "FRAME_SOURCE", "mmap")
+    ctx = TrackingContext(task_id="big", video_path=video_path, text_prompt="car")
+    
+    monkeypatch.setattr(service.config, "FRAME_CACHE_MAX_BYTES", 4 * 32 * 32 * 3 - 1)
+    assert isinstance(service._extract_video_frames(ctx), InMemoryFrameStore)
+    assert not (tmp_path / "frames").exists()
+    
+    monkeypatch.setattr(service.config, "FRAME_CACHE_MAX_BYTES", 4 * 32 * 32 * 3)
+    assert isinstance(service._extract_video_frames(ctx), MmapFrameStore)
@@ -0,0 +1,55 @@
+import hashlib
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api import tracking
+from app.main import app
+
+client = TestClient(app)
+
+@pytest.fixture(autouse=True)
+def upload_dirs(tmp_path, monkeypatch):
+    config = tracking.file_handler.config
+    monkeypatch.setattr(config, "UPLOAD_FOLDER", str(tmp_path / "uploads"))
+    monkeypatch.setattr(config, "UPLOAD_SESSIONS_DIR", str(tmp_path / "sessions"))
+    os.makedirs(config.UPLOAD_FOLDER)
+    os.makedirs(config.UPLOAD_SESSIONS_DIR)
+    return tmp_path
+
+def test_resumable_upload_in_any_chunk_order():
+    content = os.urandom(2500)
+    session = client.post("/api/uploads", json={
+        "filename": "clip.mp4", "total_size": len(content), "chunk_size": 1000
+    }).json()
+    upload_id = session["upload_id"]
+    assert session["total_chunks"] == 3
+    
+    for index in [2, 0]:
+        response = client.put(
+            f"/api/uploads/{upload_id}/chunks/{index}",
+            content=content[index * 1000:(index + 1) * 1000]
+        )
+        assert response.status_code == 200
+    
+    status = client.get(f"/api/uploads/{upload_id}").json()
+    assert status["received_chunks"] == [0, 2]
+    assert status["received_bytes"] == 1500
+    assert client.post(f"/api/uploads/{upload_id}/complete").status_code == 409
+    
+    client.put(f"/api/uploads/{upload_id}/chunks/1", content=content[1000:2000])
+    result = client.post(f"/api/uploads/{upload_id}/complete").json()
+    
+    assert result["sha256"] == hashlib.sha256(content).hexdigest()
+    upload_path = os.path.join(tracking.file_handler.config.UPLOAD_FOLDER, f"{result['file_id']}.mp4")
+    assert open(upload_path, "rb").read() == content
+    assert client.get(f"/api/uploads/{upload_id}").status_code == 404
+
+def test_chunk_of_wrong_length_is_rejected():
+    session = client.post("/api/uploads", json={"filename": "clip.mp4", "total_size": 1500, "chunk_size": 1000}).json()
+    
+    response = client.put(f"/api/uploads/{session['upload_id']}/chunks/1", content=b"x" * 501)
+    
+    assert response.status_code == 400
+    assert client.get(f"/api/uploads/{session['upload_id']}").json()["received_chunks"] == []
@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+
+from app.utils.video_utils import VideoWriter, get_video_info, iter_video_frames, save_video_stream
+from app.utils.frame_store import SAM2_IMG_MEAN, SAM2_IMG_STD, JpegFrameStore, MmapFrameStore
+
+def make_frames(count=12, height=48, width=64):
+    for i in range(count):
+        frame = np.zeros((height, width, 3), dtype=np.uint8)
+        frame[:, i * 4:i * 4 + 4] = 255
+        yield frame
+
+def test_save_video_stream_from_generator(tmp_path):
+    output_path = str(tmp_path / "out.mp4")
+    assert save_video_stream(make_frames(), output_path, fps=10) == 12
+    
+    info = get_video_info(output_path)
+    assert info["frame_count"] == 12
+    assert (info["width"], info["height"]) == (64, 48)
+
+def test_video_writer_rejects_mismatched_frame_size(tmp_path):
+    with VideoWriter(str(tmp_path / "out.mp4")) as writer:
+        writer.write(np.zeros((48, 64, 3), dtype=np.uint8))
+        with pytest.raises(ValueError):
+            writer.write(np.zeros((32, 32, 3), dtype=np.uint8))
+
+def test_mmap_frame_store_is_reused(tmp_path):
+    video_path = str(tmp_path / "in.mp4")
+    save_video_stream(make_frames(), video_path, fps=10)
+    
+    store = MmapFrameStore.from_video(video_path, str(tmp_path / "cache"))
+    assert len(store) == len(list(iter_video_frames(video_path)))
+    assert (store.height, store.width) == (48, 64)
+    
+    # A complete cache is reopened without touching the video again
+    reopened = MmapFrameStore.from_video(str(tmp_path / "missing.mp4"), str(tmp_path / "cache"))
+    assert np.array_equal(reopened[5], store[5])
+
+def test_mmap_frame_store_feeds_sam2_one_frame_at_a_time(tmp_path):
+    torch = pytest.importorskip("torch")
+    video_path = str(tmp_path / "in.mp4")
+    save_video_stream(make_frames(), video_path, fps=10)
+    store = MmapFrameStore.from_video(video_path, str(tmp_path / "cache"))
+    
+    images = store.sam2_images(image_size=32)
+    assert not isinstance(images, torch.Tensor)
+    assert len(images) == 12
+    
+    # Same preprocessing as SAM2's loader, for the requested frame only
+    rgb = cv2.cvtColor(cv2.resize(store[7], (32, 32), interpolation=cv2.INTER_CUBIC), cv2.COLOR_BGR2RGB)
+    expected = (rgb / 255.0 - np.array(SAM2_IMG_MEAN)) / np.array(SAM2_IMG_STD)
+    assert images[7].shape == (3, 32, 32)
+    assert np.allclose(images[7].permute(1, 2, 0).numpy(), expected, atol=1e-5)
+
+def test_jpeg_frame_store_is_built_once(tmp_path):
+    video_path = str(tmp_path / "in.mp4")
+    save_video_stream(make_frames(), video_path, fps=10)
+    
+    store = JpegFrameStore.from_video(video_path, str(tmp_path / "cache" / "jpeg"))
+    assert len(store) == 12
+    assert os.listdir(tmp_path / "cache") == ["jpeg"]
+    
+    reopened = JpegFrameStore.from_video(str(tmp_path / "missing.mp4"), str(tmp_path / "cache" / "jpeg"))
+    assert reopened.frame_names == store.frame_names
@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+
+pytest.importorskip("celery")
+
+from celery.contrib.testing.worker import start_worker
+
+from app import worker
+from app.services import tracking_service
+
+def test_process_video_runs_on_worker_service(monkeypatch):
+    calls = []
+    
+    class RecordingService:
+        def start_tracking(self, **kwargs):
+            calls.append(kwargs)
+    
+    monkeypatch.setattr(worker, "_tracking_service", RecordingService())
+    monkeypatch.setattr(worker.celery_app.conf, "task_always_eager", True)
+    
+    worker.process_video.delay(task_id="task-1", video_path="uploads/video.mp4", text_prompt="person.")
+    
+    assert calls == [{
+        "task_id": "task-1",
+        "video_path": "uploads/video.mp4",
+        "text_prompt": "person.",
+        "box_threshold": 0.35,
+        "text_threshold": 0.25,
+        "text_prompts": None
+    }]
+
+def test_jobs_go_through_the_broker_to_a_worker_that_loaded_models_at_start(monkeypatch):
+    done = threading.Event()
+    events = []
+    
+    class RecordingService:
+        def __init__(self):
+            events.append("load_models")
+        
+        def start_tracking(self, **kwargs):
+            events.append(kwargs)
+            done.set()
+    
+    monkeypatch.setattr(tracking_service, "TrackingService", RecordingService)
+    monkeypatch.setattr(worker, "_tracking_service", None)
+    monkeypatch.setattr(worker.celery_app.conf, "task_always_eager", False)
+    for setting in ["broker_url", "broker_read_url", "broker_write_url"]:
+        monkeypatch.setattr(worker.celery_app.conf, setting, "memory://")
+    # Connection pools are bound to the broker URL on first use
+    monkeypatch.setattr(worker.celery_app, "_pool", None)
+    monkeypatch.setattr(worker.celery_app.amqp, "_producer_pool", None)
+    
+    with start_worker(worker.celery_app, pool="solo", perform_ping_check=False, shutdown_timeout=10):
+        # worker_process_init loaded the models before any job arrived
+        assert events == ["load_models"]
+        worker.process_video.delay(task_id="task-1", video_path="uploads/video.mp4",
+                                   text_prompts=["car", "person"])
+        assert done.wait(10)
+    
+    assert events == ["load_models", {
+        "task_id": "task-1",
+        "video_path": "uploads/video.mp4",
+        "text_prompt": None,
+        "box_threshold": 0.35,
+        "text_threshold": 0.25,
+        "text_prompts": ["car", "person"]
+    }]